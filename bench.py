@@ -0,0 +1,352 @@
+"""
+בנצ'מרק למטפלים של bot.py – מריץ את המטפלים האמיתיים מול Bot מדומה בתוך התהליך.
+
+שימוש:
+    python bench.py                                   # 100,1000,10000 חברים
+    python bench.py --sizes 100,1000,10000,100000 --storage sqlite
+    python bench.py --output results.json
+    python bench.py --compare old.json --output new.json
+
+לכל גודל נוצר מאגר סינתטי בתיקייה זמנית ומורץ תהליך נפרד (זיכרון נקי).
+הפלט (JSON): אחוזוני זמן לכל מטפל, זמן I/O של האחסון, זמן עלייה וזיכרון –
+כדי להשוות בין קומיטים.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ADMIN_ID = 1
+GROUP_ID = -1001
+FIRST_MEMBER_UID = 10_000_000
+FIRST_APPLICANT_UID = 50_000_000
+
+LASTNAMES = ["חלבי", "עזאם", "חסון", "קבלאן", "טרבייה", "נסר א-דין", "אבו ריש", "מנסור",
+             "פרג'", "שמס", "חמדאן", "זהר א-דין", "סעב", "עטילה", "בדר", "סלאמה"]
+VILLAGES  = ["דלית אל-כרמל", "עספיא", "ירכא", "בית ג'ן", "מגדל שמס", "חורפיש", "פקיעין", "ג'ולס"]
+UNITS     = ["גולני", "גבעתי", "הנדסה", "חרב", "מג\"ב", "שריון", "תותחנים", "מודיעין"]
+RANKS     = ["טוראי", "רב\"ט", "סמל", "סמ\"ר", "רס\"ל", "סגן", "סרן", "רס\"ן"]
+
+# ── מאגר סינתטי ─────────────────────────────────────────
+
+def synthetic_data(size, rng):
+    members = {}
+    for i in range(size):
+        members[str(FIRST_MEMBER_UID + i)] = {
+            "number": i + 1,
+            "lastname": rng.choice(LASTNAMES),
+            "village": rng.choice(VILLAGES),
+            "unit": rng.choice(UNITS),
+            "rank": rng.choice(RANKS),
+            "warnings": 0,
+            "joined": datetime(2024, 1, 1).isoformat(),
+        }
+    pending = {}
+    for i in range(max(1, size // 100)):
+        uid = FIRST_APPLICANT_UID - 1 - i
+        pending[str(uid)] = {
+            "user_id": uid, "username": f"p{i}", "timestamp": datetime(2024, 1, 1).isoformat(),
+            "answers": {"lastname": rng.choice(LASTNAMES), "village": rng.choice(VILLAGES),
+                        "unit": rng.choice(UNITS), "rank": rng.choice(RANKS),
+                        "history": "-", "photo_id": f"photo{i}"},
+        }
+    return {"members": members, "pending": pending, "counter": size, "cooldowns": {}, "unreachable": {}}
+
+# ── עדכונים סינתטיים ────────────────────────────────────
+
+class Updates:
+    def __init__(self):
+        self.update_id = 0
+        self.message_id = 0
+
+    def _user(self, uid):
+        return {"id": uid, "is_bot": False, "first_name": f"u{uid}", "username": f"u{uid}"}
+
+    def _next(self):
+        self.update_id += 1
+        self.message_id += 1
+        return self.update_id, self.message_id
+
+    def message(self, uid, text=None, photo=None, chat=None):
+        update_id, message_id = self._next()
+        msg = {
+            "message_id": message_id, "date": int(time.time()),
+            "chat": chat or {"id": uid, "type": "private"},
+            "from": self._user(uid),
+        }
+        if text is not None:
+            msg["text"] = text
+            if text.startswith("/"):
+                msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if photo is not None:
+            msg["photo"] = [{"file_id": photo, "file_unique_id": photo, "width": 800, "height": 600}]
+        return {"update_id": update_id, "message": msg}
+
+    def callback(self, uid, data):
+        update_id, message_id = self._next()
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "chat_instance": "bench", "data": data, "from": self._user(uid),
+            "message": {"message_id": message_id, "date": int(time.time()),
+                        "chat": {"id": uid, "type": "private"}, "text": "menu"},
+        }}
+
+    def join(self, uid):
+        update_id, message_id = self._next()
+        return {"update_id": update_id, "message": {
+            "message_id": message_id, "date": int(time.time()),
+            "chat": {"id": GROUP_ID, "type": "supergroup", "title": "bench"},
+            "from": self._user(uid), "new_chat_members": [self._user(uid)],
+        }}
+
+# ── מדידה ───────────────────────────────────────────────
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    s = sorted(samples)
+
+    def pct(p):
+        return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+    return {
+        "count": len(s),
+        "mean_ms": round(sum(s) / len(s) * 1000, 3),
+        "p50_ms": round(pct(50) * 1000, 3),
+        "p90_ms": round(pct(90) * 1000, 3),
+        "p99_ms": round(pct(99) * 1000, 3),
+        "max_ms": round(s[-1] * 1000, 3),
+    }
+
+class IOTimer:
+    """עוטף פונקציות אחסון וסופר את הזמן שבילו בהן"""
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+
+    def wrap(self, owner, name, label):
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.seconds[label] = self.seconds.get(label, 0.0) + time.perf_counter() - started
+                self.calls[label] = self.calls.get(label, 0) + 1
+        setattr(owner, name, timed)
+
+    def report(self):
+        return {label: {"calls": self.calls[label], "total_ms": round(self.seconds[label] * 1000, 3)}
+                for label in sorted(self.seconds)}
+
+def rss_mb():
+    # ru_maxrss: KB בלינוקס, בתים ב-macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# ── תהליך עבודה לגודל אחד ──────────────────────────────
+
+async def run_size(size, iterations, notify_iterations, seed):
+    import bot
+    from telegram import Update
+    from telegram.ext import ExtBot
+
+    class FakeBot(ExtBot):
+        """Bot שלא יוצא לרשת: כל קריאת API מחזירה תשובה מוכנה"""
+
+        calls = {}
+
+        async def _do_post(self, endpoint, data, **kwargs):
+            FakeBot.calls[endpoint] = FakeBot.calls.get(endpoint, 0) + 1
+            if endpoint == "getMe":
+                return {"id": 999, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+            if endpoint in ("sendMessage", "sendPhoto", "sendVideo", "editMessageText", "copyMessage"):
+                chat_id = data.get("chat_id", 0)
+                return {"message_id": random.randint(1, 1 << 30), "date": int(time.time()),
+                        "chat": {"id": chat_id, "type": "private" if int(chat_id) > 0 else "supergroup"},
+                        "text": str(data.get("text", ""))}
+            if endpoint == "createChatInviteLink":
+                return {"invite_link": "https://t.me/+bench", "creator": {"id": 999, "is_bot": True, "first_name": "Bench"},
+                        "creates_join_request": False, "is_primary": False, "is_revoked": False}
+            return True
+
+    io = IOTimer()
+    io.wrap(bot.JsonStore, "_write", "json_write")
+    io.wrap(bot.JsonStore, "_snapshot", "json_serialize")
+    io.wrap(bot.SqliteStore, "_exec", "sqlite_exec")
+    io.wrap(bot.EventLog, "append", "event_append")
+    io.wrap(bot.EventLog, "snapshot", "event_snapshot")
+    io.wrap(bot.RejectedArchive, "extend", "archive_write")   # append עובר דרך extend
+    io.wrap(bot.Outbox, "enqueue", "outbox_enqueue")
+
+    rng = random.Random(seed)
+    app = bot.build_application(FakeBot("123:bench"))
+    started = time.perf_counter()
+    await app.initialize()
+    await bot.post_init(app)
+    startup = time.perf_counter() - started
+    rss_loaded = rss_mb()
+
+    updates = Updates()
+    latency = {}
+
+    async def drive(name, payload):
+        update = Update.de_json(payload, app.bot)
+        t0 = time.perf_counter()
+        await app.process_update(update)
+        latency.setdefault(name, []).append(time.perf_counter() - t0)
+
+    async def drain(name, before):
+        """המתנה למשימות הרקע שהמטפל יצר (ההפצה עצמה) ומדידתן כשלב נפרד"""
+        tasks = asyncio.all_tasks() - before
+        t0 = time.perf_counter()
+        await asyncio.gather(*tasks)
+        latency.setdefault(name, []).append(time.perf_counter() - t0)
+
+    for i in range(iterations):
+        uid = FIRST_APPLICANT_UID + i
+        await drive("start", updates.message(uid, "/start"))
+        await drive("menu_handler", updates.callback(uid, "menu_questionnaire"))
+        await drive("q_lastname", updates.message(uid, rng.choice(LASTNAMES)))
+        await drive("q_village", updates.message(uid, rng.choice(VILLAGES)))
+        await drive("q_photo", updates.message(uid, photo=f"bench{uid}"))
+        await drive("q_unit", updates.message(uid, rng.choice(UNITS)))
+        await drive("q_rank", updates.message(uid, rng.choice(RANKS)))
+        await drive("q_history", updates.message(uid, "-"))
+        decision = "approve" if i % 2 == 0 else "reject"
+        await drive("admin_decision", updates.callback(ADMIN_ID, f"{decision}_{uid}"))
+
+        target = FIRST_MEMBER_UID + rng.randrange(size)
+        target_member = bot.STORE.members.by_uid(target)
+        if target_member:
+            await drive("admin_start", updates.message(ADMIN_ID, "/start"))
+            await drive("admin_menu", updates.callback(ADMIN_ID, "menu_warn"))
+            await drive("admin_warn_num", updates.message(ADMIN_ID, str(target_member["number"]).zfill(3)))
+
+        member = FIRST_MEMBER_UID + rng.randrange(size)
+        await drive("new_member_joined", updates.join(member))
+
+    for _ in range(notify_iterations):
+        await drive("admin_start", updates.message(ADMIN_ID, "/start"))
+        await drive("admin_menu", updates.callback(ADMIN_ID, "menu_notify"))
+        before = asyncio.all_tasks()
+        await drive("admin_notify_msg", updates.message(ADMIN_ID, "הודעת בדיקה"))
+        await drain("admin_notify_fanout", before)
+
+    # משימות רקע שנשארו (לולאות כתיבה/טיימרים) לא נכללות בזמנים
+    for task in asyncio.all_tasks() - {asyncio.current_task()}:
+        task.cancel()
+    bot.STORE.flush_sync()
+
+    return {
+        "size": size,
+        "startup_ms": round(startup * 1000, 3),
+        "handlers": {name: percentiles(samples) for name, samples in latency.items()},
+        "storage_io": io.report(),
+        "api_calls": dict(sorted(FakeBot.calls.items())),
+        "memory": {"rss_after_load_mb": rss_loaded, "peak_rss_mb": rss_mb()},
+    }
+
+def worker(args):
+    os.chdir(args.workdir)
+    sys.path.insert(0, HERE)
+    rng = random.Random(args.seed)
+    with open("data.json", "w", encoding="utf-8") as f:
+        json.dump(synthetic_data(args.size, rng), f, ensure_ascii=False)
+    result = asyncio.run(run_size(args.size, args.iterations, args.notify_iterations, args.seed))
+    print(json.dumps(result, ensure_ascii=False))
+    os._exit(0)   # בלי המתנה למשימות הרקע שבוטלו
+
+# ── תהליך ראשי ──────────────────────────────────────────
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_all(args):
+    results = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+            env = dict(os.environ,
+                       BOT_TOKEN="123:bench", ADMIN_ID=str(ADMIN_ID), GROUP_ID=str(GROUP_ID),
+                       STORAGE=args.storage, BROADCAST_RATE="1000000")
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", "--size", str(size),
+                   "--workdir", workdir, "--iterations", str(args.iterations),
+                   "--notify-iterations", str(args.notify_iterations), "--seed", str(args.seed)]
+            print(f"size {size}...", file=sys.stderr)
+            proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                sys.stderr.write(proc.stderr)
+                sys.exit(f"benchmark for size {size} failed")
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "storage": args.storage,
+        "iterations": args.iterations,
+        "results": results,
+    }
+
+def compare(old, new):
+    """השוואת p50/p99 לכל מטפל מול ריצה קודמת (ל-stderr, כדי ש-stdout יישאר JSON)"""
+    old_by_size = {r["size"]: r for r in old["results"]}
+    for run in new["results"]:
+        base = old_by_size.get(run["size"])
+        if base is None:
+            continue
+        print(f"\nsize {run['size']} ({old.get('commit')} → {new.get('commit')})", file=sys.stderr)
+        for name, stats in sorted(run["handlers"].items()):
+            before = base["handlers"].get(name)
+            if not before or not before.get("count"):
+                continue
+            for key in ("p50_ms", "p99_ms"):
+                ratio = stats[key] / before[key] if before[key] else float("inf")
+                flag = "  <-- slower" if ratio > 1.2 else ""
+                print(f"  {name:18} {key}: {before[key]:9.3f} → {stats[key]:9.3f} ({ratio:4.2f}x){flag}",
+                      file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק למטפלים של הבוט")
+    parser.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[100, 1000, 10000])
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--iterations", type=int, default=200, help="משתמשים חדשים לכל גודל")
+    parser.add_argument("--notify-iterations", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="קובץ JSON לתוצאות (ברירת מחדל: stdout)")
+    parser.add_argument("--compare", help="קובץ תוצאות קודם להשוואה")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    report = run_all(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,46 @@
 import logging
 import asyncio
+import contextvars
+import heapq
+import hmac
+import io
+import itertools
 import json
+import math
 import os
+import re
+import secrets
+import signal
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from urllib.parse import urlparse
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.request import BaseRequest, HTTPXRequest
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler, CallbackQueryHandler,
-    filters, ContextTypes, ConversationHandler
+    Application, ApplicationHandlerStop, BasePersistence, BaseRateLimiter, BaseUpdateProcessor, CommandHandler, MessageHandler,
+    CallbackQueryHandler, PersistenceInput, TypeHandler, filters, ContextTypes, ConversationHandler
 )
+try:
+    from PIL import Image   # בלעדיו תעודות חוזרות מזוהות רק לפי file_unique_id
+except ImportError:
+    Image = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # ── הגדרות ──────────────────────────────────────────────
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
-ADMIN_ID   = int(os.environ.get("ADMIN_ID", "0"))   # מזהה טלגרם של המנהל
-GROUP_ID   = int(os.environ.get("GROUP_ID",  "0"))   # מזהה הקבוצה
+ADMIN_ID   = int(os.environ.get("ADMIN_ID", "0"))   # מזהה טלגרם של המנהל (קבוצה יחידה)
+GROUP_ID   = int(os.environ.get("GROUP_ID",  "0"))   # מזהה הקבוצה (קבוצה יחידה)
+# כתובת ה-Bot API (להפניה לשרת מקומי/מדומה, למשל http://127.0.0.1:8081/bot)
+BOT_API_URL = os.environ.get("BOT_API_URL", "https://api.telegram.org/bot")
 
 DATA_FILE = "data.json"
 
@@ -40,6 +65,19 @@ ADMIN_DM_TARGET, ADMIN_DM_MSG = 34, 35
 ANON_MSG = 40
 CONFESSION_MSG = 41
 
+# שמות השלבים (למדדים)
+STATE_NAMES = {
+    MENU: "menu",
+    Q_LASTNAME: "q_lastname", Q_VILLAGE: "q_village", Q_PHOTO: "q_photo",
+    Q_UNIT: "q_unit", Q_RANK: "q_rank", Q_HISTORY: "q_history",
+    REPORT_MEMBER_NUM: "report_member_num", REPORT_REASON: "report_reason",
+    CONTACT_MSG: "contact_msg",
+    ADMIN_WARN_NUM: "admin_warn_num", ADMIN_BLOCK_NUM: "admin_block_num",
+    ADMIN_BROADCAST_MSG: "admin_broadcast_msg", ADMIN_NOTIFY_MSG: "admin_notify_msg",
+    ADMIN_DM_TARGET: "admin_dm_target", ADMIN_DM_MSG: "admin_dm_msg",
+    ANON_MSG: "anon_msg", CONFESSION_MSG: "confession_msg",
+}
+
 WELCOME_MSG = """
 ברוך הבא לקבוצת החיילים הדרוזים 🫡
 
@@ -76,27 +114,2074 @@ RULES_VIOLATION_MSG = """
 {"פעם הבאה תוצא מהקבוצה." if warn == 1 else ""}
 """
 
+# ── אינדקס חברים ─────────────────────────────────────────
+
+def normalize_member_number(number_str):
+    """'#001' / '001' / ' 1 ' → 1, קלט לא מספרי → None"""
+    number_str = str(number_str).strip().lstrip("#").strip()
+    return int(number_str) if number_str.isdigit() else None
+
+def _lastname_key(lastname):
+    return " ".join(str(lastname or "").split()).casefold()
+
+class MemberRegistry:
+    """אינדקסים בזיכרון על data["members"]: לפי מספר, לפי uid ולפי שם משפחה"""
+
+    def __init__(self):
+        self.members = {}
+        self._by_number = {}      # מספר → uid
+        self._by_lastname = {}    # שם משפחה → {uid}
+        self._keys = {}           # uid → (מספר, שם משפחה) לעדכון אינקרמנטלי
+        self.version = 0          # עולה בכל שינוי – לפסילת מטמונים
+
+    def rebuild(self, members):
+        self.version += 1
+        self.members = members
+        self._by_number.clear()
+        self._by_lastname.clear()
+        self._keys.clear()
+        for uid, member in members.items():
+            self.add(uid, member)
+
+    def add(self, uid, member):
+        uid = str(uid)
+        self.remove(uid)
+        self.version += 1
+        number = normalize_member_number(member["number"])
+        name = _lastname_key(member.get("lastname"))
+        self._by_number[number] = uid
+        self._by_lastname.setdefault(name, set()).add(uid)
+        self._keys[uid] = (number, name)
+
+    def remove(self, uid):
+        keys = self._keys.pop(str(uid), None)
+        if keys is None:
+            return
+        self.version += 1
+        number, name = keys
+        if self._by_number.get(number) == str(uid):
+            del self._by_number[number]
+        uids = self._by_lastname.get(name)
+        if uids is not None:
+            uids.discard(str(uid))
+            if not uids:
+                del self._by_lastname[name]
+
+    def by_number(self, number_str):
+        """מחזיר (uid, member_dict) או (None, None)"""
+        uid = self._by_number.get(normalize_member_number(number_str))
+        if uid is None or uid not in self.members:
+            return None, None
+        return int(uid), self.members[uid]
+
+    def by_uid(self, uid):
+        return self.members.get(str(uid))
+
+    def by_lastname(self, lastname):
+        """רשימת (uid, member_dict) עם שם המשפחה הנתון"""
+        uids = self._by_lastname.get(_lastname_key(lastname), ())
+        return [(int(uid), self.members[uid]) for uid in uids]
+
+    def __len__(self):
+        return len(self.members)
+
+# ── אינדקס cooldowns ─────────────────────────────────────
+# זמני התפוגה נשמרים כמספר (epoch) – בדיקה ב-O(1) בלי fromisoformat, וערימה
+# לפי זמן תפוגה מאפשרת לניקוי התקופתי לשלוף רק את מה שפג.
+
+def cooldown_epoch(value):
+    """ערך cooldown (מספר או ISO ישן) → epoch"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+class CooldownIndex:
+    """data["cooldowns"] (uid → epoch) + ערימת מינימום לפי תפוגה"""
+
+    def __init__(self):
+        self.until = {}
+        self._heap = []    # (epoch, uid) – רשומות ישנות מדולגות בשליפה
+
+    def rebuild(self, cooldowns):
+        for uid, value in cooldowns.items():
+            cooldowns[uid] = cooldown_epoch(value)
+        self.until = cooldowns
+        self._heap = [(until, uid) for uid, until in cooldowns.items()]
+        heapq.heapify(self._heap)
+
+    def add(self, uid, until):
+        heapq.heappush(self._heap, (until, str(uid)))
+
+    def remaining(self, uid, now=None):
+        """שניות עד סוף ההמתנה (0 אם אין)"""
+        until = self.until.get(str(uid))
+        if until is None:
+            return 0
+        return max(0.0, until - (now or time.time()))
+
+    def expired(self, now=None):
+        """uid-ים שתוקפם פג (לפי סדר תפוגה)"""
+        now = now or time.time()
+        result = []
+        while self._heap and self._heap[0][0] <= now:
+            until, uid = heapq.heappop(self._heap)
+            if self.until.get(uid) == until:
+                result.append(uid)
+        return result
+
+    def __len__(self):
+        return len(self.until)
+
+# ── ארכיון נדחים ─────────────────────────────────────────
+# בקשות שנדחו לא נשמרות במצב החי: כל דחייה היא שורת JSON שנוספת לסוף מקטע
+# (rejected-YYYYMM-NNN.jsonl). מקטע חדש נפתח בתחילת חודש או כשהנוכחי עובר
+# ARCHIVE_SEGMENT_MB. האינדקס (index.tsv) הוא גם append-only:
+#   user_id <TAB> מקטע <TAB> offset <TAB> אורך
+# כך שחיפוש לפי משתמש הוא seek+read ישיר, בלי לסרוק את הארכיון.
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "rejected")
+ARCHIVE_SEGMENT_BYTES = int(float(os.environ.get("ARCHIVE_SEGMENT_MB", "5")) * 1024 * 1024)
+
+class RejectedArchive:
+    """ארכיון append-only של בקשות שנדחו, עם אינדקס לפי user_id"""
+
+    INDEX_FILE = "index.tsv"
+
+    def __init__(self, directory, segment_bytes=ARCHIVE_SEGMENT_BYTES):
+        self.dir = directory
+        self.segment_bytes = segment_bytes
+        self.index = {}        # uid → [(מקטע, offset, אורך)]
+        self._segment = None   # המקטע שאליו כותבים כרגע
+        self._size = 0         # גודלו
+        self._lock = threading.Lock()
+        self._opened = False
+
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _segments(self):
+        return sorted(n for n in os.listdir(self.dir) if n.startswith("rejected-") and n.endswith(".jsonl"))
+
+    def _open(self):
+        if self._opened:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        indexed_end = {}
+        if os.path.exists(self._path(self.INDEX_FILE)):
+            self._trim_partial_line(self._path(self.INDEX_FILE))
+            with open(self._path(self.INDEX_FILE), "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 4:
+                        continue   # שורה פגומה
+                    uid, segment, offset, length = int(parts[0]), parts[1], int(parts[2]), int(parts[3])
+                    self.index.setdefault(uid, []).append((segment, offset, length))
+                    indexed_end[segment] = max(indexed_end.get(segment, 0), offset + length)
+        segments = self._segments()
+        # שורות אינדקס שנקטעו יכולות להיות של מקטע קודם (הוספה שחצתה מקטעים)
+        for segment in segments:
+            if os.path.getsize(self._path(segment)) > indexed_end.get(segment, 0):
+                self._recover_tail(segment, indexed_end.get(segment, 0))
+        if segments:
+            self._segment = segments[-1]
+            self._size = os.path.getsize(self._path(self._segment))
+        self._opened = True
+
+    @staticmethod
+    def _trim_partial_line(path):
+        """קריסה באמצע כתיבת האינדקס: קיצוץ שורה אחרונה בלי \n, כדי שהכתיבה הבאה
+        לא תידבק אליה (הרשומות שלה נכנסות שוב לאינדקס ב-_recover_tail)"""
+        with open(path, "rb+") as f:
+            end = pos = f.seek(0, os.SEEK_END)
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                if pos == end and chunk.endswith(b"\n"):
+                    return
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    pos -= step - newline - 1
+                    break
+                pos -= step
+            if pos != end:
+                f.truncate(pos)
+                logger.warning(f"Archive: truncated partial index line at {pos}")
+
+    def _recover_tail(self, segment, start):
+        """קריסה בין כתיבת הרשומה לכתיבת האינדקס: השלמת האינדקס / קיצוץ שורה חלקית"""
+        path = self._path(segment)
+        entries = []
+        with open(path, "rb+") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    f.truncate(offset)
+                    logger.warning(f"Archive: truncated partial record in {segment} at {offset}")
+                    break
+                entries.append((int(json.loads(line)["user_id"]), segment, offset, len(line)))
+                offset += len(line)
+        self._index(entries)
+
+    def _index(self, entries):
+        if not entries:
+            return
+        with open(self._path(self.INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write("".join(f"{uid}\t{segment}\t{offset}\t{length}\n" for uid, segment, offset, length in entries))
+        for uid, segment, offset, length in entries:
+            self.index.setdefault(uid, []).append((segment, offset, length))
+
+    def _segment_for(self, size):
+        """המקטע הנוכחי, או מקטע חדש אם התחלף החודש / הנוכחי מלא"""
+        month = datetime.now().strftime("%Y%m")
+        current = self._segment
+        if current and current.startswith(f"rejected-{month}-"):
+            if self._size + size <= self.segment_bytes:
+                return current
+            seq = int(current[len("rejected-YYYYMM-"):-len(".jsonl")]) + 1
+        else:
+            seq = 1
+        self._segment = f"rejected-{month}-{seq:03d}.jsonl"
+        self._size = 0
+        return self._segment
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        """הוספת רשומות – fsync אחד לכל מקטע וכתיבה אחת לאינדקס"""
+        with self._lock:
+            self._open()
+            entries = []
+            f = None
+            try:
+                for record in records:
+                    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                    segment = self._segment_for(len(line))
+                    if f is None or f.name != self._path(segment):
+                        if f is not None:
+                            self._close_synced(f)
+                        f = open(self._path(segment), "ab")
+                    entries.append((int(record["user_id"]), segment, self._size, len(line)))
+                    f.write(line)
+                    self._size += len(line)
+            finally:
+                if f is not None:
+                    self._close_synced(f)
+            self._index(entries)
+
+    def extend_missing(self, records):
+        """הוספת רשומות שעוד אינן בארכיון (לפי user_id + rejected_at) – להעברה
+        מאחסון ישן, כך שהעברה שנקטעה ומורצת שוב לא משכפלת רשומות"""
+        archived = {}
+        fresh = []
+        for record in records:
+            uid = int(record["user_id"])
+            if uid not in archived:
+                archived[uid] = {r.get("rejected_at") for r in self.lookup(uid)}
+            if record.get("rejected_at") not in archived[uid]:
+                fresh.append(record)
+        self.extend(fresh)
+        return len(fresh)
+
+    @staticmethod
+    def _close_synced(f):
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+
+    def lookup(self, uid):
+        """כל הדחיות של משתמש, מהישנה לחדשה"""
+        with self._lock:
+            self._open()
+            entries = list(self.index.get(int(uid), []))
+        records = []
+        for segment, offset, length in entries:
+            with open(self._path(segment), "rb") as f:
+                f.seek(offset)
+                records.append(json.loads(f.read(length)))
+        return records
+
 # ── ניהול נתונים ─────────────────────────────────────────
+# המצב החי נטען לזיכרון פעם אחת בעלייה (STORE.data) והמטפלים קוראים ממנו ישירות.
+# שינויים עוברים דרך פעולות ברמת רשומה (put_member, delete_pending...) כך שכל
+# מימוש אחסון כותב רק את מה שהשתנה:
+#   json   – מסמן "מלוכלך", ומשימת רקע כותבת את הקובץ (קובץ זמני + rename)
+#   sqlite – כל פעולה היא כתיבה של שורה בודדת (WAL)
+
+STORAGE    = os.environ.get("STORAGE", "json")               # json / sqlite
+DB_FILE    = os.environ.get("DB_FILE", "data.db")
+FLUSH_DELAY = float(os.environ.get("FLUSH_DELAY", "2"))   # שניות לאיחוד כתיבות
+
+def _empty_data():
+    return {"members": {}, "pending": {}, "counter": 0, "cooldowns": {}, "unreachable": {},
+            "event_seq": 0}
+
+class Storage:
+    """ממשק אחסון: המצב בזיכרון + שינויים ברמת רשומה"""
+
+    def __init__(self, path, archive):
+        self.path = path
+        self.archive = archive   # RejectedArchive של הקבוצה
+        self.data = None
+        self.members = MemberRegistry()
+        self.cooldowns = CooldownIndex()
+        self.events = None   # EventLog – מחובר אחרי השחזור בעלייה
+        self._event = None   # (טבלה, מפתח) שהשתנו באירוע הנוכחי
+        self._rejected = []  # דחיות שייכתבו לארכיון בסיום האירוע
+
+    def load(self):
+        raise NotImplementedError
+
+    def _loaded(self, data):
+        self.data = data
+        self.members.rebuild(data["members"])
+        self.cooldowns.rebuild(data["cooldowns"])
+        return data
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @contextmanager
+    def transaction(self):
+        """קיבוץ כמה שינויים לכתיבה אחת"""
+        yield
+
+    def save_all(self):
+        """כתיבה מלאה של המצב (אחרי שחזור מהיומן)"""
+        raise NotImplementedError
+
+    def flush_sync(self):
+        """כתיבה מיידית של שינויים שממתינים (רק באחסון עם כתיבה מושהית)"""
+
+    def quarantine(self):
+        """קובץ פגום מועבר הצידה (לבדיקה ידנית) כדי שייווצר חדש"""
+        self.data = None
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.replace(self.path + suffix, f"{self.path}{suffix}.corrupt")
+
+    @contextmanager
+    def event(self, kind, **info):
+        """פעולה אחת: כל השינויים בתוכה נרשמים כאירוע יחיד ביומן ובטרנזקציה אחת"""
+        outer = self._event is None
+        if outer:
+            self._event = {}
+        try:
+            with self.transaction():
+                yield
+                if outer:
+                    self._commit_event(kind, info)
+            if outer and self._rejected:
+                self.archive.extend(self._rejected)
+        finally:
+            if outer:
+                self._event = None
+                self._rejected = []
+
+    def _commit_event(self, kind, info):
+        if self.events is None or not self._event:
+            return
+        changes = [
+            [table, key, self.data[table] if key is None else self.data[table].get(key)]
+            for table, key in self._event
+        ]
+        self.data["event_seq"] = self.events.append(kind, info, changes)
+        self._changed("event_seq", None)
+        if self.events.snapshot_due():
+            self.events.snapshot(self.data)
+
+    def _mark(self, table, key):
+        """שינוי מחוץ לאירוע מפורש נרשם כאירוע משלו"""
+        if self._event is None:
+            with self.event(f"{table}_changed"):
+                self._mark(table, key)
+            return
+        self._event[(table, key)] = None
+        self._changed(table, key)
+
+    # שינויים – מעדכנים את הזיכרון, המימוש דואג לדיסק
+    def put_member(self, uid, member):
+        self.data["members"][str(uid)] = member
+        self.members.add(uid, member)
+        self._mark("members", str(uid))
+
+    def delete_member(self, uid):
+        self.data["members"].pop(str(uid), None)
+        self.members.remove(uid)
+        self._mark("members", str(uid))
+
+    def put_pending(self, uid, pending):
+        self.data["pending"][str(uid)] = pending
+        self._mark("pending", str(uid))
+
+    def delete_pending(self, uid):
+        self.data["pending"].pop(str(uid), None)
+        self._mark("pending", str(uid))
+
+    def set_cooldown(self, uid, until):
+        until = cooldown_epoch(until)
+        self.data["cooldowns"][str(uid)] = until
+        self.cooldowns.add(uid, until)
+        self._mark("cooldowns", str(uid))
+
+    def purge_expired_cooldowns(self):
+        """ניקוי cooldowns שפגו – נקרא מהסריקה התקופתית"""
+        expired = self.cooldowns.expired()
+        with self.event("cooldowns_expired"):
+            for uid in expired:
+                self.delete_cooldown(uid)
+        return len(expired)
+
+    def delete_cooldown(self, uid):
+        if self.data["cooldowns"].pop(str(uid), None) is not None:
+            self._mark("cooldowns", str(uid))
+
+    def set_unreachable(self, uid):
+        """משתמש שחסם את הבוט – לא נשלח אליו בהפצות הבאות"""
+        self.data["unreachable"][str(uid)] = datetime.now().isoformat()
+        self._mark("unreachable", str(uid))
+
+    def clear_unreachable(self, uid):
+        if self.data["unreachable"].pop(str(uid), None) is not None:
+            self._mark("unreachable", str(uid))
+
+    def next_member_number(self):
+        self.data["counter"] += 1
+        self._mark("counter", None)
+        return self.data["counter"]
+
+    def add_rejected(self, record):
+        """דחייה נכתבת לארכיון בלבד – לא למצב החי (בתוך אירוע: בסיומו, בכתיבה אחת)"""
+        if self._event is not None:
+            self._rejected.append(record)
+        else:
+            self.archive.append(record)
+
+    def _changed(self, table, key):
+        raise NotImplementedError
+
+class JsonStore(Storage):
+    """קובץ JSON יחיד עם כתיבה מושהית"""
+
+    def __init__(self, path, archive):
+        super().__init__(path, archive)
+        self._dirty = asyncio.Event()
+        self._task = None
+        self._write_lock = threading.Lock()
+
+    def load(self):
+        data = _empty_data()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data.update(json.load(f))
+        legacy = data.pop("rejected", None)
+        self._loaded(data)
+        if legacy:
+            # קובץ ישן: העברת רשימת הנדחים לארכיון בכתיבה אחת ושמירת המצב בלעדיה מיד.
+            # קריסה בין השתיים – בעלייה הבאה הרשומות שכבר בארכיון מדולגות
+            moved = self.archive.extend_missing(legacy)
+            self.mark_dirty()
+            self.flush_sync()
+            logger.info(f"Moved {moved} rejected records to archive ({len(legacy) - moved} already there)")
+        return data
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    def save_all(self):
+        self.mark_dirty()
+
+    def _changed(self, table, key):
+        self.mark_dirty()
+
+    def _write(self, payload):
+        """כתיבה אטומית: קובץ זמני באותה תיקייה ואז החלפה"""
+        tmp = f"{self.path}.tmp"
+        with self._write_lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+    def _snapshot(self):
+        return json.dumps(self.data, ensure_ascii=False, separators=(",", ":"))
+
+    async def flush(self):
+        if self.data is None:
+            return
+        self._dirty.clear()
+        # הסריאליזציה בלולאה (תמונת מצב עקבית), הכתיבה בת'רד
+        await asyncio.to_thread(self._write, self._snapshot())
+
+    def flush_sync(self):
+        if self.data is not None and self._dirty.is_set():
+            self._dirty.clear()
+            self._write(self._snapshot())
+
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(FLUSH_DELAY)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Could not flush data: {e}")
+                self._dirty.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush_sync()
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    user_id  INTEGER PRIMARY KEY,
+    number   INTEGER NOT NULL,
+    lastname TEXT,
+    village  TEXT,
+    unit     TEXT,
+    rank     TEXT,
+    warnings INTEGER NOT NULL DEFAULT 0,
+    joined   TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_members_number ON members(number);
+CREATE TABLE IF NOT EXISTS pending (
+    user_id   INTEGER PRIMARY KEY,
+    username  TEXT,
+    answers   TEXT NOT NULL,
+    timestamp TEXT
+);
+CREATE TABLE IF NOT EXISTS cooldowns (
+    user_id INTEGER PRIMARY KEY,
+    until   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS unreachable (
+    user_id INTEGER PRIMARY KEY,
+    since   TEXT NOT NULL
+);
+"""
+
+MEMBER_FIELDS = ("number", "lastname", "village", "unit", "rank", "warnings", "joined")
+KV_TABLES = {"cooldowns": "until", "unreachable": "since"}   # טבלה → עמודת הערך
+
+class SqliteStore(Storage):
+    """SQLite במצב WAL – כל שינוי הוא כתיבת שורה"""
+
+    def __init__(self, path, archive, legacy_path=DATA_FILE):
+        super().__init__(path, archive)
+        self.legacy_path = legacy_path   # data.json לייבוא חד-פעמי
+        self.conn = None
+        self._depth = 0
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SQLITE_SCHEMA)
+        return self.conn
+
+    def load(self):
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'counter'").fetchone() is None:
+            self._init_db()
+
+        data = _empty_data()
+        data["counter"] = int(conn.execute("SELECT value FROM meta WHERE key = 'counter'").fetchone()[0])
+        row = conn.execute("SELECT value FROM meta WHERE key = 'event_seq'").fetchone()
+        data["event_seq"] = int(row[0]) if row else 0
+        for row in conn.execute(f"SELECT user_id, {', '.join(MEMBER_FIELDS)} FROM members"):
+            data["members"][str(row[0])] = dict(zip(MEMBER_FIELDS, row[1:]))
+        for uid, username, answers, ts in conn.execute("SELECT user_id, username, answers, timestamp FROM pending"):
+            data["pending"][str(uid)] = {
+                "user_id": uid, "username": username or "",
+                "answers": json.loads(answers), "timestamp": ts,
+            }
+        for table, column in KV_TABLES.items():
+            for uid, value in conn.execute(f"SELECT user_id, {column} FROM {table}"):
+                data[table][str(uid)] = value
+        self._loaded(data)
+        self._migrate_rejected()
+        return data
+
+    def _migrate_rejected(self):
+        """מסד ישן: העברת טבלת rejected לארכיון ומחיקתה"""
+        conn = self.conn
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rejected'").fetchone() is None:
+            return
+        rows = conn.execute("SELECT user_id, username, answers, rejected_at FROM rejected ORDER BY id").fetchall()
+        moved = self.archive.extend_missing([
+            {"user_id": uid, "username": username or "", "answers": json.loads(answers), "rejected_at": rejected_at}
+            for uid, username, answers, rejected_at in rows
+        ])
+        self._exec("DROP TABLE rejected")
+        logger.info(f"Moved {moved} rejected records to archive ({len(rows) - moved} already there)")
+
+    def _init_db(self):
+        """בסיס נתונים חדש: ייבוא חד-פעמי מ-data.json אם קיים"""
+        if os.path.exists(self.legacy_path):
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+            import_json(self, legacy)
+            logger.info(f"Imported {len(legacy.get('members', {}))} members from {self.legacy_path}")
+        else:
+            with self.transaction():
+                self._exec("INSERT INTO meta (key, value) VALUES ('counter', '0')")
+
+    def _exec(self, sql, params=()):
+        self.conn.execute(sql, params)
+        if self._depth == 0:
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        self._depth += 1
+        try:
+            yield
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.rollback()
+            raise
+        self._depth -= 1
+        if self._depth == 0:
+            self.conn.commit()
+
+    def _changed(self, table, key):
+        if table in ("counter", "event_seq"):
+            self._exec("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                       (table, str(self.data[table])))
+        elif table == "members":
+            m = self.data["members"].get(key)
+            if m is None:
+                self._exec("DELETE FROM members WHERE user_id = ?", (int(key),))
+            else:
+                self._exec(
+                    f"INSERT OR REPLACE INTO members (user_id, {', '.join(MEMBER_FIELDS)}) "
+                    f"VALUES (?{', ?' * len(MEMBER_FIELDS)})",
+                    (int(key), *(m.get(f) for f in MEMBER_FIELDS)),
+                )
+        elif table == "pending":
+            p = self.data["pending"].get(key)
+            if p is None:
+                self._exec("DELETE FROM pending WHERE user_id = ?", (int(key),))
+            else:
+                self._exec(
+                    "INSERT OR REPLACE INTO pending (user_id, username, answers, timestamp) VALUES (?, ?, ?, ?)",
+                    (int(key), p.get("username", ""), json.dumps(p["answers"], ensure_ascii=False), p.get("timestamp")),
+                )
+        elif table in KV_TABLES:
+            value = self.data[table].get(key)
+            if value is None:
+                self._exec(f"DELETE FROM {table} WHERE user_id = ?", (int(key),))
+            else:
+                self._exec(f"INSERT OR REPLACE INTO {table} (user_id, {KV_TABLES[table]}) VALUES (?, ?)",
+                           (int(key), value))
+
+    def save_all(self):
+        with self.transaction():
+            for table in ("members", "pending", *KV_TABLES):
+                self._exec(f"DELETE FROM {table}")
+                for key in self.data[table]:
+                    self._changed(table, key)
+            self._changed("counter", None)
+            self._changed("event_seq", None)
+
+    def quarantine(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        super().quarantine()
+
+    async def stop(self):
+        if self.conn is not None:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+            self.conn = None
+
+def import_json(store, legacy):
+    """ייבוא מסמך data.json קיים לתוך מאגר (בטרנזקציה אחת)"""
+    store._loaded(_empty_data())
+    # הארכיון נכתב לפני ה-commit: ייבוא שנקטע ומורץ שוב מדלג על מה שכבר הועבר
+    store.archive.extend_missing(legacy.get("rejected", []))
+    with store.transaction():
+        for uid, member in legacy.get("members", {}).items():
+            store.put_member(uid, member)
+        for uid, pending in legacy.get("pending", {}).items():
+            store.put_pending(uid, pending)
+        for uid, until in legacy.get("cooldowns", {}).items():
+            store.set_cooldown(uid, until)
+        for uid, since in legacy.get("unreachable", {}).items():
+            store.data["unreachable"][str(uid)] = since
+            store._changed("unreachable", str(uid))
+        store.data["counter"] = legacy.get("counter", 0)
+        store._changed("counter", None)
+        store.data["event_seq"] = legacy.get("event_seq", 0)
+        store._changed("event_seq", None)
+
+def _make_store(tenant):
+    if STORAGE == "sqlite":
+        return SqliteStore(tenant.path(DB_FILE), tenant.archive, tenant.path(DATA_FILE))
+    return JsonStore(tenant.path(DATA_FILE), tenant.archive)
 
 def load_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"members": {}, "pending": {}, "rejected": [], "counter": 0, "cooldowns": {}}
+    """מחזיר את המצב שבזיכרון (נטען מהאחסון רק בפעם הראשונה)"""
+    if STORE.data is None:
+        STORE.load()
+    return STORE.data
+
+# ── יומן אירועים ─────────────────────────────────────────
+# כל פעולה שמשנה את המצב (STORE.event) נרשמת ביומן append-only: סוג, מבצע,
+# ומצב הרשומות שהשתנו אחריה. כל EVENTS_SNAPSHOT_EVERY אירועים נשמרת תמונת מצב
+# דחוסה. בעלייה: אם האחסון הראשי פגום או מפגר אחרי היומן (למשל כתיבה מושהית
+# שלא הספיקה לפני קריסה) – המצב נבנה מה-snapshot האחרון + האירועים שאחריו.
+
+EVENTS_FILE = os.environ.get("EVENTS_FILE", "events.db")
+EVENTS_SNAPSHOT_EVERY = int(os.environ.get("EVENTS_SNAPSHOT_EVERY", "1000"))
+EVENTS_KEEP_SNAPSHOTS = 3
+
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts      TEXT NOT NULL,
+    kind    TEXT NOT NULL,
+    info    TEXT NOT NULL,
+    changes TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    seq  INTEGER PRIMARY KEY,
+    ts   TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+"""
 
-def save_data(data):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+class EventLog:
+    """יומן אירועים append-only + תמונות מצב לשחזור מהיר"""
+
+    def __init__(self, path, snapshot_every=EVENTS_SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.conn = None
+        self.last_seq = 0
+        self.snapshot_seq = None   # None – אין עדיין snapshot
+
+    def open(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(EVENTS_SCHEMA)
+            self.last_seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+            self.snapshot_seq = self.conn.execute("SELECT MAX(seq) FROM snapshots").fetchone()[0]
+        return self.conn
+
+    def append(self, kind, info, changes):
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO events (ts, kind, info, changes) VALUES (?, ?, ?, ?)",
+                (datetime.now().isoformat(), kind, json.dumps(info, ensure_ascii=False),
+                 json.dumps(changes, ensure_ascii=False)),
+            )
+        self.last_seq = cur.lastrowid
+        return self.last_seq
+
+    def snapshot_due(self):
+        return self.last_seq - (self.snapshot_seq or 0) >= self.snapshot_every
+
+    def snapshot(self, data, seq=None):
+        """תמונת מצב דחוסה של data אחרי האירוע seq (ברירת מחדל – האחרון)"""
+        seq = self.last_seq if seq is None else seq
+        blob = zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO snapshots (seq, ts, data) VALUES (?, ?, ?)",
+                              (seq, datetime.now().isoformat(), blob))
+            self.conn.execute(
+                "DELETE FROM snapshots WHERE seq NOT IN (SELECT seq FROM snapshots ORDER BY seq DESC LIMIT ?)",
+                (EVENTS_KEEP_SNAPSHOTS,),
+            )
+        self.snapshot_seq = seq
+        logger.info(f"Event log snapshot at seq {seq} ({len(blob)} bytes)")
+
+    def replay(self):
+        """המצב אחרי האירוע האחרון: snapshot אחרון + האירועים שאחריו"""
+        row = self.conn.execute("SELECT seq, data FROM snapshots ORDER BY seq DESC LIMIT 1").fetchone()
+        if row:
+            seq, data = row[0], json.loads(zlib.decompress(row[1]))
+        else:
+            seq, data = 0, _empty_data()
+        replayed = 0
+        for seq, changes in self.conn.execute(
+                "SELECT seq, changes FROM events WHERE seq > ? ORDER BY seq", (seq,)):
+            for table, key, value in json.loads(changes):
+                if key is None:
+                    data[table] = value
+                elif value is None:
+                    data[table].pop(key, None)
+                else:
+                    data[table][key] = value
+            replayed += 1
+        data["event_seq"] = seq
+        return data, replayed
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+def restore_state():
+    """טעינת המצב בעלייה ושחזור מהיומן במקרה הצורך"""
+    corrupt = False
+    try:
+        load_data()
+    except (ValueError, sqlite3.DatabaseError) as e:
+        logger.error(f"Could not load {STORE.path}, rebuilding from event log: {e}")
+        STORE.quarantine()
+        load_data()
+        corrupt = True
+
+    EVENTS.open()
+    STORE.events = EVENTS
+    seq = STORE.data["event_seq"]
+    if EVENTS.snapshot_seq is None:
+        # יומן חדש – המצב הקיים הוא נקודת ההתחלה
+        EVENTS.snapshot(STORE.data)
+        if seq != EVENTS.last_seq:
+            STORE.data["event_seq"] = EVENTS.last_seq
+            STORE._changed("event_seq", None)
+    elif seq > EVENTS.last_seq and not corrupt:
+        logger.warning(f"Event log is behind the store ({EVENTS.last_seq} < {seq}), starting a new baseline")
+        STORE.data["event_seq"] = EVENTS.last_seq
+        STORE._changed("event_seq", None)
+        EVENTS.snapshot(STORE.data)
+    elif seq != EVENTS.last_seq or corrupt:
+        started = time.monotonic()
+        data, replayed = EVENTS.replay()
+        STORE._loaded(data)
+        STORE.save_all()
+        logger.info(f"Restored state from event log: {replayed} events replayed "
+                    f"in {time.monotonic() - started:.2f}s (store was at {seq})")
+    return STORE.data
 
 # ── עזרה: חיפוש חבר לפי מספר ─────────────────────────────
 
-def find_member_by_number(data, number_str):
+def find_member_by_number(number_str):
     """מחזיר (uid, member_dict) או (None, None)"""
-    number_str = number_str.lstrip("#")
-    for uid, member in data["members"].items():
-        if str(member["number"]) == number_str or str(member["number"]).zfill(3) == number_str:
-            return int(uid), member
-    return None, None
+    load_data()
+    return STORE.members.by_number(number_str)
+
+# ── מקביליות ונעילות ─────────────────────────────────────
+# עדכונים של משתמשים שונים מעובדים במקביל; עדכונים של אותו משתמש – לפי הסדר
+# (השיחה שלו היא מכונת מצבים). פעולות קריאה-שינוי-כתיבה שחוצות await
+# (אזהרה → הוצאה, אישור/דחייה → הודעות) נועלות את הרשומה עצמה.
+# הקצאת מספר חבר היא סינכרונית בתוך STORE.event() ולכן אטומית בלולאה.
+
+MAX_CONCURRENT_UPDATES = int(os.environ.get("MAX_CONCURRENT_UPDATES", "64"))
+
+class KeyedLock:
+    """מנעול לכל מפתח – נוצר לפי דרישה ונמחק כשאין מי שמחכה לו"""
+
+    def __init__(self):
+        self._locks = {}   # מפתח → [מנעול, מספר משתמשים]
+
+    @asynccontextmanager
+    async def lock(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+# ── ריבוי קבוצות ─────────────────────────────────────────
+# תהליך אחד יכול לשרת כמה קבוצות (TENANTS_FILE). לכל קבוצה מנהלים, מספור
+# חברים, cooldowns, אחסון, יומן אירועים, ארכיון ונעילות משלה, בתיקייה
+# TENANTS_DIR/<key>. הקבוצה של עדכון נקבעת פעם אחת לפני כל המטפלים
+# (route_tenant): בקבוצה – לפי ה-chat, בפרטי – לפי קישור t.me/<bot>?start=<key>
+# שנשמר ב-user_data. STORE / EVENTS / ARCHIVE / MEMBER_LIST / RECORD_LOCKS
+# מפנים לקבוצה הנוכחית (contextvar) – טיימרים ומשימות ב-outbox שומרים את
+# הקבוצה שלהם ורצים בתוכה. קבוצה נטענת לזיכרון בפנייה הראשונה ומשוחררת
+# אחרי TENANT_IDLE שניות בלי עדכונים.
+# בלי TENANTS_FILE – קבוצה אחת מ-GROUP_ID / ADMIN_ID עם הקבצים בתיקייה הנוכחית.
+
+TENANTS_FILE = os.environ.get("TENANTS_FILE", "")
+TENANTS_DIR  = os.environ.get("TENANTS_DIR", "tenants")
+TENANT_IDLE  = float(os.environ.get("TENANT_IDLE", "3600"))   # שניות
+TENANT_SWEEP_INTERVAL = 300
+DEFAULT_TENANT = "main"   # המפתח של הקבוצה היחידה (וגם של טיימרים/משימות מלפני ריבוי קבוצות)
+# התווים שמותרים בפרמטר start; עד 16 כדי שייכנס גם ל-callback_data (64 בתים)
+_TENANT_KEY = re.compile(r"^[A-Za-z0-9_-]{1,16}$")
+
+class Tenant:
+    """קבוצה אחת: ההגדרות שלה + המצב שלה בזיכרון (נטען לפי דרישה)"""
+
+    STATE = ("store", "events", "archive", "member_list", "content_filter", "post_guard", "photo_index")
+
+    def __init__(self, key, group_id, admins, directory=None):
+        self.key = key
+        self.group_id = group_id
+        self.admins = frozenset(admins)
+        self.dir = directory   # None – הקבצים בתיקייה הנוכחית
+        self.locks = KeyedLock()
+        self._drop()
+        self.last_used = 0.0
+
+    def path(self, name):
+        return name if self.dir is None else os.path.join(self.dir, name)
+
+    def _drop(self):
+        for attr in self.STATE:
+            setattr(self, attr, None)
+
+    def open(self):
+        """טעינה ושחזור בפנייה הראשונה; אחר כך – מיידי"""
+        if self.store is not None:
+            return self
+        if self.dir is not None:
+            os.makedirs(self.dir, exist_ok=True)
+        self.archive = RejectedArchive(self.path(ARCHIVE_DIR))
+        self.events = EventLog(self.path(EVENTS_FILE))
+        self.store = _make_store(self)
+        self.last_used = time.monotonic()
+        try:
+            with use_tenant(self):
+                restore_state()
+                self.member_list = MemberListCache(self.store.members)
+                self.content_filter = ContentFilter(self.path(BLOCKLIST_FILE))
+                self.post_guard = PostGuard()
+                self.photo_index = PhotoIndex(self.path(PHOTO_INDEX_FILE))
+                self.store.start()
+                self.store.purge_expired_cooldowns()
+        except BaseException:
+            self.events.close()
+            self._drop()
+            raise
+        logger.info(f"Tenant {self.key}: loaded {len(self.store.members)} members")
+        return self
+
+    async def close(self):
+        """שחרור מהזיכרון. הכתיבה לדיסק סינכרונית – פנייה חדשה בזמן הסגירה טוענת מצב שלם"""
+        store, events = self.store, self.events
+        if store is None:
+            return
+        self._drop()
+        store.flush_sync()
+        if events.conn is not None and events.last_seq != events.snapshot_seq:
+            events.snapshot(store.data)
+        events.close()
+        await store.stop()
+        logger.info(f"Tenant {self.key}: unloaded")
+
+class TenantRegistry:
+    """כל הקבוצות המוגדרות; רק הפעילות טעונות לזיכרון"""
+
+    def __init__(self, tenants, default=None):
+        self.tenants = {tenant.key: tenant for tenant in tenants}
+        self.by_group = {tenant.group_id: tenant for tenant in tenants}
+        # קבוצה יחידה – כל עדכון שייך אליה, כמו לפני ריבוי קבוצות
+        self.single = tenants[0] if len(tenants) == 1 else None
+        self.default = default or self.single   # לפרטי בלי קישור
+
+    def __iter__(self):
+        return iter(self.tenants.values())
+
+    def __len__(self):
+        return len(self.tenants)
+
+    def get(self, key):
+        return self.tenants.get(key)
+
+    def loaded(self):
+        return [tenant for tenant in self if tenant.store is not None]
+
+    def resolve(self, update, user_data):
+        """הקבוצה של עדכון נכנס, או None אם אי אפשר לדעת"""
+        if self.single:
+            return self.single
+        chat = update.effective_chat
+        if chat is not None and chat.type != "private":
+            return self.by_group.get(chat.id)
+        # כפתור נושא את הקבוצה שלו (tenant_callback) – קודם לקבוצה של השיחה
+        query = update.callback_query
+        if query is not None and query.data and "@" in query.data:
+            tenant = self.tenants.get(query.data.rpartition("@")[2])
+            if tenant is not None:
+                return tenant
+        message = update.message
+        if user_data is not None and message and message.text and message.text.startswith("/start "):
+            key = message.text.split(maxsplit=1)[1].strip()
+            if key in self.tenants:
+                user_data["tenant"] = key
+        key = (user_data or {}).get("tenant")
+        if key in self.tenants:
+            return self.tenants[key]
+        user = update.effective_user
+        admin_of = [tenant for tenant in self if user is not None and user.id in tenant.admins]
+        if len(admin_of) == 1:
+            return admin_of[0]
+        return self.default
+
+    async def evict_idle(self, idle):
+        if self.single:
+            return
+        cutoff = time.monotonic() - idle
+        for tenant in self.loaded():
+            if tenant.last_used < cutoff:
+                await tenant.close()
+
+    async def close_all(self):
+        for tenant in self.loaded():
+            await tenant.close()
+
+def load_tenants():
+    """TENANTS_FILE: [{"key", "group_id", "admins", "dir"?, "default"?}]"""
+    if not TENANTS_FILE:
+        return TenantRegistry([Tenant(DEFAULT_TENANT, GROUP_ID, [ADMIN_ID])])
+    with open(TENANTS_FILE, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    tenants, default = [], None
+    for entry in config:
+        key = str(entry["key"])
+        if not _TENANT_KEY.match(key) or any(t.key == key for t in tenants):
+            raise ValueError(f"{TENANTS_FILE}: invalid or duplicate tenant key {key!r}")
+        directory = entry.get("dir", os.path.join(TENANTS_DIR, key))
+        tenant = Tenant(key, int(entry["group_id"]), [int(uid) for uid in entry["admins"]],
+                        None if directory == "." else directory)
+        tenants.append(tenant)
+        if entry.get("default"):
+            default = tenant
+    if not tenants:
+        raise ValueError(f"{TENANTS_FILE}: no tenants configured")
+    return TenantRegistry(tenants, default)
+
+TENANTS = load_tenants()
+CURRENT_TENANT = contextvars.ContextVar("tenant", default=None)
+
+def current_tenant():
+    """הקבוצה של העדכון / הטיימר / המשימה הנוכחיים (טעונה)"""
+    tenant = CURRENT_TENANT.get() or TENANTS.single
+    if tenant is None:
+        raise RuntimeError("No tenant in this context")
+    return tenant.open()
+
+@contextmanager
+def use_tenant(tenant):
+    token = CURRENT_TENANT.set(tenant)
+    try:
+        yield tenant
+    finally:
+        CURRENT_TENANT.reset(token)
+
+def _add_tenant_column(conn, table):
+    """קובץ מלפני ריבוי קבוצות: עמודת tenant, השורות הקיימות שייכות ל-DEFAULT_TENANT"""
+    if "tenant" not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+        with conn:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN tenant TEXT NOT NULL DEFAULT '{DEFAULT_TENANT}'")
+
+def is_admin(uid):
+    return uid in current_tenant().admins
+
+def admin_ids():
+    return sorted(current_tenant().admins)
+
+def tenant_note():
+    """שורת זיהוי הקבוצה בהודעות (רק כשיש כמה קבוצות)"""
+    if TENANTS.single:
+        return ""
+    key = current_tenant().key
+    return f"\n\n🏘 קבוצה: {key} (מעבר: /start {key})"
+
+def tenant_callback(data):
+    """callback_data עם מפתח הקבוצה (רק כשיש כמה): הכפתור פועל על הקבוצה שבה
+    נוצר, גם אם השיחה של המנהל עברה בינתיים לקבוצה אחרת"""
+    if TENANTS.single:
+        return data
+    return f"{data}@{current_tenant().key}"
+
+def callback_data(query):
+    """callback_data בלי מפתח הקבוצה"""
+    data, sep, _ = query.data.rpartition("@")
+    return data if sep else query.data
+
+class _TenantAttr:
+    """מפנה ל-attr של הקבוצה הנוכחית – המטפלים ממשיכים לכתוב STORE.x"""
+
+    def __init__(self, attr):
+        object.__setattr__(self, "_attr", attr)
+
+    def __getattr__(self, name):
+        return getattr(getattr(current_tenant(), self._attr), name)
+
+    def __setattr__(self, name, value):
+        setattr(getattr(current_tenant(), self._attr), name, value)
+
+    def __len__(self):
+        return len(getattr(current_tenant(), self._attr))
+
+STORE        = _TenantAttr("store")
+EVENTS       = _TenantAttr("events")
+ARCHIVE      = _TenantAttr("archive")
+MEMBER_LIST  = _TenantAttr("member_list")
+RECORD_LOCKS = _TenantAttr("locks")
+CONTENT_FILTER = _TenantAttr("content_filter")
+POST_GUARD = _TenantAttr("post_guard")
+PHOTO_INDEX = _TenantAttr("photo_index")
+
+async def route_tenant(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """לפני כל המטפלים: קביעת הקבוצה של העדכון"""
+    tenant = TENANTS.resolve(update, ctx.user_data)
+    if tenant is None:
+        chat = update.effective_chat
+        if chat is not None and chat.type == "private" and update.effective_message:
+            await update.effective_message.reply_text("🔗 יש להיכנס לבוט דרך הקישור שקיבלת מהקבוצה.")
+        raise ApplicationHandlerStop
+    tenant.open().last_used = time.monotonic()
+    CURRENT_TENANT.set(tenant)
+
+async def tenant_sweeper():
+    """שחרור קבוצות שלא היו בהן עדכונים TENANT_IDLE שניות"""
+    while True:
+        await asyncio.sleep(TENANT_SWEEP_INTERVAL)
+        await TENANTS.evict_idle(TENANT_IDLE)
+
+class TenantConversationHandler(ConversationHandler):
+    """מפתח השיחה כולל את הקבוצה: מי שעובר לקבוצה אחרת באמצע שיחה לא ממשיך בה
+    את השלב של הקבוצה הקודמת (עם קבוצה אחת – המפתח הרגיל, כמו בשיחות השמורות)"""
+
+    def _get_key(self, update):
+        key = super()._get_key(update)
+        tenant = CURRENT_TENANT.get()
+        if TENANTS.single or tenant is None:
+            return key
+        return (tenant.key, *key)
+
+def _update_owner(update):
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """עיבוד מקבילי עם סדר שמור לכל משתמש"""
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._users = KeyedLock()
+
+    async def process_update(self, update, coroutine):
+        # קודם מנעול המשתמש ורק אז מקום במכסה – משתמש שמציף לא תופס את כל המקומות
+        owner = _update_owner(update) if isinstance(update, Update) else None
+        if owner is None:
+            await super().process_update(update, coroutine)
+            return
+        async with self._users.lock(owner):
+            await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+# ── שמירת מצב שיחות ──────────────────────────────────────
+# מצב ה-ConversationHandler ו-user_data (תשובות השאלון, יעד הודעה פרטית...)
+# נשמרים בשורה לכל משתמש / שיחה. PTB מעביר רק משתמשים שהשתנו, ושורה
+# שהתוכן שלה לא השתנה לא נכתבת שוב – כך שאמצע שאלון שורד הפעלה מחדש.
+
+SESSIONS_FILE = os.environ.get("SESSIONS_FILE", "sessions.db")
+SESSIONS_FLUSH_INTERVAL = float(os.environ.get("SESSIONS_FLUSH_INTERVAL", "5"))
+
+SESSIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name  TEXT NOT NULL,
+    key   TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+"""
+
+class SqlitePersistence(BasePersistence):
+    """persistence של PTB עם כתיבה ברמת שורה (רק user_data + שיחות)"""
+
+    def __init__(self, path, update_interval=SESSIONS_FLUSH_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.conn = None
+        self._written = {}   # user_id → JSON שנכתב לאחרונה
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SESSIONS_SCHEMA)
+        return self.conn
+
+    async def get_user_data(self):
+        result = {}
+        for user_id, data in self._connect().execute("SELECT user_id, data FROM user_data"):
+            self._written[user_id] = data
+            result[user_id] = json.loads(data)
+        return result
+
+    async def get_conversations(self, name):
+        rows = self._connect().execute("SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        conn = self._connect()
+        with conn:
+            if new_state is None:
+                conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, json.dumps(key)))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                    (name, json.dumps(key), json.dumps(new_state)),
+                )
+
+    async def update_user_data(self, user_id, data):
+        payload = json.dumps(data, ensure_ascii=False, sort_keys=True)
+        if self._written.get(user_id) == payload:
+            return
+        conn = self._connect()
+        with conn:
+            if data:
+                conn.execute("INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)", (user_id, payload))
+            else:
+                conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+        self._written[user_id] = payload
+
+    async def drop_user_data(self, user_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+        self._written.pop(user_id, None)
+
+    async def flush(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    # chat_data / bot_data / callback_data לא בשימוש בבוט
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+# ══════════════════════════════════════════════════════════
+#                   שליחה יוצאת
+# ══════════════════════════════════════════════════════════
+
+# ── מנוע הפצה: מקביליות מוגבלת + דלי אסימונים ─────────────
+# טלגרם מגביל ~30 הודעות לשנייה לכל הבוט (ו-~1 לשנייה לכל צ'אט – בהפצה כל
+# משתמש מקבל הודעה אחת, כך שהמגבלה הגלובלית היא הקובעת).
+
+BROADCAST_RATE        = float(os.environ.get("BROADCAST_RATE", "25"))    # הודעות לשנייה
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_RETRIES     = 3
+BROADCAST_PROGRESS_EVERY = 3   # שניות בין עדכוני התקדמות למנהל
+
+class TokenBucket:
+    """דלי אסימונים: rate אסימונים לשנייה, עד burst ברצף"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def try_acquire(self):
+        """אסימון בלי המתנה – False אם אין כרגע"""
+        now = time.monotonic()
+        if self._lock.locked() or now < self.paused_until:
+            return False
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def pause(self, seconds):
+        """RetryAfter: עצירת השליחות מהדלי הזה למשך הזמן שטלגרם ביקש"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+BROADCAST_BUCKET = TokenBucket(BROADCAST_RATE)
+
+# ── נתיבי עדיפות: interactive / bulk ─────────────────────
+# כל קריאה ל-Bot API שייכת לנתיב לפי API_LANE (contextvar): ברירת המחדל
+# interactive, ו-broadcast מסמן את העובדים שלו כ-bulk. לכל נתיב מאגר חיבורי
+# HTTP משלו (LaneRequest), ושליחות הודעות חולקות תקרת קצב אחת (API_RATE)
+# לפי משקל: בעומס interactive מקבל 4 מכל 5 אסימונים, ונתיב בלי המתנה לא
+# שומר לעצמו את חלקו.
+
+API_LANE = contextvars.ContextVar("api_lane", default="interactive")
+API_RATE = float(os.environ.get("API_RATE", "30"))       # הודעות לשנייה לכל הבוט; 0 = בלי תקרה
+API_BURST = int(os.environ.get("API_BURST", "30"))       # הודעות ברצף לפני שהתקרה נכנסת לתוקף
+BULK_POOL_SIZE = int(os.environ.get("BULK_POOL_SIZE", "16"))
+INTERACTIVE_POOL_SIZE = 256   # כמו ברירת המחדל של PTB
+LANE_WEIGHTS = {"interactive": 4, "bulk": 1}
+for _item in filter(None, os.environ.get("API_LANE_WEIGHTS", "").split(",")):
+    _lane, _, _weight = _item.partition("=")
+    if _lane.strip() in LANE_WEIGHTS:
+        LANE_WEIGHTS[_lane.strip()] = float(_weight)
+
+# שיטות שנספרות במגבלת ההודעות של טלגרם; השאר (answerCallbackQuery וכו') עוברות ישר
+RATE_LIMITED_METHODS = {
+    "sendMessage", "sendPhoto", "sendVideo", "sendDocument", "sendMediaGroup", "copyMessage", "forwardMessage",
+}
+INTERACTIVE_RETRY_MAX = 5   # שניות: תשובה מיידית שקיבלה 429 קצר נשלחת שוב פעם אחת
+
+class LaneScheduler:
+    """תקרת קצב משותפת, מחולקת בין נתיבים בתור הוגן משוקלל"""
+
+    def __init__(self, rate, weights, burst=API_BURST):
+        self.weights = weights
+        # פרץ: תשובות לכמה משתמשים שהגיעו יחד יוצאות מיד ולא אחת כל 1/rate שניות
+        self.bucket = TokenBucket(rate, burst=max(1, burst)) if rate > 0 else None
+        self.waiting = {lane: deque() for lane in weights}
+        self.vtime = dict.fromkeys(weights, 0.0)   # שימוש מצטבר חלקי משקל
+        self.clock = 0.0                           # vtime של השליחה האחרונה שאושרה
+        self.paused_until = dict.fromkeys(weights, 0.0)
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def depth(self):
+        return {(lane,): len(queue) for lane, queue in self.waiting.items()}
+
+    async def acquire(self, lane):
+        if self.bucket is None:
+            return
+        while (wait := self.paused_until[lane] - time.monotonic()) > 0:
+            await asyncio.sleep(wait)
+        if not self.waiting[lane]:
+            # נתיב שחוזר מבטלה לא צובר "זכות" על הזמן שבו לא ביקש
+            self.vtime[lane] = max(self.vtime[lane], self.clock)
+            if not any(self.waiting.values()) and self.bucket.try_acquire():
+                self._served(lane)
+                return
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[lane].append(future)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+        self._wake.set()
+        await future
+
+    def pause(self, seconds, lane):
+        """429 מטלגרם: עצירת הנתיב שקיבל אותו בלבד – הנתיב השני ממשיך בחלקו"""
+        self.paused_until[lane] = max(self.paused_until[lane], time.monotonic() + seconds)
+        self._wake.set()
+
+    def _ready(self):
+        now = time.monotonic()
+        return [lane for lane, queue in self.waiting.items()
+                if queue and not queue[0].done() and self.paused_until[lane] <= now]
+
+    async def _dispatch(self):
+        while True:
+            for queue in self.waiting.values():
+                while queue and queue[0].done():   # ממתין שבוטל
+                    queue.popleft()
+            if not any(self.waiting.values()):
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            if not self._ready():
+                # כל הממתינים בנתיבים עצורים – עד סוף העצירה הקרובה או בקשה חדשה
+                self._wake.clear()
+                now = time.monotonic()
+                wait = min(self.paused_until[lane] - now for lane, queue in self.waiting.items() if queue)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), max(wait, 0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.bucket.acquire()
+            # הבחירה אחרי ההמתנה – בקשה מיידית שהגיעה בינתיים קודמת
+            ready = self._ready()
+            if not ready:
+                continue
+            lane = min(ready, key=lambda l: self.vtime[l])
+            self._served(lane)
+            self.waiting[lane].popleft().set_result(None)
+
+    def _served(self, lane):
+        self.clock = self.vtime[lane]
+        self.vtime[lane] += 1 / self.weights[lane]
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+LANES = LaneScheduler(API_RATE, LANE_WEIGHTS)
+
+class LaneRequest(BaseRequest):
+    """מאגר חיבורים נפרד לכל נתיב – הפצה גדולה לא תופסת את החיבורים של תשובות מיידיות"""
+
+    def __init__(self):
+        self.lanes = {
+            "interactive": HTTPXRequest(connection_pool_size=INTERACTIVE_POOL_SIZE),
+            # בהפצה עדיף לחכות לחיבור פנוי מאשר להיכשל ב-pool timeout
+            "bulk": HTTPXRequest(connection_pool_size=BULK_POOL_SIZE, pool_timeout=None),
+        }
+        self.in_flight = dict.fromkeys(self.lanes, 0)
+
+    @property
+    def read_timeout(self):
+        return self.lanes["interactive"].read_timeout
+
+    async def initialize(self):
+        for request in self.lanes.values():
+            await request.initialize()
+
+    async def shutdown(self):
+        for request in self.lanes.values():
+            await request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        lane = API_LANE.get()
+        self.in_flight[lane] += 1
+        try:
+            return await self.lanes[lane].do_request(url, method, request_data, read_timeout=read_timeout,
+                                                     write_timeout=write_timeout, connect_timeout=connect_timeout,
+                                                     pool_timeout=pool_timeout)
+        finally:
+            self.in_flight[lane] -= 1
+
+async def _deliver(uid, send, bucket):
+    """שליחה לנמען אחד עם ניסיון חוזר אחרי RetryAfter. מחזיר sent / failed / blocked"""
+    for _ in range(BROADCAST_RETRIES):
+        if bucket is not None:
+            await bucket.acquire()
+        try:
+            await send(uid)
+        except RetryAfter as e:
+            logger.warning(f"Flood limit hit, pausing sends for {e.retry_after}s")
+            # רק הדלי של השליחה הזו נעצר; שליחה ישירה (בלי דלי) ממתינה בעצמה
+            if bucket is not None:
+                bucket.pause(float(e.retry_after))
+            else:
+                await asyncio.sleep(float(e.retry_after))
+            continue
+        except Forbidden:
+            # המשתמש חסם את הבוט – לא ננסה שוב בהפצות הבאות
+            if uid > 0:
+                STORE.set_unreachable(uid)
+            return "blocked"
+        except Exception as e:
+            logger.error(f"Could not send to {uid}: {e}")
+            return "failed"
+        return "sent"
+    return "failed"
+
+async def broadcast(uids, send, on_progress=None, on_result=None, bucket=BROADCAST_BUCKET, lane="bulk"):
+    """שליחה לרשימת נמענים; send(uid) שולחת לנמען אחד. מחזיר מונים.
+    lane=None – הנתיב של הקורא (שליחה ישירה מתוך מטפל)"""
+    stats = {"total": len(uids), "sent": 0, "failed": 0, "blocked": 0}
+    pending_uids = iter(uids)
+
+    async def worker():
+        if lane is not None:
+            API_LANE.set(lane)   # כל עובד הוא task נפרד – לא משפיע על הקורא
+        for uid in pending_uids:
+            status = await _deliver(uid, send, bucket)
+            stats[status] += 1
+            if on_result is not None:
+                on_result(uid, status)
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_EVERY)
+            await on_progress(stats)
+
+    progress_task = asyncio.create_task(reporter()) if on_progress else None
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(BROADCAST_CONCURRENCY, len(uids))))))
+    finally:
+        if progress_task:
+            progress_task.cancel()
+    return stats
+
+# ── תוכן הודעה שניתן לשמור ולשלוח שוב ───────────────────
+
+def _payload_from_message(message, header=None):
+    """טקסט/תמונה/סרטון מהודעה נכנסת → רשימת הודעות לשליחה (ריקה אם לא נתמך)"""
+    def with_header(text):
+        if header is None:
+            return text or ""
+        return header + (f"\n\n{text}" if text else "")
+
+    if message.photo:
+        return [{"type": "photo", "file_id": message.photo[-1].file_id, "caption": with_header(message.caption)}]
+    if message.video:
+        return [{"type": "video", "file_id": message.video.file_id, "caption": with_header(message.caption)}]
+    if message.text:
+        return [{"type": "text", "text": with_header(message.text)}]
+    return []
+
+def _album_payload(messages, header=None):
+    """חלקי אלבום → הודעה אחת מסוג album (הכותרת רק על הפריט הראשון)"""
+    items = [item for m in messages for item in _payload_from_message(m) if item["type"] != "text"]
+    if not items:
+        return []
+    if header is not None:
+        first = items[0]["caption"]
+        items[0]["caption"] = header + (f"\n\n{first}" if first else "")
+    if len(items) == 1:
+        return items
+    return [{"type": "album", "items": items}]
+
+def _text_payload(text, reply_markup=None):
+    msg = {"type": "text", "text": text}
+    if reply_markup is not None:
+        msg["reply_markup"] = reply_markup.to_dict()
+    return msg
+
+async def _send_payload(bot, chat_id, messages):
+    for m in messages:
+        markup = InlineKeyboardMarkup.de_json(m["reply_markup"], bot) if m.get("reply_markup") else None
+        if m["type"] == "photo":
+            await bot.send_photo(chat_id, m["file_id"], caption=m.get("caption") or "", reply_markup=markup)
+        elif m["type"] == "video":
+            await bot.send_video(chat_id, m["file_id"], caption=m.get("caption") or "", reply_markup=markup)
+        elif m["type"] == "album":
+            media_cls = {"photo": InputMediaPhoto, "video": InputMediaVideo}
+            await bot.send_media_group(chat_id, [
+                media_cls[item["type"]](item["file_id"], caption=item.get("caption") or "") for item in m["items"]
+            ])
+        else:
+            await bot.send_message(chat_id, m["text"], reply_markup=markup)
+
+# ── אלבומים (media group) ────────────────────────────────
+# אלבום מגיע כעדכון נפרד לכל פריט, עם אותו media_group_id. הפריט הראשון
+# נכנס למטפל של השיחה ופותח איסוף (והשיחה מסתיימת, או ממתינה – album_task);
+# שאר הפריטים נתפסים ב-album_part. אחרי ALBUM_WINDOW שניות בלי פריט חדש – on_complete מקבל
+# את כל ההודעות לפי הסדר, ושולח אותן בקריאת send_media_group אחת.
+
+ALBUM_WINDOW = 1.0   # שניות
+
+class AlbumCollector:
+    """איסוף חלקי אלבום בזיכרון עד שהאלבום נסגר"""
+
+    def __init__(self):
+        self._groups = {}    # media_group_id → {"messages", "on_complete", "seen"}
+
+    def __contains__(self, group_id):
+        return group_id in self._groups
+
+    def start(self, message, on_complete, create_task):
+        """פריט ראשון: on_complete(messages) נקרא בסוף החלון"""
+        self._groups[message.media_group_id] = {
+            "messages": [message], "on_complete": on_complete, "seen": time.monotonic(),
+        }
+        create_task(self._close_later(message.media_group_id))
+
+    def add(self, message):
+        group = self._groups.get(message.media_group_id)
+        if group is not None:
+            group["messages"].append(message)
+            group["seen"] = time.monotonic()
+
+    async def _close_later(self, group_id):
+        group = self._groups[group_id]
+        while (wait := group["seen"] + ALBUM_WINDOW - time.monotonic()) > 0:
+            await asyncio.sleep(wait)
+        del self._groups[group_id]
+        await group["on_complete"](sorted(group["messages"], key=lambda m: m.message_id))
+
+ALBUMS = AlbumCollector()
+
+class _AlbumPart(filters.MessageFilter):
+    """פריט נוסף באלבום שכבר בתהליך איסוף"""
+
+    def filter(self, message):
+        return message.media_group_id is not None and message.media_group_id in ALBUMS
+
+ALBUM_PART = _AlbumPart()
+
+def collect_album(update, ctx, on_complete):
+    ALBUMS.start(update.message, on_complete,
+                 lambda coro: ctx.application.create_task(coro, update=update))
+
+def album_task(update, ctx, on_complete):
+    """כמו collect_album, אבל מחזיר task שתוצאתו היא מה ש-on_complete(messages)
+    מחזירה. מטפל בשיחה שמחזיר אותו משאיר את השיחה בשלב הנוכחי עד שהאלבום נאסף
+    ונבדק (PendingState של ConversationHandler, כמו במטפל עם block=False), ואז
+    היא עוברת לשלב שהוחזר. האיסוף נפתח כאן, לפני שהפריט הבא יכול להגיע"""
+    collected = asyncio.get_running_loop().create_future()
+
+    async def complete(messages):
+        collected.set_result(messages)
+
+    async def finish():
+        return await on_complete(await collected)
+
+    collect_album(update, ctx, complete)
+    return ctx.application.create_task(finish(), update=update)
+
+async def album_part(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    ALBUMS.add(update.message)
+
+# ── תור יוצא עמיד (outbox) ───────────────────────────────
+# כל שליחה נרשמת קודם כמשימה עם רשימת נמענים, וכל נמען מסומן בנפרד אחרי
+# השליחה. אם התהליך נפל באמצע – בעלייה הבאה המשימה ממשיכה מהנמען הבא.
+# משימה מסוג "אישי" (Outbox.personal) שומרת לכל נמען data משלו, וההודעות
+# נבנות ממנו רק בזמן השליחה (למשל לינק הזמנה שנוצר פעם אחת ונשמר).
+
+OUTBOX_FILE = os.environ.get("OUTBOX_FILE", "outbox.db")
+OUTBOX_KEEP_DAYS = 7   # משימות שהסתיימו נמחקות אחרי
+OUTBOX_RESUME_CONCURRENCY = 4   # משימות שממשיכות במקביל אחרי הפעלה מחדש
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind     TEXT NOT NULL,
+    payload  TEXT NOT NULL,
+    created  TEXT NOT NULL,
+    finished TEXT,
+    tenant   TEXT NOT NULL DEFAULT 'main'
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    job_id  INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status  TEXT NOT NULL DEFAULT 'pending',
+    data    TEXT,
+    PRIMARY KEY (job_id, chat_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_deliveries_status ON deliveries(job_id, status);
+"""
+
+class Outbox:
+    """תור הודעות יוצאות עם נקודת שמירה לכל נמען"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        self._running = set()
+        self._personal = {}
+
+    def personal(self, kind):
+        """רישום סוג משימה עם תוכן אישי: async def fn(bot, chat_id, data) → הודעות.
+        שינויים ש-fn עושה ב-data נשמרים לפני השליחה, כך שניסיון חוזר לא חוזר עליהם"""
+        def register(fn):
+            self._personal[kind] = fn
+            return fn
+        return register
+
+    def open(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(OUTBOX_SCHEMA)
+            _add_tenant_column(self.conn, "jobs")
+            if "data" not in {row[1] for row in self.conn.execute("PRAGMA table_info(deliveries)")}:
+                with self.conn:
+                    self.conn.execute("ALTER TABLE deliveries ADD COLUMN data TEXT")
+            self._prune()
+        return self.conn
+
+    def _prune(self):
+        cutoff = (datetime.now() - timedelta(days=OUTBOX_KEEP_DAYS)).isoformat()
+        old = [row[0] for row in self.conn.execute(
+            "SELECT id FROM jobs WHERE finished IS NOT NULL AND finished < ?", (cutoff,))]
+        for job_id in old:
+            self.conn.execute("DELETE FROM deliveries WHERE job_id = ?", (job_id,))
+            self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        self.conn.commit()
+
+    def enqueue(self, kind, messages, chat_ids, data=None):
+        """רישום משימה (direct / broadcast / סוג אישי) של הקבוצה הנוכחית – נכתבת פעם אחת,
+        לפני כל שליחה. data: {chat_id: dict} למשימה אישית"""
+        conn = self.open()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (kind, payload, created, tenant) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(messages, ensure_ascii=False), datetime.now().isoformat(),
+                 current_tenant().key),
+            )
+            job_id = cur.lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO deliveries (job_id, chat_id, data) VALUES (?, ?, ?)",
+                ((job_id, int(chat_id), json.dumps(data[chat_id], ensure_ascii=False) if data else None)
+                 for chat_id in chat_ids),
+            )
+        return job_id
+
+    def _checkpoint(self, job_id, chat_id, status):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE deliveries SET status = ? WHERE job_id = ? AND chat_id = ?",
+                (status, job_id, chat_id),
+            )
+
+    def _save_data(self, job_id, chat_id, data):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE deliveries SET data = ? WHERE job_id = ? AND chat_id = ?",
+                (json.dumps(data, ensure_ascii=False), job_id, chat_id),
+            )
+
+    def results(self, job_id):
+        """{chat_id: (status, data)} של משימה"""
+        rows = self.open().execute("SELECT chat_id, status, data FROM deliveries WHERE job_id = ?", (job_id,))
+        return {chat_id: (status, json.loads(data) if data else {}) for chat_id, status, data in rows}
+
+    def unfinished(self):
+        return [row[0] for row in self.open().execute("SELECT id FROM jobs WHERE finished IS NULL ORDER BY id")]
+
+    def pending_deliveries(self):
+        return self.open().execute("SELECT COUNT(*) FROM deliveries WHERE status = 'pending'").fetchone()[0]
+
+    async def run(self, job_id, bot, on_progress=None):
+        """שליחה לכל הנמענים שעוד לא טופלו במשימה"""
+        if job_id in self._running:
+            return None
+        self._running.add(job_id)
+        try:
+            kind, payload, key = self.conn.execute(
+                "SELECT kind, payload, tenant FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            tenant = TENANTS.get(key)
+            states = {}
+            if tenant is None:
+                logger.error(f"Outbox job {job_id} belongs to unknown tenant {key}, dropping it")
+            else:
+                messages = json.loads(payload)
+                states = {chat_id: json.loads(data) if data else {} for chat_id, data in self.conn.execute(
+                    "SELECT chat_id, data FROM deliveries WHERE job_id = ? AND status = 'pending' ORDER BY chat_id",
+                    (job_id,))}
+            personal = self._personal.get(kind)
+
+            async def send(chat_id):
+                if personal is None:
+                    return await _send_payload(bot, chat_id, messages)
+                state = states[chat_id]
+                before = dict(state)
+                personal_messages = await personal(bot, chat_id, state)
+                if state != before:
+                    self._save_data(job_id, chat_id, state)
+                await _send_payload(bot, chat_id, personal_messages)
+
+            # כל מה שאינו direct הוא הפצה: נתיב bulk ודלי ההפצות
+            bulk = kind != "direct"
+            # חסימות (set_unreachable) נרשמות בקבוצה של המשימה
+            with use_tenant(tenant):
+                stats = await broadcast(
+                    list(states),
+                    send,
+                    on_progress=on_progress,
+                    on_result=lambda chat_id, status: self._checkpoint(job_id, chat_id, status),
+                    bucket=BROADCAST_BUCKET if bulk else None,
+                    lane="bulk" if bulk else None,
+                )
+            with self.conn:
+                self.conn.execute("UPDATE jobs SET finished = ? WHERE id = ?", (datetime.now().isoformat(), job_id))
+            return stats
+        finally:
+            self._running.discard(job_id)
+
+    async def send(self, bot, chat_ids, messages):
+        """שליחה ישירה דרך התור: נרשמת, נשלחת מיד ומחזירה מונים"""
+        return await self.run(self.enqueue("direct", messages, chat_ids), bot)
+
+    async def resume(self, bot):
+        """המשך משימות שלא הסתיימו לפני ההפעלה מחדש – כמה במקביל, כך שהפצה
+        ארוכה לא מעכבת הודעות ישירות שממתינות אחריה"""
+        slots = asyncio.Semaphore(OUTBOX_RESUME_CONCURRENCY)
+
+        async def resume_job(job_id):
+            async with slots:
+                stats = await self.run(job_id, bot)
+            if stats is not None:
+                logger.info(f"Resumed outbox job {job_id}: {stats}")
+
+        await asyncio.gather(*(resume_job(job_id) for job_id in self.unfinished()))
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+OUTBOX = Outbox(OUTBOX_FILE)
+
+# ══════════════════════════════════════════════════════════
+#                   טיימרים עמידים
+# ══════════════════════════════════════════════════════════
+# במקום משימת asyncio.sleep לכל הודעה: כל טיימר הוא שורה ב-SQLite, ובזיכרון
+# נשמרת רק ערימת מינימום של (זמן, מזהה). לולאה אחת ישנה עד הטיימר הקרוב
+# ומפעילה כל טיימר שהגיע זמנו כמשימה נפרדת – פעולה איטית לא מעכבת את השאר.
+# השורה נמחקת רק אחרי שהפעולה הצליחה; כישלון זמני נדחה ומנוסה שוב.
+
+TIMERS_FILE = os.environ.get("TIMERS_FILE", "timers.db")
+TIMER_CONCURRENCY = 100   # טיימרים שרצים במקביל לכל היותר
+TIMER_ATTEMPTS = 5        # ניסיונות לפני שמוותרים על טיימר
+TIMER_RETRY_BASE = 30     # שניות עד הניסיון השני; מוכפל בכל כישלון
+TIMER_RETRY_MAX = 3600
+
+TIMERS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS timers (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    due      REAL NOT NULL,
+    action   TEXT NOT NULL,
+    args     TEXT NOT NULL,
+    tenant   TEXT NOT NULL DEFAULT 'main',
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_timers_due ON timers(due);
+"""
+
+class TimerService:
+    """ערימת מינימום בזיכרון + טבלת timers לעמידות"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        self._heap = []        # (due, id) – ביטול מוחק רק את השורה, הרשומה בערימה מדולגת
+        self._actions = {}
+        self._wake = asyncio.Event()
+        self._task = None
+        self._slots = asyncio.Semaphore(TIMER_CONCURRENCY)
+        self._running = set()
+
+    def action(self, name):
+        """רישום פעולה: async def fn(bot, **args)"""
+        def register(fn):
+            self._actions[name] = fn
+            return fn
+        return register
+
+    def open(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(TIMERS_SCHEMA)
+            _add_tenant_column(self.conn, "timers")
+            if "attempts" not in {row[1] for row in self.conn.execute("PRAGMA table_info(timers)")}:
+                with self.conn:
+                    self.conn.execute("ALTER TABLE timers ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            self._heap = list(self.conn.execute("SELECT due, id FROM timers"))
+            heapq.heapify(self._heap)
+        return self.conn
+
+    def schedule(self, action, delay, **args):
+        """הרצת action בעוד delay שניות, בקבוצה הנוכחית. מחזיר מזהה לביטול"""
+        due = time.time() + delay
+        conn = self.open()
+        with conn:
+            timer_id = conn.execute(
+                "INSERT INTO timers (due, action, args, tenant) VALUES (?, ?, ?, ?)",
+                (due, action, json.dumps(args, ensure_ascii=False), current_tenant().key),
+            ).lastrowid
+        heapq.heappush(self._heap, (due, timer_id))
+        if self._heap[0][1] == timer_id:
+            self._wake.set()
+        return timer_id
+
+    def cancel(self, timer_id):
+        with self.open() as conn:
+            conn.execute("DELETE FROM timers WHERE id = ?", (timer_id,))
+
+    def scheduled(self, action):
+        """האם יש טיימר ממתין לפעולה הזו בקבוצה הנוכחית"""
+        return self.open().execute("SELECT 1 FROM timers WHERE action = ? AND tenant = ? LIMIT 1",
+                                   (action, current_tenant().key)).fetchone() is not None
+
+    def find(self, action):
+        """טיימרים ממתינים לפעולה בקבוצה הנוכחית: [(מזהה, args)]"""
+        rows = self.open().execute("SELECT id, args FROM timers WHERE action = ? AND tenant = ? ORDER BY due",
+                                   (action, current_tenant().key))
+        return [(timer_id, json.loads(args)) for timer_id, args in rows]
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _delete(self, timer_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM timers WHERE id = ?", (timer_id,))
+
+    def _retry(self, timer_id, delay):
+        due = time.time() + delay
+        with self.conn:
+            updated = self.conn.execute("UPDATE timers SET due = ?, attempts = attempts + 1 WHERE id = ?",
+                                        (due, timer_id)).rowcount
+        if updated:   # בוטל בזמן הריצה – לא חוזר לערימה
+            heapq.heappush(self._heap, (due, timer_id))
+            self._wake.set()
+
+    async def _fire(self, bot, timer_id):
+        """טיימר אחד – משימה נפרדת, כך שההקשר (הקבוצה) לא דולף לטיימרים אחרים"""
+        try:
+            row = self.conn.execute("SELECT action, args, tenant, attempts FROM timers WHERE id = ?",
+                                    (timer_id,)).fetchone()
+            if row is None:   # בוטל
+                return
+            action, args, key, attempts = row
+            fn = self._actions.get(action)
+            tenant = TENANTS.get(key)
+            if fn is None or tenant is None:
+                logger.error(f"Unknown timer action {action} or tenant {key} (timer {timer_id})")
+                self._delete(timer_id)
+                return
+            try:
+                CURRENT_TENANT.set(tenant)
+                await fn(bot, **json.loads(args))
+            except (BadRequest, Forbidden) as e:
+                # ניסיון חוזר לא ישנה את התשובה (הודעה שכבר נמחקה, משתמש שחסם)
+                logger.error(f"Timer {timer_id} ({action}) failed: {e}")
+            except Exception as e:
+                if attempts + 1 >= TIMER_ATTEMPTS:
+                    logger.error(f"Timer {timer_id} ({action}) failed {attempts + 1} times, giving up: {e}")
+                else:
+                    delay = min(TIMER_RETRY_BASE * 2 ** attempts, TIMER_RETRY_MAX)
+                    if isinstance(e, RetryAfter):
+                        delay = max(delay, float(e.retry_after))
+                    logger.warning(f"Timer {timer_id} ({action}) failed, retrying in {delay:.0f}s: {e}")
+                    self._retry(timer_id, delay)
+                    return
+            self._delete(timer_id)
+        finally:
+            self._slots.release()
+
+    async def _run(self, bot):
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._heap[0][0] - time.time() if self._heap else None
+            if delay is None or delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._slots.acquire()
+            if not self._heap or self._heap[0][0] > time.time():
+                self._slots.release()
+                continue
+            task = loop.create_task(self._fire(bot, heapq.heappop(self._heap)[1]))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def start(self, bot):
+        self.open()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(bot))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # טיימר שנקטע נשאר בטבלה ורץ שוב בהפעלה הבאה
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+TIMERS = TimerService(TIMERS_FILE)
+
+@TIMERS.action("cooldown_expired")
+async def _timer_cooldown_expired(bot, uid):
+    """סוף תקופת ההמתנה: תזכורת למשתמש שאפשר להגיש שוב (הניקוי – בסריקה)"""
+    data = load_data()
+    # דחייה נוספת האריכה את ההמתנה, או שכבר הגיש שוב
+    if STORE.cooldowns.remaining(uid) == 0 and str(uid) not in data["pending"] and str(uid) not in data["members"]:
+        await OUTBOX.send(bot, [uid], [_text_payload(
+            "🔔 תקופת ההמתנה הסתיימה – ניתן להגיש שוב בקשת הצטרפות דרך /start"
+        )])
 
 # ══════════════════════════════════════════════════════════
 #                     תפריט ראשי
@@ -105,28 +2190,31 @@ def find_member_by_number(data, number_str):
 async def start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """הצגת תפריט ראשי"""
     user = update.effective_user
-    is_admin = (user.id == ADMIN_ID)
+    # משתמש שחוזר לבוט כבר לא חוסם אותו
+    load_data()
+    STORE.clear_unreachable(user.id)
 
     buttons = [
-        [InlineKeyboardButton("📋 שאלון הצטרפות", callback_data="menu_questionnaire")],
-        [InlineKeyboardButton("🎭 הודעה אנונימית", callback_data="menu_anon")],
-        [InlineKeyboardButton("🤫 וידוי אנונימי", callback_data="menu_confession")],
-        [InlineKeyboardButton("🚨 דיווח על חשבון", callback_data="menu_report")],
-        [InlineKeyboardButton("💬 פנייה כללית למנהל", callback_data="menu_contact")],
+        [InlineKeyboardButton("📋 שאלון הצטרפות", callback_data=tenant_callback("menu_questionnaire"))],
+        [InlineKeyboardButton("🎭 הודעה אנונימית", callback_data=tenant_callback("menu_anon"))],
+        [InlineKeyboardButton("🤫 וידוי אנונימי", callback_data=tenant_callback("menu_confession"))],
+        [InlineKeyboardButton("🚨 דיווח על חשבון", callback_data=tenant_callback("menu_report"))],
+        [InlineKeyboardButton("💬 פנייה כללית למנהל", callback_data=tenant_callback("menu_contact"))],
     ]
 
-    if is_admin:
-        buttons.append([InlineKeyboardButton("⚠️ התראה לחבר", callback_data="menu_warn")])
-        buttons.append([InlineKeyboardButton("🚫 חסימת חבר", callback_data="menu_block")])
-        buttons.append([InlineKeyboardButton("📢 הפצת הודעה לקבוצה", callback_data="menu_broadcast")])
-        buttons.append([InlineKeyboardButton("📨 שליחת הודעה לכל המשתמשים", callback_data="menu_notify")])
-        buttons.append([InlineKeyboardButton("✉️ הודעה פרטית לחבר", callback_data="menu_dm")])
-        buttons.append([InlineKeyboardButton("📋 רשימת חברים", callback_data="menu_members")])
+    if is_admin(user.id):
+        buttons.append([InlineKeyboardButton("⚠️ התראה לחבר", callback_data=tenant_callback("menu_warn"))])
+        buttons.append([InlineKeyboardButton("🚫 חסימת חבר", callback_data=tenant_callback("menu_block"))])
+        buttons.append([InlineKeyboardButton("📢 הפצת הודעה לקבוצה", callback_data=tenant_callback("menu_broadcast"))])
+        buttons.append([InlineKeyboardButton("📨 שליחת הודעה לכל המשתמשים", callback_data=tenant_callback("menu_notify"))])
+        buttons.append([InlineKeyboardButton("✉️ הודעה פרטית לחבר", callback_data=tenant_callback("menu_dm"))])
+        buttons.append([InlineKeyboardButton("📋 רשימת חברים", callback_data=tenant_callback("menu_members"))])
+        buttons.append([InlineKeyboardButton("🗂 בקשות ממתינות", callback_data=tenant_callback("review:next"))])
 
     await update.message.reply_text(
         "שלום! 👋\n\n"
         "🔒 כל הנתונים מוגנים ומעובדים על ידי בוט בלבד.\n\n"
-        "בחר מה ברצונך לעשות:",
+        "בחר מה ברצונך לעשות:" + tenant_note(),
         reply_markup=InlineKeyboardMarkup(buttons)
     )
     return MENU
@@ -135,26 +2223,23 @@ async def menu_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """ניתוב מהתפריט לפי בחירה"""
     query = update.callback_query
     await query.answer()
-    choice = query.data
+    choice = callback_data(query)
 
     # ── שאלון הצטרפות ──
     if choice == "menu_questionnaire":
         user = query.from_user
-        data = load_data()
-        uid = str(user.id)
+        load_data()
 
         # בדיקת cooldown
-        if uid in data["cooldowns"]:
-            until = datetime.fromisoformat(data["cooldowns"][uid])
-            if datetime.now() < until:
-                remaining = until - datetime.now()
-                hours = int(remaining.total_seconds() // 3600)
-                mins  = int((remaining.total_seconds() % 3600) // 60)
-                await query.edit_message_text(
-                    f"❌ בקשתך נדחתה לאחרונה.\n"
-                    f"תוכל לנסות שוב בעוד {hours} שעות ו-{mins} דקות."
-                )
-                return ConversationHandler.END
+        remaining = STORE.cooldowns.remaining(user.id)
+        if remaining:
+            hours = int(remaining // 3600)
+            mins  = int((remaining % 3600) // 60)
+            await query.edit_message_text(
+                f"❌ בקשתך נדחתה לאחרונה.\n"
+                f"תוכל לנסות שוב בעוד {hours} שעות ו-{mins} דקות."
+            )
+            return ConversationHandler.END
 
         await query.edit_message_text(
             "📋 שאלון הצטרפות\n\n"
@@ -187,7 +2272,7 @@ async def menu_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # ── ניהול: התראה ──
     elif choice == "menu_warn":
-        if query.from_user.id != ADMIN_ID:
+        if not is_admin(query.from_user.id):
             await query.edit_message_text("❌ אין לך הרשאה לפעולה זו.")
             return ConversationHandler.END
         await query.edit_message_text(
@@ -199,7 +2284,7 @@ async def menu_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # ── ניהול: חסימה ──
     elif choice == "menu_block":
-        if query.from_user.id != ADMIN_ID:
+        if not is_admin(query.from_user.id):
             await query.edit_message_text("❌ אין לך הרשאה לפעולה זו.")
             return ConversationHandler.END
         await query.edit_message_text(
@@ -211,7 +2296,7 @@ async def menu_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # ── ניהול: הפצת הודעה ──
     elif choice == "menu_broadcast":
-        if query.from_user.id != ADMIN_ID:
+        if not is_admin(query.from_user.id):
             await query.edit_message_text("❌ אין לך הרשאה לפעולה זו.")
             return ConversationHandler.END
         await query.edit_message_text(
@@ -222,18 +2307,15 @@ async def menu_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # ── ניהול: רשימת חברים ──
     elif choice == "menu_members":
-        if query.from_user.id != ADMIN_ID:
+        if not is_admin(query.from_user.id):
             await query.edit_message_text("❌ אין לך הרשאה לפעולה זו.")
             return ConversationHandler.END
-        data = load_data()
-        if not data["members"]:
+        load_data()
+        if not len(STORE.members):
             await query.edit_message_text("אין חברים עדיין.")
             return ConversationHandler.END
-        lines = ["📋 רשימת חברים:\n"]
-        for uid, m in sorted(data["members"].items(), key=lambda x: x[1]["number"]):
-            warn_str = f" ⚠️×{m['warnings']}" if m["warnings"] > 0 else ""
-            lines.append(f"#{str(m['number']).zfill(3)} | {m['lastname']} | {m['village']} | {m['rank']}{warn_str}")
-        await query.edit_message_text("\n".join(lines))
+        text, markup = render_members_page("all", 0)
+        await query.edit_message_text(text, reply_markup=markup)
         return ConversationHandler.END
 
     # ── הודעה אנונימית ──
@@ -257,7 +2339,7 @@ async def menu_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # ── ניהול: שליחת הודעה לכל המשתמשים ──
     elif choice == "menu_notify":
-        if query.from_user.id != ADMIN_ID:
+        if not is_admin(query.from_user.id):
             await query.edit_message_text("❌ אין לך הרשאה לפעולה זו.")
             return ConversationHandler.END
         await query.edit_message_text(
@@ -268,7 +2350,7 @@ async def menu_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # ── ניהול: הודעה פרטית לחבר ──
     elif choice == "menu_dm":
-        if query.from_user.id != ADMIN_ID:
+        if not is_admin(query.from_user.id):
             await query.edit_message_text("❌ אין לך הרשאה לפעולה זו.")
             return ConversationHandler.END
         await query.edit_message_text(
@@ -303,10 +2385,21 @@ async def q_photo(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if not update.message.photo and not update.message.document:
         await update.message.reply_text("⚠️ אנא העלה תמונה או קובץ.")
         return Q_PHOTO
+    a = ctx.user_data["answers"]
     if update.message.photo:
-        ctx.user_data["answers"]["photo_id"] = update.message.photo[-1].file_id
+        photo = update.message.photo
+        a["photo_id"] = photo[-1].file_id
+        a["photo_unique_id"] = photo[-1].file_unique_id
+        # לטביעה מספיק הגודל הקטן ביותר שעדיין ברור – הורדה קטנה בהרבה מהמקור
+        a["photo_hash_id"] = next((p.file_id for p in photo if min(p.width, p.height) >= PHASH_MIN_SIDE),
+                                  photo[-1].file_id)
     else:
-        ctx.user_data["answers"]["photo_id"] = update.message.document.file_id
+        document = update.message.document
+        a["photo_id"] = document.file_id
+        a["photo_type"] = "document"
+        a["photo_unique_id"] = document.file_unique_id
+        if (document.mime_type or "").startswith("image/") and (document.file_size or 0) <= PHASH_MAX_BYTES:
+            a["photo_hash_id"] = document.file_id
     await update.message.reply_text("4️⃣ באיזו יחידה שירתת?")
     return Q_UNIT
 
@@ -326,33 +2419,19 @@ async def q_history(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     ctx.user_data["answers"]["history"] = update.message.text
     a = ctx.user_data["answers"]
     user = update.effective_user
-    data = load_data()
 
     # שמירה כממתין
-    data["pending"][str(user.id)] = {
-        "user_id": user.id,
-        "username": user.username or "",
-        "answers": a,
-        "timestamp": datetime.now().isoformat()
-    }
-    save_data(data)
-
-    # שליחה למנהל
-    admin_text = (
-        f"🔔 בקשת הצטרפות חדשה!\n\n"
-        f"👤 טלגרם: @{user.username or 'אין'} (ID: {user.id})\n"
-        f"שם משפחה: {a['lastname']}\n"
-        f"כפר/עיר: {a['village']}\n"
-        f"יחידה: {a['unit']}\n"
-        f"דרגה: {a['rank']}\n"
-        f"תשובה היסטורית: {a['history']}"
-    )
-    keyboard = [[
-        InlineKeyboardButton("✅ אשר", callback_data=f"approve_{user.id}"),
-        InlineKeyboardButton("❌ דחה",  callback_data=f"reject_{user.id}")
-    ]]
-    await ctx.bot.send_message(ADMIN_ID, admin_text, reply_markup=InlineKeyboardMarkup(keyboard))
-    await ctx.bot.send_photo(ADMIN_ID, a["photo_id"], caption="תעודת המבקש")
+    with STORE.event("applied", actor=user.id, uid=user.id):
+        STORE.put_pending(user.id, {
+            "user_id": user.id,
+            "username": user.username or "",
+            "answers": a,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    # המנהל מקבל התראה מרוכזת ועובר על התור ב-/review; עד אז התעודה נבדקת מול קודמות
+    TIMERS.schedule("photo_check", 0, uid=user.id)
+    schedule_review_digest()
 
     # הודעה למשתמש
     await update.message.reply_text(
@@ -361,6 +2440,165 @@ async def q_history(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     )
     return ConversationHandler.END
 
+# ── תעודות חוזרות ────────────────────────────────────────
+# כל תעודה שהוגשה נכנסת לאינדקס (PHOTO_INDEX_FILE, append-only לכל קבוצה):
+# file_unique_id וטביעה תפיסתית (pHash של 64 ביט). תעודה חדשה מושווית לכל
+# הקודמות: אותו file_unique_id – זהה בלי להוריד כלום; אחרת הורדה אחת של גודל
+# קטן, pHash, וחיפוש באינדקס multi-index במרחק Hamming עד PHOTO_MATCH_BITS –
+# בלי לעבור על כל הטביעות. התאמות נשמרות בבקשה ומוצגות למנהל ב-/review.
+# הבדיקה היא טיימר (photo_check) כדי שתשרוד הפעלה מחדש.
+
+PHOTO_INDEX_FILE = os.environ.get("PHOTO_INDEX_FILE", "photo_hashes.tsv")
+PHOTO_MATCH_BITS = int(os.environ.get("PHOTO_MATCH_BITS", "8"))   # מתוך 64
+PHOTO_MATCHES_SHOWN = 5
+PHASH_SIZE = 32          # התמונה מוקטנת ל-32×32 אפור לפני ה-DCT
+PHASH_MIN_SIDE = 320     # גודל התמונה שמורד לטביעה
+PHASH_MAX_BYTES = 10 * 1024 * 1024
+PHASH_CHUNKS = 5         # קטעים של 13 ביט באינדקס
+PHASH_CHUNK_BITS = 13
+_PHASH_DCT = [[math.cos(math.pi * (2 * x + 1) * u / (2 * PHASH_SIZE)) for x in range(PHASH_SIZE)]
+              for u in range(8)]
+
+def perceptual_hash(data):
+    """pHash: 32×32 אפור → DCT → 8×8 התדרים הנמוכים, ביט לכל מקדם מעל החציון"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("L").resize((PHASH_SIZE, PHASH_SIZE), Image.Resampling.LANCZOS)
+        pixels = image.tobytes()   # mode "L": בית לכל פיקסל (getdata יוצא משימוש ב-Pillow 14)
+    rows = [pixels[y * PHASH_SIZE:(y + 1) * PHASH_SIZE] for y in range(PHASH_SIZE)]
+    # DCT נפרד: 8 תדרים לכל שורה, ואז 8 לכל עמודה של התוצאה
+    partial = [[sum(c * p for c, p in zip(_PHASH_DCT[u], row)) for u in range(8)] for row in rows]
+    coeffs = [sum(_PHASH_DCT[v][y] * partial[y][u] for y in range(PHASH_SIZE)) for v in range(8) for u in range(8)]
+    low = coeffs[1:]   # בלי רכיב ה-DC (הבהירות הכללית)
+    median = sorted(low)[len(low) // 2]
+    return sum(1 << i for i, c in enumerate(low) if c > median)
+
+class HashIndex:
+    """חיפוש טביעות במרחק Hamming בשיטת multi-index: הטביעה מחולקת ל-PHASH_CHUNKS
+    קטעים, ולפי שובך היונים טביעה במרחק r נבדלת בקטע אחד לפחות ב-r // PHASH_CHUNKS
+    ביטים לכל היותר. מחפשים רק בדליים של הקטעים הקרובים ובודקים את המועמדים"""
+
+    def __init__(self):
+        self.tables = [{} for _ in range(PHASH_CHUNKS)]   # לכל קטע: ערך → [(טביעה, פריט)]
+
+    @staticmethod
+    def _chunks(fingerprint):
+        return [(fingerprint >> (i * PHASH_CHUNK_BITS)) & ((1 << PHASH_CHUNK_BITS) - 1) for i in range(PHASH_CHUNKS)]
+
+    def add(self, fingerprint, item):
+        for table, chunk in zip(self.tables, self._chunks(fingerprint)):
+            table.setdefault(chunk, []).append((fingerprint, item))
+
+    def search(self, fingerprint, radius):
+        """[(מרחק, פריט)] עד radius"""
+        flips = [0]
+        for r in range(1, radius // PHASH_CHUNKS + 1):
+            flips += [sum(1 << b for b in bits) for bits in itertools.combinations(range(PHASH_CHUNK_BITS), r)]
+        found = {}
+        for table, chunk in zip(self.tables, self._chunks(fingerprint)):
+            for flip in flips:
+                for other, item in table.get(chunk ^ flip, ()):
+                    distance = (fingerprint ^ other).bit_count()
+                    if distance <= radius:
+                        found[(other, item)] = distance
+        return [(distance, item) for (_, item), distance in found.items()]
+
+class PhotoIndex:
+    """טביעות התעודות של כל הבקשות בקבוצה. שורה בקובץ: file_unique_id <TAB> phash|- <TAB> user_id"""
+
+    def __init__(self, path):
+        self.path = path
+        self.index = HashIndex()
+        self.files = {}   # file_unique_id → [phash, {uid}]
+        self._opened = False
+
+    def _open(self):
+        if self._opened:
+            return
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 3:
+                        continue   # שורה חלקית מקריסה
+                    self._index(parts[0], None if parts[1] == "-" else int(parts[1], 16), int(parts[2]))
+        self._opened = True
+
+    def _index(self, unique_id, phash, uid):
+        entry = self.files.setdefault(unique_id, [None, set()])
+        if uid in entry[1]:
+            return
+        entry[1].add(uid)
+        entry[0] = entry[0] if phash is None else phash
+        if phash is not None:
+            self.index.add(phash, uid)
+
+    def phash(self, unique_id):
+        """הטביעה של קובץ שכבר נראה (אין צורך להוריד שוב), או None"""
+        self._open()
+        entry = self.files.get(unique_id)
+        return entry[0] if entry else None
+
+    def matches(self, unique_id, phash, uid):
+        """[[uid, מרחק]] של מבקשים אחרים עם אותה תעודה או דומה, מהקרובה"""
+        self._open()
+        found = dict.fromkeys(self.files.get(unique_id, (None, ()))[1], 0)
+        if phash is not None:
+            for distance, other in self.index.search(phash, PHOTO_MATCH_BITS):
+                found[other] = min(distance, found.get(other, distance))
+        found.pop(uid, None)
+        return sorted(([other, distance] for other, distance in found.items()), key=lambda m: m[1])[:PHOTO_MATCHES_SHOWN]
+
+    def add(self, unique_id, phash, uid):
+        self._open()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(f"{unique_id}\t{'-' if phash is None else f'{phash:016x}'}\t{uid}\n")
+        self._index(unique_id, phash, uid)
+
+async def _download_phash(bot, file_id):
+    file = await bot.get_file(file_id)
+    data = await file.download_as_bytearray()
+    # פענוח התמונה וה-DCT בת'רד – לא עוצרים את הלולאה
+    return await asyncio.to_thread(perceptual_hash, bytes(data))
+
+@TIMERS.action("photo_check")
+async def _timer_photo_check(bot, uid):
+    """השוואת התעודה של בקשה חדשה לכל הקודמות ורישום בבקשה אם נמצאה דומה"""
+    pending = load_data()["pending"].get(str(uid))
+    unique_id = pending and pending["answers"].get("photo_unique_id")
+    if not unique_id:
+        return
+    phash = PHOTO_INDEX.phash(unique_id)
+    hash_id = pending["answers"].get("photo_hash_id")
+    if phash is None and hash_id and Image is not None:
+        try:
+            phash = await _download_phash(bot, hash_id)
+        except Exception as e:
+            logger.warning(f"Could not hash ID photo of {uid}: {e}")
+    matches = PHOTO_INDEX.matches(unique_id, phash, uid)
+    PHOTO_INDEX.add(unique_id, phash, uid)
+    if not matches:
+        return
+    logger.info(f"ID photo of {uid} resembles {matches}")
+    async with RECORD_LOCKS.lock(f"pending:{uid}"):
+        pending = load_data()["pending"].get(str(uid))
+        if pending is not None:
+            with STORE.event("photo_flagged", uid=uid, matches=matches):
+                STORE.put_pending(uid, dict(pending, answers=dict(pending["answers"], photo_matches=matches)))
+
+def _photo_matches_line(matches):
+    data = load_data()
+    parts = []
+    for other, distance in matches:
+        member = STORE.members.by_uid(other)
+        if member:
+            who = f"חבר #{str(member['number']).zfill(3)}"
+        elif str(other) in data["pending"]:
+            who = "ממתין"
+        else:
+            who = "לא חבר"
+        parts.append(f"{other} ({who}{', אותו קובץ' if distance == 0 else ''})")
+    return "⚠️ תעודה דומה לזו של: " + ", ".join(parts)
+
 # ══════════════════════════════════════════════════════════
 #                  דיווח על חשבון
 # ══════════════════════════════════════════════════════════
@@ -386,7 +2624,7 @@ async def report_reason(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         f"מדווח על חבר מספר: #{member_num}\n"
         f"סיבה: {reason}"
     )
-    await ctx.bot.send_message(ADMIN_ID, admin_text)
+    await OUTBOX.send(ctx.bot, admin_ids(), [_text_payload(admin_text + tenant_note())])
 
     await update.message.reply_text(
         "✅ פנייתך בטיפול, תהליך זה יכול לקחת עד 48 שעות.\n"
@@ -407,7 +2645,7 @@ async def contact_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         f"מאת: @{user.username or 'אין'} (ID: {user.id})\n"
         f"הודעה: {update.message.text}"
     )
-    await ctx.bot.send_message(ADMIN_ID, admin_text)
+    await OUTBOX.send(ctx.bot, admin_ids(), [_text_payload(admin_text + tenant_note())])
 
     await update.message.reply_text(
         "✅ פנייתך בטיפול, תהליך זה יכול לקחת עד 48 שעות.\n"
@@ -421,41 +2659,48 @@ async def contact_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def admin_warn_num(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """מנהל: קבלת מספר חבר ושליחת אזהרה"""
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return ConversationHandler.END
 
-    data = load_data()
-    target_uid, target_member = find_member_by_number(data, update.message.text.strip())
+    target_uid, target_member = find_member_by_number(update.message.text)
 
     if not target_member:
         await update.message.reply_text("❌ חבר לא נמצא. נסה שוב עם /start")
         return ConversationHandler.END
 
-    target_member["warnings"] += 1
-    save_data(data)
-    warn_count = target_member["warnings"]
+    async with RECORD_LOCKS.lock(f"member:{target_uid}"):
+        # ייתכן שהחבר הוצא בזמן שחיכינו למנעול
+        target_member = STORE.members.by_uid(target_uid)
+        if not target_member:
+            await update.message.reply_text("❌ חבר לא נמצא. נסה שוב עם /start")
+            return ConversationHandler.END
+
+        target_member["warnings"] += 1
+        with STORE.event("warned", actor=update.effective_user.id, uid=target_uid):
+            STORE.put_member(target_uid, target_member)
+        warn_count = target_member["warnings"]
 
-    if warn_count == 1:
-        await ctx.bot.send_message(
-            target_uid,
-            f"⚠️ קיבלת אזהרה ראשונה על עבירת הנחיות הקבוצה.\n"
-            f"בעבירה הבאה תוצא מהקבוצה."
-        )
-        await update.message.reply_text(
-            f"⚠️ אזהרה ראשונה נשלחה לחבר #{str(target_member['number']).zfill(3)}"
-        )
-    else:
-        # הוצאה מהקבוצה
-        try:
-            await ctx.bot.ban_chat_member(GROUP_ID, target_uid)
-            await ctx.bot.send_message(target_uid, "❌ הוצאת מהקבוצה עקב עבירה חוזרת על ההנחיות.")
-        except Exception as e:
-            logger.error(f"Could not ban {target_uid}: {e}")
-        del data["members"][str(target_uid)]
-        save_data(data)
-        await update.message.reply_text(
-            f"🚫 חבר #{str(target_member['number']).zfill(3)} הוצא מהקבוצה"
-        )
+        if warn_count == 1:
+            await ctx.bot.send_message(
+                target_uid,
+                f"⚠️ קיבלת אזהרה ראשונה על עבירת הנחיות הקבוצה.\n"
+                f"בעבירה הבאה תוצא מהקבוצה."
+            )
+            await update.message.reply_text(
+                f"⚠️ אזהרה ראשונה נשלחה לחבר #{str(target_member['number']).zfill(3)}"
+            )
+        else:
+            # הוצאה מהקבוצה
+            try:
+                await ctx.bot.ban_chat_member(current_tenant().group_id, target_uid)
+                await ctx.bot.send_message(target_uid, "❌ הוצאת מהקבוצה עקב עבירה חוזרת על ההנחיות.")
+            except Exception as e:
+                logger.error(f"Could not ban {target_uid}: {e}")
+            with STORE.event("kicked", actor=update.effective_user.id, uid=target_uid):
+                STORE.delete_member(target_uid)
+            await update.message.reply_text(
+                f"🚫 חבר #{str(target_member['number']).zfill(3)} הוצא מהקבוצה"
+            )
 
     return ConversationHandler.END
 
@@ -465,26 +2710,30 @@ async def admin_warn_num(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def admin_block_num(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """מנהל: קבלת מספר חבר וחסימה מיידית"""
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return ConversationHandler.END
 
-    data = load_data()
-    target_uid, target_member = find_member_by_number(data, update.message.text.strip())
+    target_uid, target_member = find_member_by_number(update.message.text)
 
     if not target_member:
         await update.message.reply_text("❌ חבר לא נמצא. נסה שוב עם /start")
         return ConversationHandler.END
 
-    member_num = str(target_member['number']).zfill(3)
+    async with RECORD_LOCKS.lock(f"member:{target_uid}"):
+        if not STORE.members.by_uid(target_uid):
+            await update.message.reply_text("❌ חבר לא נמצא. נסה שוב עם /start")
+            return ConversationHandler.END
 
-    try:
-        await ctx.bot.ban_chat_member(GROUP_ID, target_uid)
-        await ctx.bot.send_message(target_uid, "❌ הוצאת מהקבוצה על ידי המנהל.")
-    except Exception as e:
-        logger.error(f"Could not ban {target_uid}: {e}")
+        member_num = str(target_member['number']).zfill(3)
+
+        try:
+            await ctx.bot.ban_chat_member(current_tenant().group_id, target_uid)
+            await ctx.bot.send_message(target_uid, "❌ הוצאת מהקבוצה על ידי המנהל.")
+        except Exception as e:
+            logger.error(f"Could not ban {target_uid}: {e}")
 
-    del data["members"][str(target_uid)]
-    save_data(data)
+        with STORE.event("banned", actor=update.effective_user.id, uid=target_uid):
+            STORE.delete_member(target_uid)
 
     await update.message.reply_text(f"🚫 חבר #{member_num} נחסם והוצא מהקבוצה.")
     return ConversationHandler.END
@@ -495,74 +2744,395 @@ async def admin_block_num(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def admin_broadcast_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """מנהל: שליחת הודעה/תמונה/סרטון לקבוצה דרך הבוט"""
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return ConversationHandler.END
 
-    try:
-        if update.message.photo:
-            await ctx.bot.send_photo(
-                GROUP_ID,
-                update.message.photo[-1].file_id,
-                caption=update.message.caption or ""
-            )
-        elif update.message.video:
-            await ctx.bot.send_video(
-                GROUP_ID,
-                update.message.video.file_id,
-                caption=update.message.caption or ""
-            )
-        elif update.message.text:
-            await ctx.bot.send_message(GROUP_ID, update.message.text)
-        else:
-            await update.message.reply_text("⚠️ נתמך רק טקסט, תמונה או סרטון.")
-            return ADMIN_BROADCAST_MSG
+    if update.message.media_group_id:
+        collect_album(update, ctx, lambda album: _post_broadcast(ctx.bot, update.message, _album_payload(album)))
+        return ConversationHandler.END
 
-        await update.message.reply_text("✅ ההודעה נשלחה לקבוצה בהצלחה.")
-    except Exception as e:
-        logger.error(f"Could not send broadcast: {e}")
-        await update.message.reply_text("❌ שגיאה בשליחת ההודעה לקבוצה.")
+    messages = _payload_from_message(update.message)
+    if not messages:
+        await update.message.reply_text("⚠️ נתמך רק טקסט, תמונה או סרטון.")
+        return ADMIN_BROADCAST_MSG
 
+    await _post_broadcast(ctx.bot, update.message, messages)
     return ConversationHandler.END
 
+async def _post_broadcast(bot, message, messages):
+    stats = await OUTBOX.send(bot, [current_tenant().group_id], messages)
+    if stats["sent"]:
+        await message.reply_text("✅ ההודעה נשלחה לקבוצה בהצלחה.")
+    else:
+        await message.reply_text("❌ שגיאה בשליחת ההודעה לקבוצה.")
+
+# ══════════════════════════════════════════════════════════
+#                  סינון תוכן
+# ══════════════════════════════════════════════════════════
+# הודעות אנונימיות ווידויים נבדקים לפני השליחה לקבוצה: רשימת ביטויים חסומים
+# לכל קבוצה (BLOCKLIST_FILE, נערכת ב-/filter) באוטומט Aho–Corasick אחד – מעבר
+# יחיד על ההודעה, בלי קשר למספר הביטויים – ועוד ביטויים רגולריים לטלפון ולת"ז.
+# הטקסט והביטויים עוברים אותו נרמול: בלי ניקוד / תשכיל, אותיות סופיות ווריאנטים
+# של אלף/יא כאות הבסיס, אותיות חוזרות כאות אחת ("שששש" = "ש"), וסימנים בתוך
+# מילה נמחקים. ביטוי תואם מילה שלמה; "*" בתחילתו / בסופו – גם כחלק ממילה.
+# האוטומט נבנה פעם אחת ונבנה מחדש רק כשהרשימה משתנה (פקודה או עריכת הקובץ).
+
+BLOCKLIST_FILE = os.environ.get("BLOCKLIST_FILE", "blocklist.txt")
+BLOCKLIST_RELOAD_INTERVAL = 5   # שניות בין בדיקות שינוי בקובץ
+
+# ניקוד טעמים ותשכיל, תטוויל, ותווי כיווניות / רוחב אפס
+_TEXT_MARKS = re.compile("[\u0591-\u05c7\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640"
+                         "\u200b-\u200f\u202a-\u202e\u2066-\u2069]")
+# str.replace לכל זוג – מהיר בהרבה מ-str.translate עם מילון על טקסט שאינו ASCII
+_TEXT_FOLD = (
+    ("ך", "כ"), ("ם", "מ"), ("ן", "נ"), ("ף", "פ"), ("ץ", "צ"),
+    ("أ", "ا"), ("إ", "ا"), ("آ", "ا"), ("ٱ", "ا"), ("ى", "ي"), ("ئ", "ي"), ("ؤ", "و"), ("ة", "ه"),
+    ("_", " "),
+)
+_TEXT_PUNCT = re.compile(r"[^\w\s]+")
+_TEXT_REPEATS = re.compile(r"(.)\1+")
+
+def normalize_text(text):
+    """הצורה שבה נבדקים טקסט וביטויים – עם רווח בקצוות כגבול מילה"""
+    text = _TEXT_MARKS.sub("", unicodedata.normalize("NFKC", text).lower())
+    for variant, base in _TEXT_FOLD:
+        text = text.replace(variant, base)
+    text = " ".join(_TEXT_PUNCT.sub("", text).split())
+    return _TEXT_REPEATS.sub(r"\1", f" {text} ")
+
+class PatternMatcher:
+    """Aho–Corasick: trie של כל הביטויים + קישורי כשלון, חיפוש במעבר אחד"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]    # מצב → {תו: מצב}
+        self.out = [None]   # הביטוי שמסתיים במצב (גם דרך קישור הכשלון)
+        for pattern in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = self.goto[state][ch] = len(self.goto)
+                    self.goto.append({})
+                    self.out.append(None)
+                state = nxt
+            self.out[state] = pattern
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(ch, 0) if state else 0
+                if self.out[nxt] is None:
+                    self.out[nxt] = self.out[self.fail[nxt]]
+                queue.append(nxt)
+
+    def __len__(self):
+        return len(self.goto)
+
+    def search(self, text):
+        """הביטוי הראשון שמופיע בטקסט, או None"""
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state] is not None:
+                return out[state]
+        return None
+
+def _blocklist_pattern(entry):
+    """שורה ברשימה → הביטוי המנורמל (רווח בקצה = גבול מילה)"""
+    pattern = normalize_text(entry.strip("*"))
+    if entry.startswith("*"):
+        pattern = pattern.lstrip(" ")
+    if entry.endswith("*"):
+        pattern = pattern.rstrip(" ")
+    return pattern if pattern.strip() else None
+
+_DIGIT_FOLD = str.maketrans({**{chr(0x660 + i): str(i) for i in range(10)},
+                             **{chr(0x6f0 + i): str(i) for i in range(10)}})
+# ישראלי: נייד / קווי / 07X, עם או בלי 972+, עם מפרידים בין הספרות
+PHONE_RE = re.compile(r"(?<![\d+])(?:\+?972[\s.-]?|0)(?:5\d|7\d|[23489])(?:[\s.-]?\d){7}(?!\d)")
+PERSONAL_ID_RE = re.compile(r"(?<!\d)\d{9}(?!\d)")
+
+CONTENT_REASONS = {
+    "blocklist": "ההודעה מכילה ביטוי שאסור בקבוצה",
+    "phone": "ההודעה מכילה מספר טלפון",
+    "id": "ההודעה מכילה מספר תעודת זהות",
+}
+
+def _valid_personal_id(digits):
+    """ספרת ביקורת של ת"ז – בלי זה כל מספר בן 9 ספרות היה נחסם"""
+    total = 0
+    for i, d in enumerate(digits):
+        n = int(d) * (1 + i % 2)
+        total += n - 9 if n > 9 else n
+    return total % 10 == 0
+
+class ContentFilter:
+    """רשימת החסימה של קבוצה והאוטומט שנבנה ממנה"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self.matcher = PatternMatcher(())
+        self._mtime = None
+        self._checked = 0.0
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked < BLOCKLIST_RELOAD_INTERVAL:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._load()
+
+    def _load(self):
+        entries = []
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        started = time.perf_counter()
+        self.matcher = PatternMatcher(filter(None, map(_blocklist_pattern, entries)))
+        self.entries = entries
+        logger.info(f"Blocklist {self.path}: {len(entries)} entries, {len(self.matcher)} states, "
+                    f"built in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    def check(self, text):
+        """קוד הסיבה לחסימה (CONTENT_REASONS) או None"""
+        self._reload_if_changed()
+        if not text:
+            return None
+        if self.matcher.search(normalize_text(text)) is not None:
+            return "blocklist"
+        digits = text.translate(_DIGIT_FOLD)
+        if PHONE_RE.search(digits):
+            return "phone"
+        if any(_valid_personal_id(m.group()) for m in PERSONAL_ID_RE.finditer(digits)):
+            return "id"
+        return None
+
+    def _save(self, entries):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(f"{entry}\n" for entry in entries))
+        os.replace(tmp, self.path)
+        # בנייה מחדש מיד ובלי תלות ב-mtime: שתי עריכות באותו tick של השעון נראות זהות
+        self._checked = time.monotonic()
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._load()
+
+    def add(self, entry):
+        self._reload_if_changed()
+        if entry in self.entries or _blocklist_pattern(entry) is None:
+            return False
+        self._save(self.entries + [entry])
+        return True
+
+    def remove(self, entry):
+        self._reload_if_changed()
+        if entry not in self.entries:
+            return False
+        self._save([e for e in self.entries if e != entry])
+        return True
+
+async def content_rejected(message, texts):
+    """בדיקה לפני שליחה לקבוצה: אם משהו נחסם – הסבר לשולח ו-True"""
+    for text in texts:
+        reason = CONTENT_FILTER.check(text)
+        if reason:
+            CONTENT_BLOCKED.inc(reason=reason)
+            logger.info(f"Held back anonymous post from {message.from_user.id} ({reason})")
+            await message.reply_text(f"⚠️ {CONTENT_REASONS[reason]} – היא לא נשלחה.\n"
+                                     "ניתן לנסח מחדש ולשלוח שוב.")
+            return True
+    return False
+
+FILTER_LIST_CHARS = 3500
+
+async def admin_filter(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """מנהל: /filter [add|del|test <ביטוי>] – רשימת הביטויים החסומים"""
+    if not is_admin(update.effective_user.id):
+        return
+    action, _, entry = update.message.text.partition(" ")[2].strip().partition(" ")
+    entry = entry.strip()
+    if action == "add" and entry:
+        done = CONTENT_FILTER.add(entry)
+        await update.message.reply_text(f"✅ נוסף: {entry}" if done else "הביטוי כבר ברשימה או ריק.")
+    elif action == "del" and entry:
+        done = CONTENT_FILTER.remove(entry)
+        await update.message.reply_text(f"🗑 הוסר: {entry}" if done else "הביטוי לא ברשימה.")
+    elif action == "test" and entry:
+        reason = CONTENT_FILTER.check(entry)
+        await update.message.reply_text(f"🚫 {CONTENT_REASONS[reason]}" if reason else "✅ עובר את הסינון")
+    else:
+        CONTENT_FILTER.check("")   # טעינה אם הקובץ השתנה
+        listing = "\n".join(CONTENT_FILTER.entries)[:FILTER_LIST_CHARS] or "(ריקה)"
+        await update.message.reply_text(
+            f"🧹 ביטויים חסומים ({len(CONTENT_FILTER.entries)}):\n{listing}\n\n"
+            "/filter add <ביטוי> · /filter del <ביטוי> · /filter test <טקסט>\n"
+            "* בתחילת/סוף ביטוי – גם כחלק ממילה. טלפונים ות\"ז נחסמים תמיד."
+        )
+
+# ── הגבלת קצב וכפילויות ─────────────────────────────────
+# כל פרסום אנונימי הוא שליחה לקבוצה. לכל משתמש דלי אסימונים (ANON_BURST ברצף,
+# ANON_PER_HOUR בשעה), ופרסום שזהה או כמעט זהה לפרסום מ-ANON_DUPLICATE_HOURS
+# האחרונות נחסם – גם ממשתמש אחר: טקסט לפי SimHash של רצפי 3 תווים מהטקסט
+# המנורמל (מרחק Hamming עד ANON_DUPLICATE_BITS), מדיה לפי file_unique_id.
+# הכל בזיכרון ומוגבל בגודל (LRU / TTL) – אחרי הפעלה מחדש מתחילים מאפס.
+
+ANON_BURST            = int(os.environ.get("ANON_BURST", "3"))
+ANON_PER_HOUR         = float(os.environ.get("ANON_PER_HOUR", "10"))
+ANON_DUPLICATE_HOURS  = float(os.environ.get("ANON_DUPLICATE_HOURS", "6"))
+ANON_DUPLICATE_BITS   = 10     # מתוך 64; בהודעות קצרות שינוי קטן מזיז 4–8 ביטים, הודעה אחרת ~32
+ANON_DUPLICATE_MIN_CHARS = 20  # טקסט קצר יותר ("תודה!") לא נבדק לכפילות
+ANON_TRACKED_USERS    = 10000  # דליים בזיכרון; מי שנפלט מתחיל בדלי מלא
+ANON_RECENT_MAX       = 2000   # טביעות טקסט / מדיה שנשמרות
+
+def simhash(text, width=3):
+    """טביעת 64 ביט שמשתנה מעט כשהטקסט משתנה מעט. hash() יציב רק בתוך התהליך –
+    מספיק, כי הטביעות לא נשמרות לדיסק"""
+    shingles = {text[i:i + width] for i in range(max(1, len(text) - width + 1))}
+    # עמודה לכל ביט (zip על מחרוזות בינאריות – בלי לולאת Python על 64 ביטים לכל shingle)
+    rows = [format(hash(shingle) & 0xFFFFFFFFFFFFFFFF, "064b") for shingle in shingles]
+    majority = len(rows) / 2
+    return int("".join("1" if column.count("1") > majority else "0" for column in zip(*rows)), 2)
+
+def _media_ids(messages):
+    ids = []
+    for message in messages:
+        if message.photo:
+            ids.append(message.photo[-1].file_unique_id)
+        elif message.video:
+            ids.append(message.video.file_unique_id)
+    return ids
+
+class PostGuard:
+    """הגבלת קצב לכל משתמש + פרסומים אחרונים של הקבוצה"""
+
+    def __init__(self):
+        self.buckets = OrderedDict()   # uid → TokenBucket, מהפחות לאחרונה שימוש
+        self.texts = OrderedDict()     # מונה → (תפוגה, simhash), לפי זמן
+        self.media = OrderedDict()     # file_unique_id → (תפוגה, None), לפי זמן
+        self._serial = 0
+
+    def _expire(self):
+        now = time.monotonic()
+        for recent in (self.texts, self.media):
+            while recent and (len(recent) > ANON_RECENT_MAX or next(iter(recent.values()))[0] <= now):
+                recent.popitem(last=False)
+
+    @staticmethod
+    def _fingerprints(texts):
+        normalized = (normalize_text(text) for text in texts if text)
+        return [simhash(text) for text in normalized if len(text) >= ANON_DUPLICATE_MIN_CHARS]
+
+    def duplicate(self, texts, media):
+        self._expire()
+        if any(file_id in self.media for file_id in media):
+            return True
+        return any((fingerprint ^ seen).bit_count() <= ANON_DUPLICATE_BITS
+                   for fingerprint in self._fingerprints(texts) for _, seen in self.texts.values())
+
+    def remember(self, texts, media):
+        """רישום פרסום. מחזיר את מה שנרשם – ל-release אם הפרסום לא יצא"""
+        expires = time.monotonic() + ANON_DUPLICATE_HOURS * 3600
+        serials = []
+        for fingerprint in self._fingerprints(texts):
+            self._serial += 1
+            self.texts[self._serial] = (expires, fingerprint)
+            serials.append(self._serial)
+        for file_id in media:
+            self.media.pop(file_id, None)
+            self.media[file_id] = (expires, None)
+        self._expire()
+        return serials, list(media)
+
+    def release(self, uid, entry):
+        """השליחה לקבוצה נכשלה: ביטול remember והחזרת האסימון, כדי שניסיון חוזר
+        לא ייחסם ככפילות של פרסום שלא הופיע"""
+        serials, media = entry
+        for serial in serials:
+            self.texts.pop(serial, None)
+        for file_id in media:
+            self.media.pop(file_id, None)
+        bucket = self.buckets.get(uid)
+        if bucket is not None:
+            bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+
+    def wait(self, uid):
+        """0 ואסימון נלקח, או שניות עד שיתפנה אחד"""
+        bucket = self.buckets.pop(uid, None) or TokenBucket(ANON_PER_HOUR / 3600, ANON_BURST)
+        self.buckets[uid] = bucket
+        if len(self.buckets) > ANON_TRACKED_USERS:
+            self.buckets.popitem(last=False)
+        if bucket.try_acquire():
+            return 0
+        return (1 - bucket.tokens) / bucket.rate
+
+async def anon_admit(message, texts, media=()):
+    """כל הבדיקות לפני פרסום אנונימי, לפני כל שליחה לקבוצה. None – לא לשלוח (השולח
+    קיבל הסבר); אחרת הרישום ב-POST_GUARD, שמשוחרר ב-_send_anon אם השליחה נכשלה.
+    הרישום נעשה כבר כאן ולא אחרי השליחה – פרסום זהה במקביל ייחסם"""
+    if await content_rejected(message, texts):
+        return None
+    if POST_GUARD.duplicate(texts, media):
+        reason, reply = "duplicate", "♻️ הודעה זהה או דומה מאוד פורסמה לאחרונה – היא לא נשלחה."
+    elif wait := POST_GUARD.wait(message.from_user.id):
+        reason, reply = "rate", (f"⏳ נשלחו ממך הרבה הודעות אנונימיות בזמן קצר.\n"
+                                 f"ניתן לשלוח שוב בעוד {max(1, round(wait / 60))} דקות.")
+    else:
+        return POST_GUARD.remember(texts, media)
+    CONTENT_BLOCKED.inc(reason=reason)
+    logger.info(f"Held back anonymous post from {message.from_user.id} ({reason})")
+    await message.reply_text(reply)
+    return None
+
+async def _send_anon(bot, message, messages, admitted):
+    """שליחה לקבוצה של פרסום שעבר את anon_admit. True אם נשלח"""
+    stats = await OUTBOX.send(bot, [current_tenant().group_id], messages)
+    if not stats["sent"]:
+        POST_GUARD.release(message.from_user.id, admitted)
+    return bool(stats["sent"])
+
 # ══════════════════════════════════════════════════════════
 #                  הודעה אנונימית
 # ══════════════════════════════════════════════════════════
 
+ANON_HEADER = "🎭 הודעה אנונימית:"
+
 async def anon_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """קבלת הודעה אנונימית (טקסט / תמונה / סרטון) ושליחה לקבוצה"""
-    try:
-        if update.message.photo:
-            caption = f"🎭 הודעה אנונימית:"
-            if update.message.caption:
-                caption += f"\n\n{update.message.caption}"
-            await ctx.bot.send_photo(
-                GROUP_ID,
-                update.message.photo[-1].file_id,
-                caption=caption
-            )
-        elif update.message.video:
-            caption = f"🎭 הודעה אנונימית:"
-            if update.message.caption:
-                caption += f"\n\n{update.message.caption}"
-            await ctx.bot.send_video(
-                GROUP_ID,
-                update.message.video.file_id,
-                caption=caption
-            )
-        elif update.message.text:
-            await ctx.bot.send_message(
-                GROUP_ID,
-                f"🎭 הודעה אנונימית:\n\n{update.message.text}"
-            )
-        else:
-            await update.message.reply_text("⚠️ נתמך רק טקסט, תמונה או סרטון.")
-            return ANON_MSG
-
-        await update.message.reply_text("✅ ההודעה נשלחה לקבוצה באנונימיות. 🎭")
-    except Exception as e:
-        logger.error(f"Could not send anonymous message: {e}")
-        await update.message.reply_text("❌ שגיאה בשליחת ההודעה.")
+    if update.message.media_group_id:
+        # השיחה נשארת ב-ANON_MSG עד שהאלבום נבדק – אלבום שנחסם אפשר לשלוח מחדש, כמו הודעה בודדת
+        return album_task(update, ctx, lambda album: _post_anon(
+            ctx.bot, update.message, _album_payload(album, header=ANON_HEADER), album
+        ))
+
+    messages = _payload_from_message(update.message, header=ANON_HEADER)
+    if not messages:
+        await update.message.reply_text("⚠️ נתמך רק טקסט, תמונה או סרטון.")
+        return ANON_MSG
+    return await _post_anon(ctx.bot, update.message, messages, [update.message])
 
+async def _post_anon(bot, message, messages, source):
+    """בדיקה ופרסום; source – ההודעות המקוריות (הודעה אחת או פריטי אלבום). מחזיר את השלב הבא"""
+    admitted = await anon_admit(message, [m.text or m.caption for m in source], _media_ids(source))
+    if admitted is None:
+        return ANON_MSG
+    if await _send_anon(bot, message, messages, admitted):
+        await message.reply_text("✅ ההודעה נשלחה לקבוצה באנונימיות. 🎭")
+    else:
+        await message.reply_text("❌ שגיאה בשליחת ההודעה.")
     return ConversationHandler.END
 
 # ══════════════════════════════════════════════════════════
@@ -571,14 +3141,13 @@ async def anon_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def confession_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """קבלת וידוי אנונימי ושליחה לקבוצה"""
-    try:
-        await ctx.bot.send_message(
-            GROUP_ID,
-            f"🤫 וידוי אנונימי:\n\n{update.message.text}"
-        )
+    admitted = await anon_admit(update.message, [update.message.text])
+    if admitted is None:
+        return CONFESSION_MSG
+    if await _send_anon(ctx.bot, update.message, [_text_payload(f"🤫 וידוי אנונימי:\n\n{update.message.text}")],
+                        admitted):
         await update.message.reply_text("✅ הוידוי נשלח לקבוצה באנונימיות. 🤫")
-    except Exception as e:
-        logger.error(f"Could not send confession: {e}")
+    else:
         await update.message.reply_text("❌ שגיאה בשליחת הוידוי.")
 
     return ConversationHandler.END
@@ -587,52 +3156,56 @@ async def confession_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 #          ניהול – שליחת הודעה לכל המשתמשים
 # ══════════════════════════════════════════════════════════
 
-async def _send_to_user(ctx, uid, update):
-    """שליחת הודעת המנהל (טקסט/תמונה/סרטון) למשתמש בודד"""
-    if update.message.photo:
-        await ctx.bot.send_photo(
-            uid,
-            update.message.photo[-1].file_id,
-            caption=update.message.caption or ""
-        )
-    elif update.message.video:
-        await ctx.bot.send_video(
-            uid,
-            update.message.video.file_id,
-            caption=update.message.caption or ""
-        )
-    elif update.message.text:
-        await ctx.bot.send_message(uid, update.message.text)
+async def _send_to_user(bot, uid, messages):
+    """שליחת הודעת המנהל (טקסט/תמונה/סרטון/אלבום) למשתמש בודד"""
+    await _send_payload(bot, uid, messages)
+
+def _broadcast_text(stats, done=False):
+    handled = stats["sent"] + stats["failed"] + stats["blocked"]
+    head = "✅ ההפצה הסתיימה" if done else f"📨 שולח... {handled}/{stats['total']}"
+    return (
+        f"{head}\n"
+        f"נשלח: {stats['sent']}"
+        + (f"\n⚠️ נכשל: {stats['failed']}" if stats["failed"] else "")
+        + (f"\n🚫 חסמו את הבוט: {stats['blocked']}" if stats["blocked"] else "")
+    )
+
+async def _edit_progress(msg, text):
+    try:
+        await msg.edit_text(text)
+    except Exception as e:
+        logger.debug(f"Could not update broadcast progress: {e}")
+
+async def _run_notify(bot, job_id, progress_msg):
+    """ריצת ההפצה ברקע – השיחה של המנהל לא נחסמת"""
+    stats = await OUTBOX.run(
+        job_id, bot,
+        on_progress=lambda st: _edit_progress(progress_msg, _broadcast_text(st)),
+    )
+    if stats is not None:
+        await _edit_progress(progress_msg, _broadcast_text(stats, done=True))
 
 async def admin_notify_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """מנהל: שליחת הודעה/תמונה/סרטון לכל משתמשי הבוט"""
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return ConversationHandler.END
 
-    data = load_data()
+    if update.message.media_group_id:
+        collect_album(update, ctx, lambda album: _start_notify(ctx, update, _album_payload(album)))
+        return ConversationHandler.END
 
-    # איסוף כל ה-user IDs (חברים + ממתינים)
-    all_uids = set()
-    for uid in data.get("members", {}):
-        all_uids.add(int(uid))
-    for uid in data.get("pending", {}):
-        all_uids.add(int(uid))
+    await _start_notify(ctx, update, _payload_from_message(update.message))
+    return ConversationHandler.END
 
-    sent = 0
-    failed = 0
-    for uid in all_uids:
-        try:
-            await _send_to_user(ctx, uid, update)
-            sent += 1
-        except Exception as e:
-            logger.error(f"Could not notify {uid}: {e}")
-            failed += 1
+async def _start_notify(ctx, update, messages):
+    data = load_data()
 
-    await update.message.reply_text(
-        f"✅ ההודעה נשלחה ל-{sent} משתמשים."
-        + (f"\n⚠️ נכשל ל-{failed} משתמשים." if failed else "")
-    )
-    return ConversationHandler.END
+    # איסוף כל ה-user IDs (חברים + ממתינים), בלי מי שחסם את הבוט
+    all_uids = (set(data["members"]) | set(data["pending"])) - set(data["unreachable"])
+    job_id = OUTBOX.enqueue("broadcast", messages, all_uids)
+
+    progress_msg = await update.message.reply_text(f"📨 שולח ל-{len(all_uids)} משתמשים...")
+    ctx.application.create_task(_run_notify(ctx.bot, job_id, progress_msg), update=update)
 
 # ══════════════════════════════════════════════════════════
 #          ניהול – הודעה פרטית לחבר
@@ -640,11 +3213,10 @@ async def admin_notify_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def admin_dm_target(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """מנהל: קבלת מספר חבר לשליחת הודעה פרטית"""
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return ConversationHandler.END
 
-    data = load_data()
-    target_uid, target_member = find_member_by_number(data, update.message.text.strip())
+    target_uid, target_member = find_member_by_number(update.message.text)
 
     if not target_member:
         await update.message.reply_text("❌ חבר לא נמצא. נסה שוב עם /start")
@@ -660,7 +3232,7 @@ async def admin_dm_target(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def admin_dm_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """מנהל: שליחת ההודעה הפרטית לחבר"""
-    if update.effective_user.id != ADMIN_ID:
+    if not is_admin(update.effective_user.id):
         return ConversationHandler.END
 
     target_uid = ctx.user_data.get("dm_target_uid")
@@ -670,118 +3242,728 @@ async def admin_dm_msg(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ שגיאה. נסה שוב עם /start")
         return ConversationHandler.END
 
+    if update.message.media_group_id:
+        collect_album(update, ctx, lambda album: _deliver_dm(ctx.bot, update.message, target_uid, target_name,
+                                                             _album_payload(album)))
+        return ConversationHandler.END
+
+    await _deliver_dm(ctx.bot, update.message, target_uid, target_name, _payload_from_message(update.message))
+    return ConversationHandler.END
+
+async def _deliver_dm(bot, message, target_uid, target_name, messages):
     try:
-        await _send_to_user(ctx, target_uid, update)
-        await update.message.reply_text(f"✅ ההודעה נשלחה ל-{target_name} בפרטי.")
+        await _send_to_user(bot, target_uid, messages)
+        await message.reply_text(f"✅ ההודעה נשלחה ל-{target_name} בפרטי.")
     except Exception as e:
         logger.error(f"Could not DM {target_uid}: {e}")
-        await update.message.reply_text("❌ שגיאה בשליחת ההודעה.")
+        await message.reply_text("❌ שגיאה בשליחת ההודעה.")
 
-    return ConversationHandler.END
+# ══════════════════════════════════════════════════════════
+#               ניהול – רשימת חברים
+# ══════════════════════════════════════════════════════════
+# דפדוף עם כפתורים (mlist:<סינון>:<עמוד>). העמודים מחושבים פעם אחת לכל
+# גרסה של רשימת החברים ונשמרים במטמון עד השינוי הבא (אישור/אזהרה/הוצאה).
+# סינונים: all, warn, v<מפתח> (כפר), u<מפתח> (יחידה) – מפתח = _filter_key של הערך;
+# pv/pu – בחירת כפר/יחידה.
+
+MEMBERS_PAGE_SIZE  = 30      # שורות בעמוד
+MEMBERS_PAGE_CHARS = 3500    # מתחת למגבלת 4096 של טלגרם
+MEMBERS_PICKER_SIZE = 20     # כפתורי ערכים בעמוד בחירה
+
+def _filter_key(value):
+    """מפתח קצר ויציב לערך סינון (כפר/יחידה) ל-callback_data – לא תלוי במיקום ברשימה"""
+    return f"{zlib.crc32(value.encode('utf-8')):08x}"
+
+class MemberListCache:
+    """עמודי רשימת החברים המעובדים, לפי סינון"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._version = None
+        self._sorted = []
+        self._values = {}
+        self._keys = {}      # סוג → {מפתח: ערך}
+        self._pages = {}
+
+    def _refresh(self):
+        if self._version == self.registry.version:
+            return
+        self._version = self.registry.version
+        self._sorted = sorted(
+            self.registry.members.items(),
+            key=lambda x: normalize_member_number(x[1]["number"]) or 0,
+        )
+        self._values = {
+            "v": sorted({m.get("village") or "" for _, m in self._sorted}),
+            "u": sorted({m.get("unit") or "" for _, m in self._sorted}),
+        }
+        self._keys = {kind: {_filter_key(v): v for v in values} for kind, values in self._values.items()}
+        self._pages.clear()
+
+    def values(self, kind):
+        self._refresh()
+        return self._values[kind]
+
+    def _predicate(self, flt):
+        if flt == "warn":
+            return lambda m: m.get("warnings", 0) > 0
+        if flt[:1] in ("v", "u") and len(flt) > 1:
+            value = self._keys[flt[0]].get(flt[1:])
+            if value is None:   # כפתור ישן לערך שכבר אין לו חברים
+                return lambda m: False
+            field = "village" if flt[0] == "v" else "unit"
+            return lambda m: (m.get(field) or "") == value
+        return None
+
+    def label(self, flt):
+        self._refresh()
+        if flt == "warn":
+            return "עם אזהרות"
+        if flt[:1] in ("v", "u") and len(flt) > 1:
+            value = self._keys[flt[0]].get(flt[1:])
+            return "ערך שכבר לא קיים" if value is None else value or "ללא"
+        return ""
+
+    def pages(self, flt):
+        self._refresh()
+        if flt not in self._pages:
+            predicate = self._predicate(flt)
+            pages, lines, size = [], [], 0
+            for _, m in self._sorted:
+                if predicate is not None and not predicate(m):
+                    continue
+                warn_str = f" ⚠️×{m['warnings']}" if m.get("warnings", 0) > 0 else ""
+                line = f"#{str(m['number']).zfill(3)} | {m['lastname']} | {m.get('village')} | {m.get('rank')}{warn_str}"
+                if lines and (len(lines) >= MEMBERS_PAGE_SIZE or size + len(line) > MEMBERS_PAGE_CHARS):
+                    pages.append("\n".join(lines))
+                    lines, size = [], 0
+                lines.append(line)
+                size += len(line) + 1
+            if lines:
+                pages.append("\n".join(lines))
+            self._pages[flt] = pages
+        return self._pages[flt]
+
+def _members_filter_row():
+    return [
+        InlineKeyboardButton("הכל", callback_data=tenant_callback("mlist:all:0")),
+        InlineKeyboardButton("⚠️ אזהרות", callback_data=tenant_callback("mlist:warn:0")),
+        InlineKeyboardButton("🏘 כפר", callback_data=tenant_callback("mlist:pv:0")),
+        InlineKeyboardButton("🎖 יחידה", callback_data=tenant_callback("mlist:pu:0")),
+    ]
+
+def render_members_page(flt, page):
+    """טקסט + מקלדת לעמוד אחד ברשימת החברים"""
+    pages = MEMBER_LIST.pages(flt)
+    label = MEMBER_LIST.label(flt)
+    title = "📋 רשימת חברים" + (f" – {label}" if label else "")
+    if not pages:
+        return f"{title}\n\nאין חברים מתאימים.", InlineKeyboardMarkup([_members_filter_row()])
+
+    page = max(0, min(page, len(pages) - 1))
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("◀️", callback_data=tenant_callback(f"mlist:{flt}:{page - 1}")))
+    nav.append(InlineKeyboardButton(f"{page + 1}/{len(pages)}", callback_data=tenant_callback("mlist:noop:0")))
+    if page < len(pages) - 1:
+        nav.append(InlineKeyboardButton("▶️", callback_data=tenant_callback(f"mlist:{flt}:{page + 1}")))
+    text = f"{title} (עמוד {page + 1}/{len(pages)}):\n\n{pages[page]}"
+    return text, InlineKeyboardMarkup([nav, _members_filter_row()])
+
+def render_value_picker(kind, page):
+    """בחירת כפר (v) או יחידה (u) לסינון"""
+    values = MEMBER_LIST.values(kind)
+    start = page * MEMBERS_PICKER_SIZE
+    chunk = values[start:start + MEMBERS_PICKER_SIZE]
+    rows = []
+    for i in range(0, len(chunk), 2):
+        rows.append([
+            InlineKeyboardButton(value or "ללא", callback_data=tenant_callback(f"mlist:{kind}{_filter_key(value)}:0"))
+            for value in chunk[i:i + 2]
+        ])
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("◀️", callback_data=tenant_callback(f"mlist:p{kind}:{page - 1}")))
+    if start + MEMBERS_PICKER_SIZE < len(values):
+        nav.append(InlineKeyboardButton("▶️", callback_data=tenant_callback(f"mlist:p{kind}:{page + 1}")))
+    if nav:
+        rows.append(nav)
+    rows.append([InlineKeyboardButton("↩️ חזרה", callback_data=tenant_callback("mlist:all:0"))])
+    title = "🏘 בחר כפר:" if kind == "v" else "🎖 בחר יחידה:"
+    return title, InlineKeyboardMarkup(rows)
+
+async def members_browser(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """מנהל: דפדוף וסינון ברשימת החברים"""
+    query = update.callback_query
+    await query.answer()
+
+    if not is_admin(query.from_user.id):
+        return
+
+    _, flt, page = callback_data(query).split(":")
+    if flt == "noop":
+        return
+    load_data()
+    if flt in ("pv", "pu"):
+        text, markup = render_value_picker(flt[1], int(page))
+    else:
+        text, markup = render_members_page(flt, int(page))
+    try:
+        await query.edit_message_text(text, reply_markup=markup)
+    except BadRequest as e:
+        # "message is not modified" – לחיצה חוזרת על אותו עמוד
+        logger.debug(f"Members page not updated: {e}")
 
 # ══════════════════════════════════════════════════════════
 #                  החלטת מנהל (אישור/דחייה)
 # ══════════════════════════════════════════════════════════
 
+# סיבות דחייה: קוד → (תווית, שעות המתנה). ניתן לשנות שעות דרך
+# COOLDOWN_HOURS, למשל: "data=24,photo=6,fake=720"
+REJECT_REASONS = {
+    "data":  ("נתונים לא תואמים", 24),
+    "photo": ("תעודה לא ברורה", 6),
+    "fake":  ("חשד לזיוף", 24 * 30),
+}
+DEFAULT_REJECT_REASON = "data"
+
+for _item in filter(None, os.environ.get("COOLDOWN_HOURS", "").split(",")):
+    _code, _, _hours = _item.partition("=")
+    if _code.strip() in REJECT_REASONS:
+        REJECT_REASONS[_code.strip()] = (REJECT_REASONS[_code.strip()][0], float(_hours))
+
+COOLDOWN_SWEEP_INTERVAL = 600   # שניות בין סריקות ניקוי
+
+async def cooldown_sweeper():
+    """ניקוי תקופתי של cooldowns שפגו (בקבוצות הטעונות; השאר – בטעינה)"""
+    while True:
+        await asyncio.sleep(COOLDOWN_SWEEP_INTERVAL)
+        for tenant in TENANTS.loaded():
+            purged = tenant.store.purge_expired_cooldowns()
+            if purged:
+                logger.info(f"Tenant {tenant.key}: purged {purged} expired cooldowns")
+
+def _approve_pending(uid, pending):
+    """רישום חבר מבקשה ממתינה (בתוך STORE.event). מחזיר את מספר החבר"""
+    member_number = STORE.next_member_number()
+    STORE.put_member(uid, {
+        "number": member_number,
+        "lastname": pending["answers"]["lastname"],
+        "village": pending["answers"]["village"],
+        "unit": pending["answers"]["unit"],
+        "rank": pending["answers"]["rank"],
+        "warnings": 0,
+        "joined": datetime.now().isoformat()
+    })
+    STORE.delete_pending(uid)
+    # הסרת cooldown אם יש
+    STORE.delete_cooldown(uid)
+    return member_number
+
+def _reject_pending(uid, pending, reason):
+    """ארכוב הבקשה והגדרת cooldown (בתוך STORE.event). מחזיר שעות המתנה"""
+    cooldown_hours = REJECT_REASONS[reason][1]
+    STORE.add_rejected({
+        "user_id": uid,
+        "username": pending.get("username", ""),
+        "answers": pending["answers"],
+        "reason": reason,
+        "rejected_at": datetime.now().isoformat()
+    })
+    STORE.delete_pending(uid)
+    STORE.set_cooldown(uid, time.time() + cooldown_hours * 3600)
+    return cooldown_hours
+
+async def _create_invite(bot, member_number, lastname):
+    """לינק הזמנה חד-פעמי לקבוצה, או None אם נכשל (RetryAfter עולה למעלה)"""
+    try:
+        invite = await bot.create_chat_invite_link(
+            current_tenant().group_id,
+            member_limit=1,
+            name=f"#{str(member_number).zfill(3)} {lastname}"
+        )
+        return invite.invite_link
+    except RetryAfter:
+        raise
+    except Exception as e:
+        logger.error(f"Could not create invite link: {e}")
+        return None
+
+def _approved_text(member_number, invite_link):
+    if invite_link:
+        invite_text = f"\n🔗 לחץ כאן להצטרפות לקבוצה:\n{invite_link}"
+    else:
+        invite_text = "\n\n⚠️ לא ניתן היה ליצור לינק הזמנה. פנה למנהל לקבלת לינק."
+    return (
+        f"🎉 בקשתך אושרה!\n\n" +
+        WELCOME_MSG.format(number=str(member_number).zfill(3)) +
+        invite_text
+    )
+
+def _rejected_text(cooldown_hours):
+    return (
+        "❌ בקשתך נדחתה עקב אי עמידה בתנאים.\n\n"
+        "נדרש לוודא שכלל הנתונים שהזנת נכונים ותואמים.\n"
+        "ניתן לפנות למנהל דרך התפריט במידה וישנו חשד לטעות בזיהוי האוטומטי.\n\n"
+        f"ניתן להגיש בקשה חוזרת בעוד {cooldown_hours:g} שעות."
+    )
+
 async def admin_decision(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    if query.from_user.id != ADMIN_ID:
+    if not is_admin(query.from_user.id):
         return
 
-    action, uid = query.data.split("_", 1)
+    # approve_<uid> / reject_<uid> / reject_<uid>_<סיבה>
+    action, rest = callback_data(query).split("_", 1)
+    uid, _, reason = rest.partition("_")
     uid = int(uid)
+    if reason not in REJECT_REASONS:
+        reason = DEFAULT_REJECT_REASON
+    result = await decide(ctx.bot, query.from_user.id, action, uid, reason)
+    await query.edit_message_text(result or "⚠️ לא נמצאה בקשה (אולי כבר טופלה)")
+
+async def decide(bot, actor, action, uid, reason=DEFAULT_REJECT_REASON):
+    """אישור/דחייה של בקשה אחת. מחזיר שורת סיכום, או None אם הבקשה כבר טופלה"""
+    # לחיצה כפולה / שני מנהלים על אותה בקשה – השני יראה שכבר טופלה
+    async with RECORD_LOCKS.lock(f"pending:{uid}"):
+        pending = load_data()["pending"].get(str(uid))
+        if not pending:
+            return None
+
+        if action == "approve":
+            with STORE.event("approved", actor=actor, uid=uid):
+                member_number = _approve_pending(uid, pending)
+
+            try:
+                invite_link = await _create_invite(bot, member_number, pending["answers"]["lastname"])
+            except RetryAfter as e:
+                logger.error(f"Could not create invite link: {e}")
+                invite_link = None
+            await OUTBOX.send(bot, [uid], [_text_payload(_approved_text(member_number, invite_link))])
+            return f"✅ {pending['answers']['lastname']} אושר – מספר #{str(member_number).zfill(3)}"
+
+        with STORE.event("rejected", actor=actor, uid=uid, reason=reason):
+            # ארכוב + cooldown לפי סיבת הדחייה
+            cooldown_hours = _reject_pending(uid, pending, reason)
+        TIMERS.schedule("cooldown_expired", cooldown_hours * 3600, uid=uid)
+
+        await OUTBOX.send(bot, [uid], [_text_payload(_rejected_text(cooldown_hours))])
+        return f"❌ {pending['answers']['lastname']} נדחה ({REJECT_REASONS[reason][0]})"
+
+async def admin_rejected_lookup(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """מנהל: /rejected <user_id> – היסטוריית הדחיות של משתמש מהארכיון"""
+    if not is_admin(update.effective_user.id):
+        return
+    if len(ctx.args) != 1 or not ctx.args[0].isdigit():
+        await update.message.reply_text("שימוש: /rejected <user_id>")
+        return
+
+    records = ARCHIVE.lookup(int(ctx.args[0]))
+    if not records:
+        await update.message.reply_text("לא נמצאו דחיות למשתמש זה")
+        return
+    lines = [f"🗂 {len(records)} דחיות למשתמש {ctx.args[0]}:"]
+    for r in records:
+        a = r["answers"]
+        label = REJECT_REASONS.get(r.get("reason"), ("—",))[0]
+        lines.append(
+            f"\n📅 {(r.get('rejected_at') or '')[:16].replace('T', ' ')} – {label}\n"
+            f"👤 @{r.get('username') or 'אין'}\n"
+            f"שם משפחה: {a.get('lastname', '')}\n"
+            f"כפר/עיר: {a.get('village', '')}\n"
+            f"יחידה: {a.get('unit', '')} | דרגה: {a.get('rank', '')}"
+        )
+    await update.message.reply_text("\n".join(lines))
+
+# ══════════════════════════════════════════════════════════
+#              תור בקשות לבדיקה (/review)
+# ══════════════════════════════════════════════════════════
+# במקום הודעה + תמונה למנהל על כל מבקש: התראה מרוכזת אחת, והמנהל מדפדף
+# בתור מהישן לחדש. כל עמוד = תעודות המבקשים ב-media group אחד + הודעת
+# בקרה עם שורת כפתורים לכל מבקש. הודעת הבקרה נבנית מחדש מה-store בכל
+# לחיצה, כך שלחיצות מהירות (או אחרי הפעלה מחדש) לא דורסות זו את זו.
+
+REVIEW_PAGE_SIZE = 5        # מבקשים בעמוד (media group: עד 10)
+REVIEW_DIGEST_DELAY = float(os.environ.get("REVIEW_DIGEST_DELAY", "300"))   # שניות לאיסוף בקשות להתראה אחת
+REVIEW_CAPTION_CHARS = 1024  # מגבלת כיתוב של טלגרם
+
+# כפתור לכל סיבת דחייה; סיבה בלי אייקון מקבלת ❌
+REJECT_ICONS = {"data": "❌", "photo": "🖼", "fake": "🚫"}
+
+_REVIEW_LINE = re.compile(r"^(\d+)\. (.*) – (\d+)(?: → .*)?$")
+
+def _review_key(pending):
+    return (pending.get("timestamp") or "", pending["user_id"])
+
+def _review_cursor(pending):
+    """uid:זמן של המבקש האחרון בעמוד, לכפתור "הבאות". הזמן בלי מפרידים –
+    callback_data מוגבל ל-64 בתים וצריך להשאיר מקום למפתח הקבוצה"""
+    timestamp = pending.get("timestamp") or ""
+    try:
+        timestamp = datetime.fromisoformat(timestamp).strftime("%Y%m%dT%H%M%S%f")
+    except ValueError:
+        pass
+    return f"{pending['user_id']}:{timestamp}"
+
+def _cursor_timestamp(value):
+    try:
+        return datetime.strptime(value, "%Y%m%dT%H%M%S%f").isoformat()
+    except ValueError:
+        return value   # כפתור ישן עם הזמן המלא
+
+def _review_queue(after=None):
+    """בקשות ממתינות מהישנה לחדשה; after – מפתח המבקש האחרון שהוצג"""
+    queue = sorted(load_data()["pending"].values(), key=_review_key)
+    if after is not None:
+        queue = [p for p in queue if _review_key(p) > after]
+    return queue
+
+def _review_caption(i, pending):
+    a = pending["answers"]
+    caption = (
+        f"{i}. {a['lastname']} | {a['village']}\n"
+        f"יחידה: {a['unit']} | דרגה: {a['rank']}\n"
+        f"👤 @{pending.get('username') or 'אין'} (ID: {pending['user_id']})\n"
+        + (f"{_photo_matches_line(a['photo_matches'])}\n" if a.get("photo_matches") else "")
+        + f"תשובה היסטורית: {a['history']}"
+    )
+    return caption[:REVIEW_CAPTION_CHARS]
+
+def render_review(entries, nav):
+    """טקסט + מקלדת להודעת הבקרה. entries: [(מספר, שם, uid)], nav: שורת ניווט"""
     data = load_data()
-    pending = data["pending"].get(str(uid))
+    legend = " · ".join(
+        ["✅ אישור"] + [f"{REJECT_ICONS.get(code, '❌')} {label}" for code, (label, _) in REJECT_REASONS.items()]
+    )
+    lines = [f"🗂 בקשות לבדיקה ({len(data['pending'])} בתור)", legend, ""]
+    rows = []
+    for i, name, uid in entries:
+        line = f"{i}. {name} – {uid}"
+        member = data["members"].get(str(uid))
+        if str(uid) in data["pending"]:
+            rows.append([InlineKeyboardButton(f"✅ {i}", callback_data=tenant_callback(f"review:a:{uid}"))] + [
+                InlineKeyboardButton(f"{REJECT_ICONS.get(code, '❌')} {i}", callback_data=tenant_callback(f"review:r:{uid}:{code}"))
+                for code in REJECT_REASONS
+            ])
+        elif member:
+            line += f" → ✅ #{str(member['number']).zfill(3)}"
+        else:
+            line += " → ❌"
+        lines.append(line)
+    if nav:
+        rows.append(nav)
+    return "\n".join(lines), InlineKeyboardMarkup(rows)
+
+async def send_review_page(bot, chat_id, after=None):
+    """עמוד אחד מהתור: תעודות ב-media group + הודעת בקרה"""
+    page = _review_queue(after)[:REVIEW_PAGE_SIZE]
+    if not page:
+        if after is not None and load_data()["pending"]:
+            await bot.send_message(chat_id, "סוף התור – נותרו בקשות מעמודים קודמים.", reply_markup=InlineKeyboardMarkup(
+                [[InlineKeyboardButton("🔄 מההתחלה", callback_data=tenant_callback("review:next"))]]
+            ))
+        else:
+            await bot.send_message(chat_id, "✅ אין בקשות ממתינות.")
+        return
 
-    if not pending:
-        await query.edit_message_text("⚠️ לא נמצאה בקשה (אולי כבר טופלה)")
+    # טלגרם לא מערבב תמונות ומסמכים באותה קבוצה – קבוצה לכל סוג
+    numbered = list(enumerate(page, 1))
+    for kind, media_cls in (("photo", InputMediaPhoto), ("document", InputMediaDocument)):
+        items = [(i, p) for i, p in numbered
+                 if p["answers"].get("photo_id") and p["answers"].get("photo_type", "photo") == kind]
+        if len(items) == 1:
+            i, p = items[0]
+            send = bot.send_photo if kind == "photo" else bot.send_document
+            await send(chat_id, p["answers"]["photo_id"], caption=_review_caption(i, p))
+        elif items:
+            await bot.send_media_group(chat_id, [
+                media_cls(p["answers"]["photo_id"], caption=_review_caption(i, p)) for i, p in items
+            ])
+
+    last = page[-1]
+    nav = [InlineKeyboardButton("🔄 מההתחלה", callback_data=tenant_callback("review:next"))]
+    if _review_queue(_review_key(last)):
+        nav.append(InlineKeyboardButton(
+            "▶️ הבאות", callback_data=tenant_callback(f"review:next:{_review_cursor(last)}")
+        ))
+    entries = [(i, p["answers"]["lastname"].replace("\n", " "), p["user_id"]) for i, p in numbered]
+    text, markup = render_review(entries, nav)
+    await bot.send_message(chat_id, text, reply_markup=markup)
+
+def schedule_review_digest():
+    """התראה אחת למנהל על כל הבקשות שהצטברו בחלון REVIEW_DIGEST_DELAY"""
+    if not TIMERS.scheduled("review_digest"):
+        TIMERS.schedule("review_digest", REVIEW_DIGEST_DELAY)
+
+@TIMERS.action("review_digest")
+async def _timer_review_digest(bot):
+    count = len(load_data()["pending"])
+    if count:
+        await OUTBOX.send(bot, admin_ids(), [_text_payload(
+            f"🔔 {count} בקשות הצטרפות ממתינות לבדיקה{tenant_note()}",
+            InlineKeyboardMarkup([[InlineKeyboardButton("🗂 לבדיקה", callback_data=tenant_callback("review:next"))]]),
+        )])
+
+async def admin_review(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """מנהל: /review – העמוד הראשון בתור הבקשות"""
+    if not is_admin(update.effective_user.id):
         return
+    await send_review_page(ctx.bot, update.effective_chat.id)
 
-    if action == "approve":
-        # הקצאת מספר
-        data["counter"] += 1
-        member_number = data["counter"]
-        data["members"][str(uid)] = {
-            "number": member_number,
-            "lastname": pending["answers"]["lastname"],
-            "village": pending["answers"]["village"],
-            "unit": pending["answers"]["unit"],
-            "rank": pending["answers"]["rank"],
-            "warnings": 0,
-            "joined": datetime.now().isoformat()
-        }
-        del data["pending"][str(uid)]
-        # הסרת cooldown אם יש
-        data["cooldowns"].pop(str(uid), None)
-        save_data(data)
+async def review_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """review:next[:uid:ts] – עמוד בתור; review:a:uid / review:r:uid:סיבה – החלטה"""
+    query = update.callback_query
+    await query.answer()
 
-        # יצירת לינק הזמנה חד-פעמי לקבוצה
-        try:
-            invite = await ctx.bot.create_chat_invite_link(
-                GROUP_ID,
-                member_limit=1,
-                name=f"#{str(member_number).zfill(3)} {pending['answers']['lastname']}"
-            )
-            invite_text = f"\n🔗 לחץ כאן להצטרפות לקבוצה:\n{invite.invite_link}"
-        except Exception as e:
-            logger.error(f"Could not create invite link: {e}")
-            invite_text = "\n\n⚠️ לא ניתן היה ליצור לינק הזמנה. פנה למנהל לקבלת לינק."
-
-        await ctx.bot.send_message(
-            uid,
-            f"🎉 בקשתך אושרה!\n\n" +
-            WELCOME_MSG.format(number=str(member_number).zfill(3)) +
-            invite_text
-        )
-        await query.edit_message_text(f"✅ {pending['answers']['lastname']} אושר – מספר #{str(member_number).zfill(3)}")
-
-    elif action == "reject":
-        # שמירת נתוני הנדחה בארכיון
-        if "rejected" not in data:
-            data["rejected"] = []
-        data["rejected"].append({
-            "user_id": uid,
-            "username": pending.get("username", ""),
-            "answers": pending["answers"],
-            "rejected_at": datetime.now().isoformat()
-        })
-        del data["pending"][str(uid)]
-        # הגדרת cooldown 24 שעות
-        data["cooldowns"][str(uid)] = (datetime.now() + timedelta(hours=24)).isoformat()
-        save_data(data)
-
-        await ctx.bot.send_message(
-            uid,
-            "❌ בקשתך נדחתה עקב אי עמידה בתנאים.\n\n"
-            "נדרש לוודא שכלל הנתונים שהזנת נכונים ותואמים.\n"
-            "ניתן לפנות למנהל דרך התפריט במידה וישנו חשד לטעות בזיהוי האוטומטי.\n\n"
-            "ניתן להגיש בקשה חוזרת בעוד 24 שעות."
+    if not is_admin(query.from_user.id):
+        return
+
+    parts = callback_data(query).split(":", 3)
+    if parts[1] == "next":
+        after = (_cursor_timestamp(parts[3]), int(parts[2])) if len(parts) == 4 else None
+        await send_review_page(ctx.bot, query.message.chat_id, after)
+        return
+
+    uid = int(parts[2])
+    if parts[1] == "a":
+        await decide(ctx.bot, query.from_user.id, "approve", uid)
+    else:
+        reason = parts[3] if len(parts) == 4 and parts[3] in REJECT_REASONS else DEFAULT_REJECT_REASON
+        await decide(ctx.bot, query.from_user.id, "reject", uid, reason)
+
+    entries = []
+    for line in (query.message.text or "").splitlines():
+        match = _REVIEW_LINE.match(line)
+        if match:
+            entries.append((int(match[1]), match[2], int(match[3])))
+    keyboard = query.message.reply_markup.inline_keyboard if query.message.reply_markup else ()
+    nav = [row for row in keyboard if row and (row[0].callback_data or "").startswith("review:next")]
+    text, markup = render_review(entries, list(nav[-1]) if nav else None)
+    try:
+        await query.edit_message_text(text, reply_markup=markup)
+    except BadRequest as e:
+        logger.debug(f"Review page not updated: {e}")
+
+# ══════════════════════════════════════════════════════════
+#              החלטה מרוכזת (bulk)
+# ══════════════════════════════════════════════════════════
+# /bulk approve all | /bulk approve oldest 50 | /bulk reject photo 123 456
+# כל הבקשות שנבחרו נרשמות באירוע אחד (טרנזקציה אחת, מספרי חבר רצופים),
+# ומיד אחריו ההודעות נרשמות כמשימה ב-OUTBOX. לינק ההזמנה של כל מאושר נוצר
+# בזמן השליחה ונשמר במשימה – אחרי הפעלה מחדש היא ממשיכה מהנמען הבא, בלי
+# לינק נוסף למי שכבר קיבל.
+
+BULK_REPORT_FAILURES = 30   # שורות כשלון מקסימליות בסיכום
+
+def _select_pending(args):
+    """all / oldest N / רשימת uid-ים → uid-ים ממתינים (מהישן לחדש)"""
+    data = load_data()
+    by_age = sorted(data["pending"].values(), key=lambda p: p.get("timestamp") or "")
+    if args == ["all"]:
+        return [p["user_id"] for p in by_age]
+    if len(args) == 2 and args[0] == "oldest" and args[1].isdigit():
+        return [p["user_id"] for p in by_age[:int(args[1])]]
+    if args and all(a.isdigit() for a in args):
+        return [int(a) for a in args if a in data["pending"]]
+    return None
+
+async def admin_bulk(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """מנהל: /bulk – בחירת קבוצת בקשות לאישור/דחייה מרוכזים"""
+    if not is_admin(update.effective_user.id):
+        return
+    args = [a.lower() for a in ctx.args]
+    action = args.pop(0) if args and args[0] in ("approve", "reject") else None
+    reason = DEFAULT_REJECT_REASON
+    if action == "reject" and args and args[0] in REJECT_REASONS:
+        reason = args.pop(0)
+    uids = _select_pending(args) if action else None
+    if not uids:
+        await update.message.reply_text(
+            f"⏳ ממתינים: {len(load_data()['pending'])}\n\n"
+            "שימוש:\n"
+            "/bulk approve all\n"
+            "/bulk approve oldest 50\n"
+            "/bulk reject [" + "|".join(REJECT_REASONS) + "] <user_id> <user_id> ..."
         )
-        await query.edit_message_text(f"❌ {pending['answers']['lastname']} נדחה")
+        return
+
+    ctx.user_data["bulk"] = {"action": action, "reason": reason, "uids": uids, "tenant": current_tenant().key}
+    label = "לאשר" if action == "approve" else f"לדחות ({REJECT_REASONS[reason][0]})"
+    await update.message.reply_text(
+        f"{label} {len(uids)} בקשות?",
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("✅ ביצוע", callback_data=tenant_callback("bulk:go")),
+            InlineKeyboardButton("↩️ ביטול", callback_data=tenant_callback("bulk:cancel")),
+        ]]),
+    )
+
+async def bulk_confirm(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    if not is_admin(query.from_user.id):
+        return
+    selection = ctx.user_data.pop("bulk", None)
+    # מנהל שעבר לקבוצה אחרת בין הבחירה לאישור – הבחירה לא תקפה כאן
+    if callback_data(query) != "bulk:go" or selection is None or selection.get("tenant", DEFAULT_TENANT) != current_tenant().key:
+        await query.edit_message_text("הפעולה בוטלה.")
+        return
+    await query.edit_message_text(f"⏳ מעבד {len(selection['uids'])} בקשות...")
+    ctx.application.create_task(
+        bulk_decide(ctx.bot, query.from_user.id, selection["action"], selection["uids"],
+                    selection["reason"], query.message),
+        update=update,
+    )
+
+@OUTBOX.personal("bulk_approved")
+async def _outbox_approved(bot, uid, data):
+    """הודעת אישור עם לינק הזמנה אישי; הלינק נשמר ב-data ולא נוצר שוב בניסיון חוזר"""
+    if "invite" not in data:
+        await BROADCAST_BUCKET.acquire()   # גם יצירת הלינק נספרת במגבלת הקצב
+        data["invite"] = await _create_invite(bot, data["number"], data["lastname"])
+    return [_text_payload(_approved_text(data["number"], data["invite"]))]
+
+async def bulk_decide(bot, actor, action, uids, reason, progress_msg):
+    """אישור/דחייה של קבוצת בקשות. מחזיר {uid: sent/failed/blocked}"""
+    data = load_data()
+    # בלי await עד רישום המשימה – בקשה שנלחצה בינתיים בנפרד כבר לא תופיע ב-pending
+    selected = [(uid, data["pending"][str(uid)]) for uid in uids if str(uid) in data["pending"]]
+    skipped = len(uids) - len(selected)
+    names = {uid: pending["answers"]["lastname"] for uid, pending in selected}
+
+    if action == "approve":
+        with STORE.event("bulk_approved", actor=actor, count=len(selected)):
+            numbers = {uid: _approve_pending(uid, pending) for uid, pending in selected}
+        job_id = OUTBOX.enqueue("bulk_approved", [], numbers,
+                                {uid: {"number": number, "lastname": names[uid]} for uid, number in numbers.items()})
+    else:
+        cooldown_hours = REJECT_REASONS[reason][1]
+        with STORE.event("bulk_rejected", actor=actor, reason=reason, count=len(selected)):
+            for uid, pending in selected:
+                _reject_pending(uid, pending, reason)
+        job_id = OUTBOX.enqueue("bulk_rejected", [_text_payload(_rejected_text(cooldown_hours))], names)
+        for uid, _ in selected:
+            TIMERS.schedule("cooldown_expired", cooldown_hours * 3600, uid=uid)
+
+    stats = await OUTBOX.run(job_id, bot, on_progress=lambda st: _edit_progress(progress_msg, _broadcast_text(st)))
+    delivered = OUTBOX.results(job_id)
+    results = {uid: status for uid, (status, _) in delivered.items()}
+
+    head = "✅ אושרו" if action == "approve" else f"❌ נדחו ({REJECT_REASONS[reason][0]})"
+    lines = [f"{head} {len(selected)} בקשות" + (f" (דולגו {skipped} שכבר טופלו)" if skipped else ""),
+             _broadcast_text(stats, done=True)]
+    if action == "approve":
+        no_link = [uid for uid, (_, state) in delivered.items() if state.get("invite") is None]
+        if no_link:
+            lines.append(f"🔗 ללא לינק הזמנה: {len(no_link)}")
+    problems = [(uid, status) for uid, status in results.items() if status != "sent"]
+    if action == "approve":
+        problems += [(uid, "no_link") for uid in no_link if results.get(uid) == "sent"]
+    labels = {"failed": "שליחה נכשלה", "blocked": "חסם את הבוט", "no_link": "ללא לינק"}
+    for uid, status in problems[:BULK_REPORT_FAILURES]:
+        number = f"#{str(numbers[uid]).zfill(3)} " if action == "approve" else ""
+        lines.append(f"• {number}{names[uid]} ({uid}) – {labels[status]}")
+    if len(problems) > BULK_REPORT_FAILURES:
+        lines.append(f"... ועוד {len(problems) - BULK_REPORT_FAILURES}")
+    await _edit_progress(progress_msg, "\n".join(lines))
+    return results
 
 # ══════════════════════════════════════════════════════════
 #               אירועי קבוצה
 # ══════════════════════════════════════════════════════════
 
-async def _delete_after(msg, seconds):
-    """מחיקת הודעה אחרי מספר שניות"""
-    await asyncio.sleep(seconds)
-    try:
-        await msg.delete()
-    except Exception as e:
-        logger.error(f"Could not delete welcome message: {e}")
+WELCOME_DELETE_AFTER = 86400   # שניות
+WELCOME_DEBOUNCE = float(os.environ.get("WELCOME_DEBOUNCE", "10"))   # שניות לאיסוף הצטרפויות להודעה אחת
+WELCOME_MAX_NAMES = 30         # שמות בהודעת הברכה, השאר "ועוד N"
+
+# הצטרפויות שעוד לא קיבלו ברכה: קבוצה → chat_id → {uid: שם}. נפילה בתוך חלון
+# האיסוף מפספסת ברכה אחת – לא נתון שצריך לשרוד.
+_welcome_joins = {}
 
 async def new_member_joined(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    """הודעה אוטומטית כשחבר נוסף לקבוצה"""
+    """הצטרפות לקבוצה: איסוף לחלון WELCOME_DEBOUNCE, הברכה נשלחת מהטיימר"""
+    chats = _welcome_joins.setdefault(current_tenant().key, {})
+    joined = chats.setdefault(update.effective_chat.id, {})
     for member in update.message.new_chat_members:
-        data = load_data()
-        uid = str(member.id)
-        if uid in data["members"]:
-            sent_msg = await update.message.reply_text(GROUP_WELCOME_MSG)
-            # מחיקה אוטומטית אחרי 24 שעות
-            asyncio.create_task(_delete_after(sent_msg, 86400))
+        if not member.is_bot:
+            joined[member.id] = member.first_name
+    if joined and not TIMERS.scheduled("group_welcome"):
+        TIMERS.schedule("group_welcome", WELCOME_DEBOUNCE)
+
+def _welcome_text(names):
+    shown = ", ".join(names[:WELCOME_MAX_NAMES])
+    if len(names) > WELCOME_MAX_NAMES:
+        shown += f" ועוד {len(names) - WELCOME_MAX_NAMES}"
+    return f"👋 {shown}\n{GROUP_WELCOME_MSG}"
+
+@TIMERS.action("group_welcome")
+async def _timer_group_welcome(bot, attempt=0):
+    """ברכה אחת לכל מי שהצטרף בחלון; מחליפה את הברכה הקודמת שעוד לא נמחקה.
+    כישלון זמני משאיר את ההצטרפויות לסבב חוזר (attempt) עם השהיה עולה"""
+    batches = _welcome_joins.get(current_tenant().key, {})
+    members = load_data()["members"]
+    previous = TIMERS.find("delete_welcome")
+    failed = {}   # chat_id → השגיאה
+    for chat_id, joined in list(batches.items()):
+        # הצטרפויות שמגיעות בזמן השליחה נכנסות ל-joined ונשארות לסבב הבא
+        batch = dict(joined)
+        verified = [[uid, name] for uid, name in batch.items() if str(uid) in members]
+        if not verified:
+            _forget_welcomed(batches, chat_id, batch)
+            continue
+        older = [(timer_id, args) for timer_id, args in previous if args["chat_id"] == chat_id]
+        seen = {uid for uid, _ in verified}
+        greeted = [entry for _, args in older for entry in args["joined"] if entry[0] not in seen] + verified
+
+        try:
+            sent_msg = await bot.send_message(chat_id, _welcome_text([name for _, name in greeted]))
+        except (BadRequest, Forbidden) as e:
+            # הבוט הוסר מהקבוצה / הקבוצה לא קיימת – ניסיון חוזר לא יעזור
+            logger.error(f"Group welcome to {chat_id} failed, dropping {len(batch)} joins "
+                         f"({', '.join(map(str, batch))}): {e}")
+            _forget_welcomed(batches, chat_id, batch)
+            continue
+        except TelegramError as e:
+            failed[chat_id] = e
+            continue
+        _forget_welcomed(batches, chat_id, batch)
+        TIMERS.schedule("delete_welcome", WELCOME_DELETE_AFTER,
+                        chat_id=chat_id, message_id=sent_msg.message_id, joined=greeted)
+        for timer_id, args in older:
+            TIMERS.cancel(timer_id)
+            try:
+                await bot.delete_message(chat_id, args["message_id"])
+            except TelegramError as e:
+                logger.debug(f"Previous welcome {args['message_id']} not deleted: {e}")
+    if failed and attempt + 1 < TIMER_ATTEMPTS:
+        delay = min(TIMER_RETRY_BASE * 2 ** attempt, TIMER_RETRY_MAX)
+        delay = max([delay] + [float(e.retry_after) for e in failed.values() if isinstance(e, RetryAfter)])
+        logger.warning(f"Group welcome failed in {len(failed)} chats, retrying in {delay:.0f}s: "
+                       f"{next(iter(failed.values()))}")
+        TIMERS.schedule("group_welcome", delay, attempt=attempt + 1)
+        return
+    for chat_id, e in failed.items():
+        batch = dict(batches.get(chat_id, {}))
+        logger.error(f"Group welcome to {chat_id} failed {attempt + 1} times, dropping {len(batch)} joins "
+                     f"({', '.join(map(str, batch))}): {e}")
+        _forget_welcomed(batches, chat_id, batch)
+    # מי שהצטרף בזמן ה-await ראה את הטיימר הזה עדיין מתוזמן ולא תזמן חדש
+    if batches:
+        TIMERS.schedule("group_welcome", WELCOME_DEBOUNCE)
+    else:
+        _welcome_joins.pop(current_tenant().key, None)
+
+def _forget_welcomed(batches, chat_id, batch):
+    joined = batches.get(chat_id, {})
+    for uid in batch:
+        joined.pop(uid, None)
+    if not joined:
+        batches.pop(chat_id, None)
+
+@TIMERS.action("delete_welcome")
+async def _timer_delete_welcome(bot, chat_id, message_id, joined):
+    await bot.delete_message(chat_id, message_id)
 
 # ══════════════════════════════════════════════════════════
 #                      ביטול
@@ -791,14 +3973,509 @@ async def cancel(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("❌ הפעולה בוטלה. לחזרה לתפריט שלח /start")
     return ConversationHandler.END
 
+# ══════════════════════════════════════════════════════════
+#                   שרת HTTP + webhook
+# ══════════════════════════════════════════════════════════
+# RUN_MODE=webhook מחליף את run_polling: טלגרם שולח כל עדכון ב-POST לשרת
+# מוטמע. ניתן להריץ מאחורי reverse proxy (WEBHOOK_URL הוא הכתובת הציבורית).
+
+RUN_MODE        = os.environ.get("RUN_MODE", "polling")        # polling / webhook
+WEBHOOK_URL     = os.environ.get("WEBHOOK_URL", "")            # ריק = לא לרשום מול טלגרם
+WEBHOOK_PATH    = os.environ.get("WEBHOOK_PATH", urlparse(WEBHOOK_URL).path or "/telegram")
+WEBHOOK_SECRET  = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_LISTEN  = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT    = int(os.environ.get("PORT", "8080"))
+HTTP_KEEPALIVE  = 30    # שניות המתנה לבקשה הבאה בחיבור פתוח
+HTTP_DRAIN_TIMEOUT = 10 # שניות לסיום בקשות פתוחות בכיבוי
+
+HttpRequest = namedtuple("HttpRequest", "method path headers body")
+
+_HTTP_REASONS = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 411: "Length Required", 413: "Payload Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+def _http_response(status, content_type, body, keep_alive):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {_HTTP_REASONS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+def json_response(status, obj):
+    return status, "application/json", json.dumps(obj, ensure_ascii=False)
+
+class HttpError(Exception):
+    """בקשה שאי אפשר לקרוא – נענית בסטטוס והחיבור נסגר"""
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+class HttpServer:
+    """שרת HTTP/1.1 מינימלי על asyncio – מספיק ל-webhook, בדיקת בריאות ומדדים"""
+
+    MAX_BODY = 1 << 20
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.routes = {}
+        self.draining = False
+        self._server = None
+        self._conns = set()
+        self._busy = 0
+        self._idle = asyncio.Event()
+
+    def route(self, method, path, handler):
+        """handler(request) → (status, content_type, body)"""
+        self.routes[(method, path)] = handler
+
+    async def start(self):
+        self._idle.set()
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """ניקוז: הפסקת קבלת חיבורים, סיום בקשות פתוחות, סגירת חיבורים שקטים"""
+        self.draining = True
+        self._server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), HTTP_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"HTTP drain timed out with {self._busy} requests in flight")
+        for task in list(self._conns):
+            task.cancel()
+        await asyncio.gather(*self._conns, return_exceptions=True)
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HttpError(400)
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = header.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        # גוף ב-chunked לא נתמך: בלי Content-Length הוא היה נקרא כריק
+        if "transfer-encoding" in headers:
+            raise HttpError(411)
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400)
+        if length < 0:
+            raise HttpError(400)
+        if length > self.MAX_BODY:
+            raise HttpError(413)
+        body = await reader.readexactly(length) if length else b""
+        return HttpRequest(method, target.split("?", 1)[0], headers, body)
+
+    async def _dispatch(self, request):
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            known = any(path == request.path for _, path in self.routes)
+            return json_response(405 if known else 404, {"ok": False})
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"HTTP handler for {request.path} failed: {e}")
+            return json_response(500, {"ok": False})
+
+    async def _serve(self, reader, writer):
+        self._conns.add(asyncio.current_task())
+        try:
+            while not self.draining:
+                request = await asyncio.wait_for(self._read_request(reader), HTTP_KEEPALIVE)
+                if request is None:
+                    break
+                self._busy += 1
+                self._idle.clear()
+                try:
+                    status, content_type, body = await self._dispatch(request)
+                finally:
+                    self._busy -= 1
+                    if not self._busy:
+                        self._idle.set()
+                keep_alive = request.headers.get("connection", "").lower() != "close" and not self.draining
+                writer.write(_http_response(status, content_type, body, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HttpError as e:
+            try:
+                writer.write(_http_response(e.status, "application/json", '{"ok": false}', False))
+                await writer.drain()
+            except ConnectionError:
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            self._conns.discard(asyncio.current_task())
+            writer.close()
+
+def webhook_routes(server, app, secret=WEBHOOK_SECRET):
+    """נתיב העדכונים מטלגרם + /healthz"""
+
+    async def receive_update(request):
+        # השוואה כבתים: compare_digest על str עם תווים שאינם ASCII זורק TypeError (500 במקום 403)
+        token = request.headers.get("x-telegram-bot-api-secret-token", "").encode("latin-1")
+        if secret and not hmac.compare_digest(token, secret.encode("utf-8")):
+            return json_response(403, {"ok": False})
+        if server.draining:
+            return json_response(503, {"ok": False})
+        try:
+            update = Update.de_json(json.loads(request.body), app.bot)
+        except Exception as e:
+            logger.warning(f"Bad webhook payload: {e}")
+            return json_response(400, {"ok": False})
+        await app.update_queue.put(update)
+        return json_response(200, {"ok": True})
+
+    async def health(request):
+        status = 503 if server.draining else 200
+        return json_response(status, {
+            "status": "draining" if server.draining else "ok",
+            "update_queue": app.update_queue.qsize(),
+        })
+
+    server.route("POST", WEBHOOK_PATH, receive_update)
+    server.route("GET", "/healthz", health)
+
+async def serve_webhook(app):
+    """מחזור חיים מלא במצב webhook (כמו run_polling, עם שרת משלנו)"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    # כתובת ציבורית בלי סוד = כל מי שמכיר אותה יכול להזריק עדכונים. סוד שנוצר
+    # כאן נרשם מול טלגרם בכל הפעלה, כך שאין צורך לשמור אותו
+    secret = WEBHOOK_SECRET
+    if WEBHOOK_URL and not secret:
+        secret = secrets.token_urlsafe(32)
+        logger.info("WEBHOOK_SECRET not set, using a generated secret for this run")
+    elif not secret:
+        logger.warning("Webhook server runs without WEBHOOK_SECRET – updates are not authenticated")
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    if WEBHOOK_URL:
+        await app.bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=secret,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    await app.start()
+
+    server = HttpServer(WEBHOOK_LISTEN, WEBHOOK_PORT)
+    webhook_routes(server, app, secret)
+    await server.start()
+    logger.info(f"Webhook server listening on {WEBHOOK_LISTEN}:{server.port}{WEBHOOK_PATH}")
+
+    await stop.wait()
+    logger.info("Draining webhook server...")
+    # קודם מפסיקים לקבל עדכונים, אחר כך app.stop() מעבד את מה שכבר בתור
+    await server.stop()
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+# ══════════════════════════════════════════════════════════
+#                         מדדים
+# ══════════════════════════════════════════════════════════
+# זמני מטפלים לפי שלב בשיחה, קריאות Bot API לפי method (מספר, זמן, RetryAfter,
+# Forbidden) ומדדים רגעיים. חשיפה בפורמט Prometheus ב-/metrics על שרת נפרד
+# (METRICS_LISTEN:METRICS_PORT, ברירת מחדל loopback – לא על שרת ה-webhook
+# הציבורי) ובפקודת /stats למנהל.
+
+METRICS_PORT   = int(os.environ.get("METRICS_PORT", "0"))   # 0 = בלי שרת מדדים
+METRICS_LISTEN = os.environ.get("METRICS_LISTEN", "127.0.0.1")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STARTED_AT = time.time()
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, key)} {value}"
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_text, labels, buckets
+        self.series = {}   # תוויות → [מונים לכל דלי..., סכום, מספר]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def quantile(self, q, key):
+        """הערכת אחוזון לפי גבולות הדליים (הגבול העליון של הדלי)"""
+        series = self.series[key]
+        target, seen = q * series[-1], 0
+        for i, bound in enumerate(self.buckets):
+            seen += series[i]
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), key + (bound,))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {series[-2]:.6f}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {series[-1]}"
+
+class Gauge:
+    """ערך רגעי שמחושב בזמן הקריאה; עם labels – fn מחזירה {תוויות: ערך}"""
+
+    def __init__(self, name, help_text, fn, labels=()):
+        self.name, self.help, self.fn, self.labels = name, help_text, fn, labels
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        try:
+            if not self.labels:
+                yield f"{self.name} {self.fn()}"
+                return
+            for key, value in sorted(self.fn().items()):
+                yield f"{self.name}{_labels(self.labels, key)} {value}"
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} unavailable: {e}")
+
+class Metrics:
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help_text, labels=()):
+        return self.metrics.setdefault(name, Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=()):
+        return self.metrics.setdefault(name, Histogram(name, help_text, labels))
+
+    def gauge(self, name, help_text, fn, labels=()):
+        self.metrics[name] = Gauge(name, help_text, fn, labels)
+
+    def render(self):
+        return "\n".join(line for metric in self.metrics.values() for line in metric.render()) + "\n"
+
+METRICS = Metrics()
+HANDLER_SECONDS = METRICS.histogram("bot_handler_seconds", "Handler latency by conversation state", ("state", "handler"))
+HANDLER_ERRORS  = METRICS.counter("bot_handler_errors_total", "Handlers that raised", ("state", "handler"))
+API_SECONDS     = METRICS.histogram("bot_api_request_seconds", "Bot API call latency by method", ("method",))
+API_RETRY_AFTER = METRICS.counter("bot_api_retry_after_total", "RetryAfter (429) responses", ("method",))
+API_FORBIDDEN   = METRICS.counter("bot_api_forbidden_total", "Forbidden (403) responses", ("method",))
+API_ERRORS      = METRICS.counter("bot_api_errors_total", "Other Bot API errors", ("method",))
+CONTENT_BLOCKED = METRICS.counter("bot_content_blocked_total", "Anonymous posts held back before sending, by reason", ("reason",))
+API_LANE_WAIT   = METRICS.histogram("bot_api_lane_wait_seconds", "Wait for the shared send rate, by lane", ("lane",))
+METRICS.gauge("bot_api_lane_queue", "Sends waiting for the shared rate, by lane", LANES.depth, ("lane",))
+METRICS.gauge("bot_members", "Approved members, by loaded tenant",
+              lambda: {(t.key,): len(t.store.members) for t in TENANTS.loaded()}, ("tenant",))
+METRICS.gauge("bot_pending_applications", "Applications awaiting review, by loaded tenant",
+              lambda: {(t.key,): len(t.store.data["pending"]) for t in TENANTS.loaded()}, ("tenant",))
+METRICS.gauge("bot_tenants_loaded", "Tenants with state in memory", lambda: len(TENANTS.loaded()))
+METRICS.gauge("bot_outbox_pending_deliveries", "Queued outgoing messages", lambda: OUTBOX.pending_deliveries())
+METRICS.gauge("bot_timers_scheduled", "Scheduled durable timers", lambda: len(TIMERS))
+METRICS.gauge("bot_uptime_seconds", "Seconds since start", lambda: round(time.time() - STARTED_AT))
+
+def _timed(callback, state):
+    async def timed(update, ctx):
+        started = time.perf_counter()
+        try:
+            return await callback(update, ctx)
+        except Exception:
+            HANDLER_ERRORS.inc(state=state, handler=callback.__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, state=state, handler=callback.__name__)
+    timed.__name__ = callback.__name__
+    return timed
+
+def instrument_handlers(app):
+    """עטיפת כל המטפלים במדידת זמן, עם תווית השלב בשיחה"""
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                groups = [("entry", handler.entry_points), ("fallback", handler.fallbacks)]
+                groups += [(STATE_NAMES.get(state, str(state)), hs) for state, hs in handler.states.items()]
+                for state, inner in groups:
+                    for h in inner:
+                        h.callback = _timed(h.callback, state)
+            else:
+                handler.callback = _timed(handler.callback, "-")
+
+class MetricsRateLimiter(BaseRateLimiter):
+    """נקודת ההרחבה של PTB שעוטפת כל קריאה ל-Bot API: מדידה + תקרת הקצב לפי נתיב"""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        await LANES.stop()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        limited = endpoint in RATE_LIMITED_METHODS
+        lane = API_LANE.get()
+        for attempt in range(2):
+            if limited:
+                queued = time.perf_counter()
+                await LANES.acquire(lane)
+                API_LANE_WAIT.observe(time.perf_counter() - queued, lane=lane)
+            started = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                API_RETRY_AFTER.inc(method=endpoint)
+                if not limited:
+                    raise
+                LANES.pause(float(e.retry_after), lane)
+                # הפצה מנסה שוב בעצמה (_deliver); תשובה למשתמש – פעם אחת, אם ההמתנה קצרה
+                if lane != "interactive" or attempt or float(e.retry_after) > INTERACTIVE_RETRY_MAX:
+                    raise
+            except Forbidden:
+                API_FORBIDDEN.inc(method=endpoint)
+                raise
+            except TelegramError:
+                API_ERRORS.inc(method=endpoint)
+                raise
+            finally:
+                API_SECONDS.observe(time.perf_counter() - started, method=endpoint)
+
+def metrics_routes(server):
+    async def metrics(request):
+        return 200, "text/plain; version=0.0.4; charset=utf-8", METRICS.render()
+
+    server.route("GET", "/metrics", metrics)
+
+def _ms(seconds):
+    return "∞" if seconds == float("inf") else f"{seconds * 1000:g}ms"
+
+async def admin_stats(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """מנהל: /stats – תקציר המדדים"""
+    if not is_admin(update.effective_user.id):
+        return
+    data = load_data()
+    uptime = timedelta(seconds=round(time.time() - STARTED_AT))
+    api = sorted(((series[-1], key[0], series[-2]) for key, series in API_SECONDS.series.items()
+                  if key[0] != "getUpdates"), reverse=True)
+    lines = [
+        "📊 סטטיסטיקה",
+        f"⏱ זמן פעולה: {uptime}",
+        f"👥 חברים: {len(STORE.members)} | ⏳ ממתינים: {len(data['pending'])}",
+        f"📬 הודעות בתור: {OUTBOX.pending_deliveries()} | ⏰ טיימרים: {len(TIMERS)}",
+        f"📡 Bot API: {sum(n for n, _, _ in api)} קריאות | "
+        f"429: {sum(API_RETRY_AFTER.values.values())} | 403: {sum(API_FORBIDDEN.values.values())} | "
+        f"שגיאות: {sum(API_ERRORS.values.values())}",
+    ]
+    if not TENANTS.single:
+        lines.insert(2, f"🏘 קבוצה: {current_tenant().key} | טעונות: {len(TENANTS.loaded())}/{len(TENANTS)}")
+    for count, method, total in api[:6]:
+        lines.append(f"  • {method}: {count} ({total / count * 1000:.0f}ms ממוצע)")
+    depth = LANES.depth()
+    for key in sorted(API_LANE_WAIT.series):
+        lines.append(f"  🚦 {key[0]}: ממתינות {depth.get(key, 0)} | המתנה p50 / p95: "
+                     f"{_ms(API_LANE_WAIT.quantile(0.5, key))} / {_ms(API_LANE_WAIT.quantile(0.95, key))}")
+    lines.append("⚙️ מטפלים (p50 / p95):")
+    busiest = sorted(HANDLER_SECONDS.series.items(), key=lambda item: -item[1][-1])[:8]
+    for key, series in busiest:
+        state, handler = key
+        lines.append(f"  • {handler} [{state}]: {series[-1]} | "
+                     f"{_ms(HANDLER_SECONDS.quantile(0.5, key))} / {_ms(HANDLER_SECONDS.quantile(0.95, key))}")
+    await update.message.reply_text("\n".join(lines))
+
 # ══════════════════════════════════════════════════════════
 #                      הרצה
 # ══════════════════════════════════════════════════════════
 
-def main():
-    app = Application.builder().token(BOT_TOKEN).build()
+async def post_init(app: Application):
+    if TENANTS.single:
+        TENANTS.single.open()   # קבוצה יחידה – נטענת בעלייה; כמה קבוצות – בפנייה הראשונה
+    METRICS.gauge("bot_update_queue_size", "Updates waiting to be processed", app.update_queue.qsize)
+    if METRICS_PORT:
+        server = app.bot_data["metrics_server"] = HttpServer(METRICS_LISTEN, METRICS_PORT)
+        metrics_routes(server)
+        await server.start()
+        logger.info(f"Metrics on http://{METRICS_LISTEN}:{server.port}/metrics")
+    OUTBOX.open()
+    # משימות שליחה שנקטעו בהפעלה הקודמת
+    asyncio.get_running_loop().create_task(OUTBOX.resume(app.bot))
+    TIMERS.start(app.bot)
+    asyncio.get_running_loop().create_task(cooldown_sweeper())
+    asyncio.get_running_loop().create_task(tenant_sweeper())
+
+async def post_shutdown(app: Application):
+    if "metrics_server" in app.bot_data:
+        await app.bot_data.pop("metrics_server").stop()
+    await TIMERS.stop()
+    OUTBOX.close()
+    await TENANTS.close_all()
+
+def build_application(bot=None):
+    """האפליקציה עם כל המטפלים; bot – מופע Bot חלופי (למשל בבנצ'מרק)"""
+    if bot is not None:
+        builder = Application.builder().bot(bot)
+    else:
+        request = LaneRequest()
+        METRICS.gauge("bot_api_lane_in_flight", "Bot API requests in flight, by lane",
+                      lambda: {(lane,): n for lane, n in request.in_flight.items()}, ("lane",))
+        builder = (
+            Application.builder().token(BOT_TOKEN).base_url(BOT_API_URL)
+            .request(request).rate_limiter(MetricsRateLimiter())
+        )
+    app = (
+        builder
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .persistence(SqlitePersistence(SESSIONS_FILE))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
-    conv = ConversationHandler(
+    conv = TenantConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
             # תפריט ראשי
@@ -832,14 +4509,33 @@ def main():
             CONFESSION_MSG: [MessageHandler(filters.TEXT & ~filters.COMMAND, confession_msg)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="main",
+        persistent=True,
     )
 
     app.add_handler(conv)
+    app.add_handler(MessageHandler(ALBUM_PART, album_part))
     app.add_handler(CallbackQueryHandler(admin_decision, pattern="^(approve|reject)_"))
+    app.add_handler(CallbackQueryHandler(members_browser, pattern="^mlist:"))
+    app.add_handler(CommandHandler("review", admin_review))
+    app.add_handler(CallbackQueryHandler(review_callback, pattern="^review:"))
+    app.add_handler(CommandHandler("rejected", admin_rejected_lookup))
+    app.add_handler(CommandHandler("stats", admin_stats))
+    app.add_handler(CommandHandler("filter", admin_filter))
+    app.add_handler(CommandHandler("bulk", admin_bulk))
+    app.add_handler(CallbackQueryHandler(bulk_confirm, pattern="^bulk:"))
     app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, new_member_joined))
+    instrument_handlers(app)
+    app.add_handler(TypeHandler(Update, route_tenant), group=-1)
+    return app
 
+def main():
+    app = build_application()
     logger.info("Bot started!")
-    app.run_polling()
+    if RUN_MODE == "webhook":
+        asyncio.run(serve_webhook(app))
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,487 @@
+"""
+בדיקת עומס מקצה לקצה: שרת Bot API מדומה + מחולל עומס.
+
+השרת עונה על getUpdates / sendMessage / sendPhoto / banChatMember /
+createChatInviteLink (ועוד) עם השהיה מוגדרת, ויכול להחזיר 429 (RetryAfter)
+ו-403 (משתמש שחסם את הבוט). מחולל העומס מדמה אלפי משתמשים שעוברים את שאלון
+ההצטרפות במקביל, מנהל שעובר על תור הבקשות (/review) ומאשר/דוחה כל מבקש,
+ובסוף הפצה לכל המשתמשים.
+
+שימוש:
+    python loadtest.py --spawn-bot --users 2000 --concurrency 500
+    python loadtest.py --spawn-bot --latency 50 --p429 0.01 --p403 0.02 --output load.json
+
+    # הבוט מגביל את עצמו ל-API_RATE הודעות לשנייה; למדידת קצב העיבוד עצמו:
+    python loadtest.py --spawn-bot --bot-env API_RATE=0
+
+    # או מול בוט שרץ בנפרד (מחולל העומס ממתין עד שהבוט מתחיל getUpdates):
+    python loadtest.py --port 8081 --users 500 &
+    BOT_API_URL=http://127.0.0.1:8081/bot BOT_TOKEN=123:load ADMIN_ID=1 REVIEW_DIGEST_DELAY=1 python bot.py
+
+    # רק השרת המדומה, לניסויים ידניים:
+    python loadtest.py --serve --port 8081 --latency 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+from urllib.parse import parse_qsl
+
+from bench import percentiles
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ADMIN_ID = 1
+GROUP_ID = -1001
+BOT_USER = {"id": 999, "is_bot": True, "first_name": "Load", "username": "load_bot"}
+FIRST_USER_UID = 70_000_000
+
+SEND_METHODS = {"sendMessage", "sendPhoto", "sendVideo", "sendDocument", "copyMessage", "sendMediaGroup"}
+MESSAGE_METHODS = SEND_METHODS | {"editMessageText"}
+INT_FIELDS = {"chat_id", "from_chat_id", "message_id", "user_id", "member_limit", "offset", "limit", "timeout"}
+JSON_FIELDS = {"reply_markup", "entities", "caption_entities", "allowed_updates", "media"}
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 429: "Too Many Requests"}
+
+# ══════════════════════════════════════════════════════════
+#                  שרת Bot API מדומה
+# ══════════════════════════════════════════════════════════
+
+class FakeTelegram:
+    """Bot API מינימלי בזיכרון: תור עדכונים ל-getUpdates ורישום כל קריאה יוצאת"""
+
+    def __init__(self, latency=0.0, jitter=0.0, p429=0.0, p403=0.0, retry_after=1, flood_limit=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.p429 = p429
+        self.p403 = p403
+        self.retry_after = retry_after
+        self.flood_limit = flood_limit   # שליחות לשנייה לפני 429 (0 – ללא הגבלה)
+
+        self.updates = deque()
+        self.next_update_id = 1
+        self._new_updates = asyncio.Event()
+        self.polling = asyncio.Event()      # הבוט התחיל getUpdates
+
+        self.inbox = defaultdict(asyncio.Queue)   # chat_id → (method, params, זמן)
+        self.delivered = defaultdict(set)         # טקסט → chat_ids שהטיפול בהם הסתיים (200/403)
+        self.calls = Counter()
+        self.injected = Counter()
+        self._sends = deque()
+        self._message_id = 0
+
+    # ── צד מחולל העומס ──
+
+    def push(self, update):
+        update["update_id"] = self.next_update_id
+        self.next_update_id += 1
+        self.updates.append(update)
+        self._new_updates.set()
+
+    def blocked(self, chat_id):
+        """משתמשים "חוסמים" קבועים – אותו משתמש תמיד מחזיר 403"""
+        return chat_id > 0 and chat_id != ADMIN_ID and (chat_id * 2654435761 % 10000) < self.p403 * 10000
+
+    # ── צד הבוט ──
+
+    async def get_updates(self, params):
+        self.polling.set()
+        offset = params.get("offset") or 0
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout=min(params.get("timeout") or 0, 5))
+            except asyncio.TimeoutError:
+                pass
+        limit = params.get("limit") or 100
+        return 200, {"ok": True, "result": [u for u, _ in zip(self.updates, range(limit))]}
+
+    def _flooded(self):
+        if not self.flood_limit:
+            return False
+        now = time.monotonic()
+        while self._sends and self._sends[0] < now - 1:
+            self._sends.popleft()
+        if len(self._sends) >= self.flood_limit:
+            return True
+        self._sends.append(now)
+        return False
+
+    def _message(self, params):
+        self._message_id += 1
+        chat_id = params.get("chat_id", 0)
+        msg = {"message_id": self._message_id, "date": int(time.time()), "from": BOT_USER,
+               "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}}
+        if "text" in params:
+            msg["text"] = params["text"]
+        if "caption" in params:
+            msg["caption"] = params["caption"]
+        return msg
+
+    async def call(self, method, params):
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return await self.get_updates(params)
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+
+        chat_id = params.get("chat_id", 0)
+        if method in SEND_METHODS:
+            if self.blocked(chat_id):
+                self.injected["403"] += 1
+                self.delivered[params.get("text") or params.get("caption")].add(chat_id)
+                return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+            if self._flooded() or random.random() < self.p429:
+                self.injected["429"] += 1
+                return 429, {"ok": False, "error_code": 429,
+                             "description": f"Too Many Requests: retry after {self.retry_after}",
+                             "parameters": {"retry_after": self.retry_after}}
+
+        if method in MESSAGE_METHODS:
+            result = self._message(params)
+            if method == "sendMediaGroup":
+                result = [result]
+            if method in SEND_METHODS:
+                self.delivered[params.get("text") or params.get("caption")].add(chat_id)
+        elif method == "createChatInviteLink":
+            result = {"invite_link": f"https://t.me/+load{self._message_id}", "creator": BOT_USER,
+                      "creates_join_request": False, "is_primary": False, "is_revoked": False,
+                      "member_limit": params.get("member_limit")}
+        else:
+            result = True   # answerCallbackQuery, banChatMember, deleteMessage, deleteWebhook...
+
+        if chat_id:
+            self.inbox[chat_id].put_nowait((method, params, time.perf_counter()))
+        return 200, {"ok": True, "result": result}
+
+    # ── HTTP ──
+
+    @staticmethod
+    def _params(headers, body):
+        ctype = headers.get("content-type", "")
+        if ctype.startswith("application/json"):
+            return json.loads(body or b"{}")
+        params = {}
+        for key, value in parse_qsl(body.decode("utf-8")):
+            if key in INT_FIELDS:
+                value = int(value)
+            elif key in JSON_FIELDS:
+                value = json.loads(value)
+            params[key] = value
+        return params
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                _, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                method = target.split("?", 1)[0].rsplit("/", 1)[-1]
+                if headers.get("content-type", "").startswith("multipart/"):
+                    status, payload = 400, {"ok": False, "error_code": 400, "description": "file uploads are not supported"}
+                else:
+                    status, payload = await self.call(method, self._params(headers, body))
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass   # CancelledError – חיבורים פתוחים (long polling) בסגירת הלולאה
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        return await asyncio.start_server(self._client, host, port)
+
+# ══════════════════════════════════════════════════════════
+#                    מחולל עומס
+# ══════════════════════════════════════════════════════════
+
+class LoadGenerator:
+    def __init__(self, tg, step_timeout, approve_ratio, admin_delay):
+        self.tg = tg
+        self.step_timeout = step_timeout
+        self.approve_ratio = approve_ratio
+        self.admin_delay = admin_delay
+        self.latency = defaultdict(list)
+        self.outcomes = Counter()
+        self.decided_at = {}                    # uid → זמן הלחיצה של המנהל
+        self.decided = set()                    # uid-ים שהמנהל כבר לחץ עליהם (עמוד חוזר בתור)
+        self.admin_inbox = asyncio.Queue()      # הודעות למנהל שאינן בקשות הצטרפות
+        self._message_id = 0
+
+    def _user(self, uid):
+        return {"id": uid, "is_bot": False, "first_name": f"u{uid}", "username": f"u{uid}"}
+
+    def message(self, uid, text=None, photo=None):
+        self._message_id += 1
+        msg = {"message_id": self._message_id, "date": int(time.time()),
+               "chat": {"id": uid, "type": "private"}, "from": self._user(uid)}
+        if text is not None:
+            msg["text"] = text
+            if text.startswith("/"):
+                msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        if photo is not None:
+            msg["photo"] = [{"file_id": photo, "file_unique_id": photo, "width": 800, "height": 600}]
+        return {"message": msg}
+
+    def callback(self, uid, data, message=None):
+        """לחיצה על כפתור; message – הפרמטרים של ההודעה שבה הכפתור (טקסט + מקלדת)"""
+        self._message_id += 1
+        msg = {"message_id": self._message_id, "date": int(time.time()),
+               "chat": {"id": uid, "type": "private"}, "text": "menu"}
+        if message is not None:
+            msg.update(text=message.get("text", ""), reply_markup=message.get("reply_markup"))
+        return {"callback_query": {
+            "id": f"{uid}-{self._message_id}", "chat_instance": "load", "data": data, "from": self._user(uid),
+            "message": msg,
+        }}
+
+    async def expect(self, chat_id, methods):
+        """הקריאה הבאה של הבוט לצ'אט הזה מאחד הסוגים המבוקשים"""
+        inbox = self.tg.inbox[chat_id]
+        deadline = time.perf_counter() + self.step_timeout
+        while True:
+            method, params, at = await asyncio.wait_for(inbox.get(), timeout=max(0.0, deadline - time.perf_counter()))
+            if method in methods:
+                return params, at
+
+    async def step(self, name, uid, update, methods=("sendMessage",)):
+        started = time.perf_counter()
+        self.tg.push(update)
+        params, at = await self.expect(uid, methods)
+        self.latency[name].append(at - started)
+        return params
+
+    async def onboarding(self, uid):
+        try:
+            await self.step("start", uid, self.message(uid, "/start"))
+            await self.step("menu_questionnaire", uid, self.callback(uid, "menu_questionnaire"), ("editMessageText",))
+            await self.step("q_lastname", uid, self.message(uid, "חלבי"))
+            await self.step("q_village", uid, self.message(uid, "עספיא"))
+            await self.step("q_photo", uid, self.message(uid, photo=f"id-{uid}"))
+            await self.step("q_unit", uid, self.message(uid, "גולני"))
+            await self.step("q_rank", uid, self.message(uid, "סמל"))
+            await self.step("q_history", uid, self.message(uid, "-"))
+            # תשובת המנהל מגיעה כהודעה נוספת
+            params, at = await self.expect(uid, ("sendMessage",))
+            self.latency["decision"].append(at - self.decided_at.pop(uid, at))
+            self.outcomes["approved" if "אושרה" in params.get("text", "") else "rejected"] += 1
+        except asyncio.TimeoutError:
+            self.outcomes["timeout"] += 1
+
+    async def admin(self):
+        """המנהל: כל התראה על בקשות ממתינות → דפדוף בתור עד סופו ואישור/דחייה של כל מבקש"""
+        rng = random.Random(7)
+        reviewing = missed = False      # התראה שהגיעה באמצע דפדוף נפתחת בסופו
+        while True:
+            method, params = await self._admin_next()
+            buttons = [b.get("callback_data", "") for row in (params.get("reply_markup") or {}).get("inline_keyboard", [])
+                       for b in row]
+            text = params.get("text", "")
+            if method == "sendMessage" and text.startswith("🔔") and "review:next" in buttons:
+                if reviewing:
+                    missed = True
+                else:
+                    reviewing = True
+                    self.tg.push(self.callback(ADMIN_ID, "review:next", params))
+                continue
+            if method == "sendMessage" and (text.startswith("✅ אין בקשות") or text.startswith("סוף התור")):
+                reviewing = False
+            # עדכוני הודעת הבקרה (editMessageText) חוזרים עם הכפתורים שנותרו – מתעלמים מהם
+            elif method != "sendMessage" or not any(b.startswith("review:a:") for b in buttons):
+                self.admin_inbox.put_nowait(params)
+                continue
+            for approve in (b for b in buttons if b.startswith("review:a:")):
+                uid = int(approve.rsplit(":", 1)[1])
+                if uid in self.decided:
+                    continue
+                self.decided.add(uid)
+                if self.admin_delay:
+                    await asyncio.sleep(self.admin_delay)
+                action = approve if rng.random() < self.approve_ratio else f"review:r:{uid}:data"
+                self.decided_at[uid] = time.perf_counter()
+                self.tg.push(self.callback(ADMIN_ID, action, params))
+            following = next((b for b in buttons if b.startswith("review:next:")), None)
+            if following:
+                self.tg.push(self.callback(ADMIN_ID, following, params))
+                continue
+            reviewing = missed
+            if missed:
+                missed = False
+                self.tg.push(self.callback(ADMIN_ID, "review:next"))
+
+    async def _admin_next(self):
+        while True:
+            method, params, _ = await self.tg.inbox[ADMIN_ID].get()
+            if method in MESSAGE_METHODS:
+                return method, params
+
+    async def admin_expect(self, predicate):
+        deadline = time.perf_counter() + self.step_timeout
+        while True:
+            params = await asyncio.wait_for(self.admin_inbox.get(), timeout=max(0.0, deadline - time.perf_counter()))
+            if predicate(params):
+                return params
+
+    async def broadcast(self, text, timeout):
+        """פעולת מנהל כבדה: הפצה לכל המשתמשים, עד שכל הנמענים טופלו"""
+        self.tg.push(self.message(ADMIN_ID, "/start"))
+        await self.admin_expect(lambda p: "reply_markup" in p)
+        self.tg.push(self.callback(ADMIN_ID, "menu_notify"))
+        await self.admin_expect(lambda p: "📨" in p.get("text", ""))
+        started = time.perf_counter()
+        self.tg.push(self.message(ADMIN_ID, text))
+        progress = await self.admin_expect(lambda p: p.get("text", "").startswith("📨 שולח ל-"))
+        recipients = int(progress["text"].split("-", 1)[1].split()[0])
+        deadline = started + timeout
+        while len(self.tg.delivered[text]) < recipients and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        seconds = time.perf_counter() - started
+        done = len(self.tg.delivered[text])
+        return {"recipients": recipients, "delivered": done, "seconds": round(seconds, 3),
+                "per_second": round(done / seconds, 1) if seconds else None}
+
+# ══════════════════════════════════════════════════════════
+#                       הרצה
+# ══════════════════════════════════════════════════════════
+
+def spawn_bot(port, workdir, extra_env):
+    # התראת "בקשות ממתינות" כל שנייה, כדי שהמנהל המדומה לא יחכה 5 דקות
+    env = dict(os.environ, BOT_TOKEN="123:load", ADMIN_ID=str(ADMIN_ID), GROUP_ID=str(GROUP_ID),
+               BOT_API_URL=f"http://127.0.0.1:{port}/bot", RUN_MODE="polling", REVIEW_DIGEST_DELAY="1")
+    env.update(extra_env)
+    log = open(os.path.join(workdir, "bot.log"), "w")
+    return subprocess.Popen([sys.executable, os.path.join(HERE, "bot.py")], cwd=workdir, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+
+async def run(args):
+    tg = FakeTelegram(latency=args.latency / 1000, jitter=args.jitter / 1000, p429=args.p429, p403=args.p403,
+                      retry_after=args.retry_after, flood_limit=args.flood_limit)
+    server = await tg.serve(args.host, args.port)
+    port = server.sockets[0].getsockname()[1]
+    print(f"fake Bot API on http://{args.host}:{port}/bot", file=sys.stderr)
+
+    proc = workdir = None
+    if args.spawn_bot:
+        workdir = tempfile.mkdtemp(prefix="loadtest-")
+        proc = spawn_bot(port, workdir, dict(kv.split("=", 1) for kv in args.bot_env))
+    try:
+        await asyncio.wait_for(tg.polling.wait(), timeout=60)
+    except asyncio.TimeoutError:
+        sys.exit(f"bot did not start polling (log: {workdir and os.path.join(workdir, 'bot.log')})")
+
+    gen = LoadGenerator(tg, args.step_timeout, args.approve_ratio, args.admin_delay)
+    admin = asyncio.get_running_loop().create_task(gen.admin())
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def user(i):
+        if args.ramp:
+            await asyncio.sleep(args.ramp * i / args.users)
+        async with sem:
+            await gen.onboarding(FIRST_USER_UID + i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(args.users)))
+    onboarding_seconds = time.perf_counter() - started
+    updates = tg.next_update_id - 1
+
+    bulk = None
+    if args.broadcast:
+        bulk = await gen.broadcast(f"load test broadcast {datetime.now().isoformat()}", args.broadcast_timeout)
+
+    admin.cancel()
+    if proc is not None:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    server.close()
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "bot_env")},
+        "onboarding": {
+            "users": args.users,
+            "seconds": round(onboarding_seconds, 3),
+            "updates": updates,
+            "updates_per_second": round(updates / onboarding_seconds, 1),
+            "outcomes": dict(gen.outcomes),
+        },
+        "steps": {name: percentiles(samples) for name, samples in gen.latency.items()},
+        "broadcast": bulk,
+        "api_calls": dict(sorted(tg.calls.items())),
+        "injected_errors": dict(tg.injected),
+        "bot_workdir": workdir,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="בדיקת עומס מול שרת Bot API מדומה")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 – פורט פנוי אקראי")
+    parser.add_argument("--spawn-bot", action="store_true", help="הרצת bot.py בתיקייה זמנית מול השרת")
+    parser.add_argument("--bot-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="משתני סביבה נוספים לבוט (למשל STORAGE=sqlite)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200, help="משתמשים פעילים בו-זמנית")
+    parser.add_argument("--ramp", type=float, default=0.0, help="שניות לפיזור תחילת המשתמשים")
+    parser.add_argument("--approve-ratio", type=float, default=0.8)
+    parser.add_argument("--admin-delay", type=float, default=0.0, help="שניות עד שהמנהל מחליט")
+    parser.add_argument("--latency", type=float, default=0.0, help="השהיית כל קריאת API (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="השהיה אקראית נוספת (ms)")
+    parser.add_argument("--p429", type=float, default=0.0, help="הסתברות ל-429 בשליחה")
+    parser.add_argument("--p403", type=float, default=0.0, help="שיעור המשתמשים שחסמו את הבוט")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--flood-limit", type=int, default=0, help="שליחות לשנייה לפני 429 (0 – ללא)")
+    parser.add_argument("--step-timeout", type=float, default=30.0)
+    parser.add_argument("--no-broadcast", dest="broadcast", action="store_false")
+    parser.add_argument("--broadcast-timeout", type=float, default=600.0)
+    parser.add_argument("--serve", action="store_true", help="רק השרת המדומה, בלי מחולל עומס")
+    parser.add_argument("--output", help="קובץ JSON לתוצאות (ברירת מחדל: stdout)")
+    args = parser.parse_args()
+
+    if args.serve:
+        async def serve_forever():
+            tg = FakeTelegram(args.latency / 1000, args.jitter / 1000, args.p429, args.p403,
+                              args.retry_after, args.flood_limit)
+            server = await tg.serve(args.host, args.port or 8081)
+            print(f"fake Bot API on http://{args.host}:{args.port or 8081}/bot", file=sys.stderr)
+            async with server:
+                await server.serve_forever()
+        asyncio.run(serve_forever())
+        return
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+שליחת עדכוני Update מוקלטים לשרת ה-webhook המקומי – בדיקה בלי טלגרם.
+
+שימוש:
+    RUN_MODE=webhook python bot.py
+    python replay_updates.py sample_updates.jsonl
+    python replay_updates.py --health
+
+קלט: קובץ JSON (עדכון בודד או רשימה) או JSONL (עדכון בכל שורה).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+
+DEFAULT_URL = f"http://127.0.0.1:{os.environ.get('PORT', '8080')}{os.environ.get('WEBHOOK_PATH', '/telegram')}"
+
+def load_updates(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if not text:
+        return []
+    if text[0] == "[":
+        return json.loads(text)
+    if text[0] == "{" and "\n{" not in text:
+        return [json.loads(text)]
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def post(url, secret, update):
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(update, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def health(url):
+    parts = urlparse(url)
+    with urllib.request.urlopen(f"{parts.scheme}://{parts.netloc}/healthz", timeout=5) as resp:
+        return resp.read().decode("utf-8")
+
+def main():
+    parser = argparse.ArgumentParser(description="שליחת עדכונים מוקלטים ל-webhook מקומי")
+    parser.add_argument("files", nargs="*", help="קבצי JSON / JSONL של עדכונים")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--secret", default=os.environ.get("WEBHOOK_SECRET", ""))
+    parser.add_argument("--delay", type=float, default=0.0, help="שניות בין עדכונים")
+    parser.add_argument("--health", action="store_true", help="בדיקת /healthz בלבד")
+    args = parser.parse_args()
+
+    if args.health:
+        print(health(args.url))
+        return
+
+    ok = failed = 0
+    for path in args.files:
+        for update in load_updates(path):
+            status = post(args.url, args.secret, update)
+            print(f"update {update.get('update_id')}: {status}")
+            if status == 200:
+                ok += 1
+            else:
+                failed += 1
+            if args.delay:
+                time.sleep(args.delay)
+    print(f"sent {ok}, failed {failed}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "123:test")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("GROUP_ID", "-1001")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+ADMIN_ID = 1
+GROUP_ID = -1001
+
+
+def member(number, lastname="חלבי", village="עספיא"):
+    return {"number": number, "lastname": lastname, "village": village, "unit": "גולני",
+            "rank": "סמל", "warnings": 0, "joined": "2024-01-01T00:00:00"}
+
+
+def pending(uid, lastname="עזאם"):
+    return {"user_id": uid, "username": f"u{uid}", "timestamp": "2024-01-01T00:00:00",
+            "answers": {"lastname": lastname, "village": "ירכא", "unit": "גבעתי", "rank": "טוראי",
+                        "history": "-", "photo_id": "p"}}
+
+
+class Sent:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+
+class Invite:
+    def __init__(self, link):
+        self.invite_link = link
+
+
+class FakeBot:
+    """Bot מדומה: רושם שליחות; errors – chat_id → חריגה (או רשימת חריגות לפי הסדר)"""
+
+    def __init__(self, errors=None):
+        self.errors = dict(errors or {})
+        self.sent = []
+        self.invites = 0
+        self.deleted = []
+
+    def _raise(self, chat_id):
+        error = self.errors.get(chat_id)
+        if isinstance(error, list):
+            error = error.pop(0) if error else None
+        if error is not None:
+            raise error
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self._raise(chat_id)
+        self.sent.append((chat_id, text))
+        return Sent(len(self.sent))
+
+    async def create_chat_invite_link(self, chat_id, member_limit=None, name=None):
+        self.invites += 1
+        return Invite(f"https://t.me/+invite{self.invites}")
+
+    async def delete_message(self, chat_id, message_id):
+        self.deleted.append((chat_id, message_id))
+
+
+class Progress:
+    """הודעת התקדמות מדומה (edit_text)"""
+
+    def __init__(self):
+        self.text = None
+
+    async def edit_text(self, text):
+        self.text = text
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    bot.OUTBOX.close()
+    if bot.TIMERS.conn is not None:
+        bot.TIMERS.conn.close()
+        bot.TIMERS.conn = None
+        bot.TIMERS._heap = []
+
+
+@pytest.fixture
+def tenant(workdir, monkeypatch):
+    """קבוצה יחידה בתיקייה זמנית"""
+    tenant = bot.Tenant(bot.DEFAULT_TENANT, GROUP_ID, [ADMIN_ID])
+    monkeypatch.setattr(bot, "TENANTS", bot.TenantRegistry([tenant]))
+    return tenant
+
+
+@pytest.fixture
+def run(tenant):
+    """הרצת קורוטינה כשהקבוצה טעונה, וסגירתה (כתיבה לדיסק) בסוף"""
+    def runner(fn):
+        async def main():
+            tenant.open()
+            try:
+                return await fn()
+            finally:
+                await tenant.close()
+        return asyncio.run(main())
+    return runner
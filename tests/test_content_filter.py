@@ -0,0 +1,108 @@
+import random
+
+import bot
+
+
+# ── Aho–Corasick ─────────────────────────────────────────
+
+def test_matcher_finds_overlapping_patterns():
+    matcher = bot.PatternMatcher(["he", "she", "his", "hers"])
+    assert matcher.search("ushers") == "she"
+    assert matcher.search("ahis") == "his"
+    assert matcher.search("xyz") is None
+    assert bot.PatternMatcher([]).search("anything") is None
+
+
+def test_matcher_agrees_with_substring_search():
+    rng = random.Random(3)
+    patterns = ["".join(rng.choice("abc") for _ in range(rng.randint(2, 5))) for _ in range(40)]
+    matcher = bot.PatternMatcher(patterns)
+    for _ in range(300):
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 30)))
+        found = matcher.search(text)
+        assert (found is not None) == any(p in text for p in patterns)
+        if found is not None:
+            assert found in text
+
+
+# ── נרמול ───────────────────────────────────────────────
+
+def test_normalize_folds_marks_case_punctuation_and_repeats():
+    assert bot.normalize_text("שָׁלוֹם, עולם!!!") == bot.normalize_text("שלום עולם")
+    assert bot.normalize_text("SPAM") == bot.normalize_text("spam")
+    assert bot.normalize_text("ספאאאאם") == bot.normalize_text("ספאם")
+    assert bot.normalize_text("a  b") == " a b "
+
+
+# ── רשימת חסימה ──────────────────────────────────────────
+
+def write_blocklist(path, *entries):
+    path.write_text("".join(f"{entry}\n" for entry in entries), encoding="utf-8")
+
+
+def test_blocklist_word_boundaries_and_wildcards(tmp_path):
+    path = tmp_path / "blocklist.txt"
+    write_blocklist(path, "# הערה", "זבל", "*קזינו*")
+    content = bot.ContentFilter(str(path))
+    assert content.check("איזה זבל של הודעה") == "blocklist"
+    assert content.check("זבלים") is None              # מילה שלמה בלבד
+    assert content.check("הימורים בקזינולנד") == "blocklist"
+    assert content.check("ז-ב-ל") == "blocklist"        # פיסוק בין האותיות לא עוקף
+    assert content.check("הודעה רגילה") is None
+
+
+def test_phone_and_personal_id(tmp_path):
+    content = bot.ContentFilter(str(tmp_path / "missing.txt"))
+    assert content.check("תתקשרו 050-123-4567") == "phone"
+    assert content.check("+972 52 1234567") == "phone"
+    assert content.check("٠٥٠١٢٣٤٥٦٧") == "phone"        # ספרות ערביות
+    assert content.check("ת.ז 000000018") == "id"        # ספרת ביקורת תקינה
+    assert content.check("מספר 123456789") is None       # 9 ספרות בלי ביקורת תקינה
+    assert content.check("") is None
+
+
+def test_add_and_remove_rebuild_immediately(tmp_path):
+    path = tmp_path / "blocklist.txt"
+    content = bot.ContentFilter(str(path))
+    assert content.check("מילה אסורה") is None
+    assert content.add("אסורה")
+    assert not content.add("אסורה")
+    assert content.check("מילה אסורה") == "blocklist"
+    assert path.read_text(encoding="utf-8") == "אסורה\n"
+    assert content.remove("אסורה")
+    assert content.check("מילה אסורה") is None
+
+
+# ── כפילויות והגבלת קצב ──────────────────────────────────
+
+def test_simhash_near_duplicates_are_close():
+    text = bot.normalize_text("מחפש שותף לנסיעה מדלית אל כרמל לחיפה ביום ראשון בבוקר")
+    # hash() משתנה בין תהליכים, לכן רק שינויים שהנרמול מבטל – המרחק 0 בכל הרצה
+    edited = bot.normalize_text("מחפש שותף לנסיעה!!! מדלית אל כרמל, לחיפה ביום ראשון בבוקקקר")
+    other = bot.normalize_text("מישהו יודע מתי נפתחת ההרשמה לקורס הנהיגה בעספיא")
+    assert bot.simhash(text) == bot.simhash(edited)
+    assert (bot.simhash(text) ^ bot.simhash(other)).bit_count() > bot.ANON_DUPLICATE_BITS
+
+
+def test_post_guard_blocks_duplicates_until_released():
+    guard = bot.PostGuard()
+    text = ["מחפש שותף לנסיעה מדלית אל כרמל לחיפה ביום ראשון בבוקר"]
+    assert not guard.duplicate(text, ["photo1"])
+    entry = guard.remember(text, ["photo1"])
+    assert guard.duplicate(text, [])
+    assert guard.duplicate(["משהו אחר לגמרי"], ["photo1"])
+    assert not guard.duplicate(["תודה!"], [])            # קצר מדי לבדיקת כפילות
+
+    guard.release(7, entry)
+    assert not guard.duplicate(text, ["photo1"])
+
+
+def test_post_guard_rate_limit_and_refund():
+    guard = bot.PostGuard()
+    for _ in range(bot.ANON_BURST):
+        assert guard.wait(7) == 0
+    assert guard.wait(7) > 0
+    assert guard.wait(8) == 0                             # לכל משתמש דלי משלו
+
+    guard.release(7, ([], []))                            # שליחה שנכשלה מחזירה את האסימון
+    assert guard.wait(7) == 0
@@ -0,0 +1,126 @@
+import asyncio
+
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+import bot
+from conftest import FakeBot, Progress, pending
+
+
+class Crash(BaseException):
+    """תהליך שנהרג באמצע שליחה (לא נתפס כמו Exception)"""
+
+
+def text(job_messages):
+    return [bot._text_payload(t) for t in job_messages]
+
+
+def test_send_records_each_recipient(tenant, run, monkeypatch):
+    monkeypatch.setattr(bot, "BROADCAST_RETRIES", 2)
+    fake = FakeBot({2: Forbidden("blocked"), 3: NetworkError("down"), 4: [RetryAfter(0)]})
+
+    async def main():
+        stats = await bot.OUTBOX.send(fake, [1, 2, 3, 4], text(["שלום"]))
+        assert stats == {"total": 4, "sent": 2, "failed": 1, "blocked": 1}
+        assert sorted(chat_id for chat_id, _ in fake.sent) == [1, 4]   # 4 נשלח אחרי RetryAfter
+        assert "2" in bot.load_data()["unreachable"]
+        assert bot.OUTBOX.pending_deliveries() == 0
+        assert bot.OUTBOX.unfinished() == []
+    run(main)
+
+
+def test_resume_sends_only_pending_recipients(tenant, run):
+    before = FakeBot({3: Crash()})
+
+    async def crash():
+        job_id = bot.OUTBOX.enqueue("broadcast", text(["הודעה"]), [1, 2, 3, 4])
+        try:
+            await bot.OUTBOX.run(job_id, before)
+        except Crash:
+            pass
+        bot.OUTBOX.close()
+        return job_id
+    job_id = run(crash)
+
+    fake = FakeBot()
+
+    async def restart():
+        await bot.OUTBOX.resume(fake)
+        assert {chat_id for chat_id, (status, _) in bot.OUTBOX.results(job_id).items()
+                if status == "sent"} == {1, 2, 3, 4}
+        assert bot.OUTBOX.unfinished() == []
+    run(restart)
+    # מי שקיבל לפני הקריסה לא מקבל שוב; 3 (שבו נקטעה השליחה) נשלח עכשיו
+    sent_before = {chat_id for chat_id, _ in before.sent}
+    sent_after = [chat_id for chat_id, _ in fake.sent]
+    assert sent_before and 3 in sent_after
+    assert sorted(sent_after) == sorted({1, 2, 3, 4} - sent_before)
+
+
+def test_personal_job_keeps_invite_across_restart(tenant, run):
+    async def crash():
+        job_id = bot.OUTBOX.enqueue("bulk_approved", [], [5], {5: {"number": 7, "lastname": "חלבי"}})
+        fake = FakeBot({5: Crash()})
+        try:
+            await bot.OUTBOX.run(job_id, fake)
+        except Crash:
+            pass
+        assert fake.invites == 1
+        bot.OUTBOX.close()
+        return job_id
+    job_id = run(crash)
+
+    fake = FakeBot()
+
+    async def restart():
+        await bot.OUTBOX.resume(fake)
+        status, data = bot.OUTBOX.results(job_id)[5]
+        assert status == "sent" and data["invite"] == "https://t.me/+invite1"
+    run(restart)
+    assert fake.invites == 0                          # הלינק שנשמר לפני הקריסה
+    assert "https://t.me/+invite1" in fake.sent[0][1]
+    assert "#007" in fake.sent[0][1]
+
+
+def test_bulk_approve_and_reject(tenant, run):
+    fake = FakeBot({12: Forbidden("blocked")})
+    progress = Progress()
+
+    async def main():
+        for uid in (10, 11, 12, 13):
+            bot.STORE.put_pending(uid, pending(uid))
+        approved = await bot.bulk_decide(fake, 1, "approve", [10, 11, 12, 99], "data", progress)
+        assert approved == {10: "sent", 11: "sent", 12: "blocked"}
+        members = bot.load_data()["members"]
+        assert sorted(members[str(uid)]["number"] for uid in (10, 11, 12)) == [1, 2, 3]
+        assert "דולגו 1" in progress.text and "חסם את הבוט" in progress.text
+
+        rejected = await bot.bulk_decide(fake, 1, "reject", [13], "photo", progress)
+        assert rejected == {13: "sent"}
+        assert "13" not in bot.load_data()["pending"]
+        assert bot.STORE.cooldowns.remaining(13) > 5 * 3600
+        assert bot.STORE.archive.lookup(13)[0]["reason"] == "photo"
+        assert bot.TIMERS.find("cooldown_expired") == [(1, {"uid": 13})]
+    run(main)
+    assert fake.invites == 3                          # גם למי שחסם נוצר לינק לפני השליחה
+    assert sum("בקשתך אושרה" in t for _, t in fake.sent) == 2
+
+
+def test_bulk_skips_applications_decided_meanwhile(tenant, run):
+    fake = FakeBot()
+
+    async def main():
+        bot.STORE.put_pending(10, pending(10))
+        assert await bot.decide(fake, 1, "approve", 10) is not None
+        assert await bot.decide(fake, 1, "approve", 10) is None   # לחיצה כפולה
+        assert await bot.bulk_decide(fake, 1, "approve", [10], "data", Progress()) == {}
+    run(main)
+    assert fake.invites == 1
+
+
+def test_concurrent_resume_runs_each_job_once(tenant, run):
+    async def main():
+        job_id = bot.OUTBOX.enqueue("broadcast", text(["x"]), [1, 2])
+        fake = FakeBot()
+        await asyncio.gather(bot.OUTBOX.run(job_id, fake), bot.OUTBOX.run(job_id, fake))
+        assert sorted(chat_id for chat_id, _ in fake.sent) == [1, 2]
+    run(main)
@@ -0,0 +1,68 @@
+import io
+import random
+
+import pytest
+
+import bot
+
+
+def test_hash_index_matches_brute_force():
+    rng = random.Random(5)
+    index = bot.HashIndex()
+    stored = {}
+    base = rng.getrandbits(64)
+    for item in range(2000):
+        # חצי מהטביעות קרובות לטביעת הבסיס, כדי שיהיו התאמות בכל מרחק
+        fingerprint = rng.getrandbits(64) if item % 2 else base ^ sum(1 << rng.randrange(64) for _ in range(rng.randint(0, 12)))
+        stored[item] = fingerprint
+        index.add(fingerprint, item)
+    for probe in (base, base ^ 0b1011, rng.getrandbits(64)):
+        expected = {(bin(probe ^ fp).count("1"), item) for item, fp in stored.items()
+                    if bin(probe ^ fp).count("1") <= bot.PHOTO_MATCH_BITS}
+        assert set(index.search(probe, bot.PHOTO_MATCH_BITS)) == expected
+
+
+def test_photo_index_persists_and_excludes_own_uid(tmp_path):
+    path = str(tmp_path / "photo_hashes.tsv")
+    index = bot.PhotoIndex(path)
+    index.add("fileA", 0xF0F0F0F0F0F0F0F0, 1)
+    index.add("fileB", None, 2)                       # בלי Pillow / הורדה שנכשלה
+    index.add("fileA", 0xF0F0F0F0F0F0F0F0, 3)
+
+    reopened = bot.PhotoIndex(path)
+    assert reopened.phash("fileA") == 0xF0F0F0F0F0F0F0F0
+    assert reopened.phash("fileB") is None
+    # אותו קובץ – מרחק 0; טביעה דומה – לפי המרחק; המבקש עצמו לא מופיע
+    assert reopened.matches("fileA", 0xF0F0F0F0F0F0F0F0, 1) == [[3, 0]]
+    assert reopened.matches("fileC", 0xF0F0F0F0F0F0F0F3, 9) == [[1, 2], [3, 2]]
+    assert reopened.matches("fileB", None, 7) == [[2, 0]]
+    assert reopened.matches("fileD", 0x0F0F0F0F0F0F0F0F, 9) == []
+
+
+def _jpeg(draw, size=(600, 400), quality=90):
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", size, "white")
+    draw(ImageDraw.Draw(image), size)
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+def test_perceptual_hash_survives_rescaling():
+    pytest.importorskip("PIL")
+
+    def certificate(d, size):
+        w, h = size
+        d.rectangle([w * 0.05, h * 0.1, w * 0.35, h * 0.7], fill="gray")
+        for i in range(6):
+            d.rectangle([w * 0.45, h * (0.15 + i * 0.12), w * 0.9, h * (0.2 + i * 0.12)], fill="black")
+
+    def other(d, size):
+        w, h = size
+        d.ellipse([w * 0.3, h * 0.1, w * 0.9, h * 0.9], fill="black")
+
+    original = bot.perceptual_hash(_jpeg(certificate))
+    rescanned = bot.perceptual_hash(_jpeg(certificate, size=(450, 300), quality=40))
+    different = bot.perceptual_hash(_jpeg(other))
+    assert (original ^ rescanned).bit_count() <= bot.PHOTO_MATCH_BITS
+    assert (original ^ different).bit_count() > bot.PHOTO_MATCH_BITS
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import bot
+from conftest import member, pending
+
+
+# ── JSON / SQLite ─────────────────────────────────────────
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_changes_survive_reload(tenant, run, monkeypatch, storage):
+    monkeypatch.setattr(bot, "STORAGE", storage)
+
+    async def write():
+        with bot.STORE.event("approved"):
+            bot.STORE.put_member(10, member(bot.STORE.next_member_number()))
+        bot.STORE.put_pending(20, pending(20))
+        bot.STORE.set_cooldown(30, 2_000_000_000)
+    run(write)
+
+    async def read():
+        data = bot.load_data()
+        assert data["members"]["10"]["number"] == 1
+        assert data["counter"] == 1
+        assert data["pending"]["20"]["answers"]["lastname"] == "עזאם"
+        assert data["cooldowns"]["30"] == 2_000_000_000
+        assert bot.find_member_by_number("001")[0] == 10
+    run(read)
+
+
+def test_json_store_writes_behind(workdir):
+    async def main():
+        store = bot.JsonStore("data.json", bot.RejectedArchive("rejected"))
+        store.load()
+        store.start()
+        store.put_member(10, member(1))
+        assert not os.path.exists("data.json")   # עוד לא – הכתיבה מושהית
+        await store.stop()
+        with open("data.json", encoding="utf-8") as f:
+            assert json.load(f)["members"]["10"]["number"] == 1
+    asyncio.run(main())
+
+
+def test_sqlite_imports_legacy_json_once(workdir):
+    with open("data.json", "w", encoding="utf-8") as f:
+        json.dump({"members": {"10": member(7)}, "pending": {}, "counter": 7,
+                   "rejected": [{"user_id": 5, "answers": {}, "rejected_at": "2024-01-02"}]}, f)
+    store = bot.SqliteStore("data.db", bot.RejectedArchive("rejected"), "data.json")
+    assert store.load()["members"]["10"]["number"] == 7
+    asyncio.run(store.stop())
+
+    store = bot.SqliteStore("data.db", bot.RejectedArchive("rejected"), "data.json")
+    assert store.load()["counter"] == 7
+    assert len(bot.RejectedArchive("rejected").lookup(5)) == 1
+
+
+def test_legacy_rejected_migration_is_idempotent(workdir):
+    records = [{"user_id": uid, "answers": {}, "rejected_at": f"2024-01-0{uid}"} for uid in (1, 2, 3)]
+    with open("data.json", "w", encoding="utf-8") as f:
+        json.dump({"members": {}, "pending": {}, "counter": 0, "rejected": records}, f)
+    # קריסה אחרי שחלק מהרשומות כבר נכתבו לארכיון, לפני שקובץ המצב נכתב מחדש
+    bot.RejectedArchive("rejected").extend(records[:2])
+
+    bot.JsonStore("data.json", bot.RejectedArchive("rejected")).load()
+
+    archive = bot.RejectedArchive("rejected")
+    assert [len(archive.lookup(uid)) for uid in (1, 2, 3)] == [1, 1, 1]
+    with open("data.json", encoding="utf-8") as f:
+        assert "rejected" not in json.load(f)
+
+
+# ── יומן אירועים ─────────────────────────────────────────
+
+def test_event_log_restores_unflushed_changes(tenant, run):
+    """קריסה לפני הכתיבה המושהית: המצב נבנה מהיומן"""
+    async def crash():
+        with bot.STORE.event("approved"):
+            bot.STORE.put_member(10, member(bot.STORE.next_member_number()))
+        # בלי tenant.close() – רק שחרור הקבצים, כמו תהליך שנהרג
+        tenant.store._task.cancel()
+        tenant.events.close()
+        tenant._drop()
+    asyncio.run(crash())
+    assert not os.path.exists("data.json")
+
+    async def check():
+        assert bot.load_data()["members"]["10"]["number"] == 1
+        assert bot.STORE.data["counter"] == 1
+    run(check)
+
+
+def test_event_log_rebuilds_corrupt_store(tenant, run, monkeypatch):
+    monkeypatch.setattr(bot, "STORAGE", "sqlite")
+
+    async def write():
+        for uid in range(10, 15):
+            with bot.STORE.event("approved"):
+                bot.STORE.put_member(uid, member(bot.STORE.next_member_number()))
+    run(write)
+    with open("data.db", "wb") as f:
+        f.write(b"not a database" * 100)
+
+    async def check():
+        assert sorted(bot.load_data()["members"]) == ["10", "11", "12", "13", "14"]
+    run(check)
+    assert os.path.exists("data.db.corrupt")
+
+
+def test_event_log_replays_from_latest_snapshot(workdir):
+    log = bot.EventLog("events.db", snapshot_every=3)
+    log.open()
+    data = bot._empty_data()
+    log.snapshot(data)
+    for uid in range(5):
+        data["members"][str(uid)] = member(uid)
+        log.append("approved", {}, [["members", str(uid), data["members"][str(uid)]]])
+        if log.snapshot_due():
+            log.snapshot(data)
+    log.append("removed", {}, [["members", "0", None]])
+
+    restored, replayed = log.replay()
+    assert replayed == 3   # snapshot אחרי 3 אירועים, ואחריו 3 נוספים
+    assert sorted(restored["members"]) == ["1", "2", "3", "4"]
+    assert restored["event_seq"] == log.last_seq
+
+
+# ── ארכיון נדחים ─────────────────────────────────────────
+
+def test_archive_rolls_segments_and_looks_up(workdir):
+    archive = bot.RejectedArchive("rejected", segment_bytes=200)
+    archive.extend([{"user_id": uid % 3, "rejected_at": str(uid), "pad": "x" * 40} for uid in range(9)])
+    assert len(os.listdir("rejected")) > 2
+    reopened = bot.RejectedArchive("rejected", segment_bytes=200)
+    assert [r["rejected_at"] for r in reopened.lookup(1)] == ["1", "4", "7"]
+
+
+def test_archive_recovers_torn_index_line(workdir):
+    archive = bot.RejectedArchive("rejected", segment_bytes=200)
+    archive.extend([{"user_id": uid, "rejected_at": str(uid), "pad": "x" * 40} for uid in range(5)])
+    index = os.path.join("rejected", "index.tsv")
+    lines = open(index, "rb").read().splitlines(keepends=True)
+    with open(index, "wb") as f:
+        f.write(b"".join(lines[:3]) + lines[3][:5])   # נקטע באמצע שורה
+
+    bot.RejectedArchive("rejected", segment_bytes=200).append({"user_id": 9, "rejected_at": "9"})
+
+    reopened = bot.RejectedArchive("rejected", segment_bytes=200)
+    assert [[r["rejected_at"] for r in reopened.lookup(uid)] for uid in (0, 1, 2, 3, 4, 9)] == \
+        [["0"], ["1"], ["2"], ["3"], ["4"], ["9"]]
+    assert all(line.count("\t") == 3 for line in open(index, encoding="utf-8"))
+
+
+def test_archive_truncates_partial_record(workdir):
+    archive = bot.RejectedArchive("rejected")
+    archive.append({"user_id": 1, "rejected_at": "1"})
+    segment = os.path.join("rejected", archive._segment)
+    with open(segment, "ab") as f:
+        f.write(b'{"user_id": 2, "rej')
+
+    reopened = bot.RejectedArchive("rejected")
+    reopened.append({"user_id": 3, "rejected_at": "3"})
+    assert reopened.lookup(2) == []
+    assert reopened.lookup(3)[0]["rejected_at"] == "3"
+
+
+# ── אינדקסים בזיכרון ──────────────────────────────────────
+
+def test_member_registry_follows_changes():
+    members = {"10": member(7, "חלבי"), "11": member(8, "חלבי")}
+    registry = bot.MemberRegistry()
+    registry.rebuild(members)
+    assert registry.by_number("007") == (10, members["10"])
+    assert sorted(uid for uid, _ in registry.by_lastname("חלבי")) == [10, 11]
+
+    members["10"] = member(9, "עזאם")
+    registry.add(10, members["10"])
+    assert registry.by_number("7") == (None, None)
+    assert registry.by_number("9")[0] == 10
+    assert [uid for uid, _ in registry.by_lastname("חלבי")] == [11]
+
+
+def test_cooldown_index_expires_in_order():
+    cooldowns = {"1": 100.0, "2": 50.0, "3": 300.0}
+    index = bot.CooldownIndex()
+    index.rebuild(cooldowns)
+    cooldowns["1"] = 400.0   # הוארך – הרשומה הישנה בערימה מדולגת
+    index.add(1, 400.0)
+    assert index.expired(now=350) == ["2", "3"]
+    assert index.remaining(1, now=350) == 50.0
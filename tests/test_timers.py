@@ -0,0 +1,111 @@
+import asyncio
+
+from telegram.error import BadRequest, Forbidden, NetworkError
+
+import bot
+from conftest import FakeBot, member
+
+
+def make_service(calls):
+    service = bot.TimerService("test_timers.db")
+
+    @service.action("record")
+    async def record(fake, name):
+        calls.append(name)
+
+    @service.action("slow")
+    async def slow(fake, name):
+        await asyncio.sleep(0.3)
+        calls.append(name)
+
+    @service.action("flaky")
+    async def flaky(fake, name):
+        calls.append(name)
+        if calls.count(name) < 3:
+            raise NetworkError("temporary")
+
+    @service.action("gone")
+    async def gone(fake, name):
+        calls.append(name)
+        raise BadRequest("message to delete not found")
+
+    return service
+
+
+async def settle(service, seconds):
+    await asyncio.sleep(seconds)
+    await service.stop()
+
+
+def test_timers_fire_in_order_without_blocking(tenant, run):
+    calls = []
+    service = make_service(calls)
+
+    async def main():
+        service.schedule("slow", 0, name="slow")
+        service.schedule("record", 0.1, name="b")
+        service.schedule("record", 0.05, name="a")
+        cancelled = service.schedule("record", 0.05, name="cancelled")
+        service.cancel(cancelled)
+        service.start(FakeBot())
+        await settle(service, 0.5)
+    run(main)
+    # הטיימר האיטי לא מעכב את האחרים
+    assert calls == ["a", "b", "slow"]
+
+
+def test_failed_timers_retry_with_backoff(tenant, run, monkeypatch):
+    monkeypatch.setattr(bot, "TIMER_RETRY_BASE", 0.05)
+    calls = []
+    service = make_service(calls)
+
+    async def main():
+        service.schedule("flaky", 0, name="flaky")
+        service.schedule("gone", 0, name="gone")
+        service.start(FakeBot())
+        await asyncio.sleep(0.4)
+        assert service.open().execute("SELECT COUNT(*) FROM timers").fetchone()[0] == 0
+        await service.stop()
+    run(main)
+    # flaky: נכשל פעמיים והצליח בשלישית; gone: BadRequest – בלי ניסיון חוזר
+    assert calls.count("flaky") == 3
+    assert calls.count("gone") == 1
+
+
+def test_timers_survive_restart(tenant, run):
+    calls = []
+
+    async def before():
+        service = make_service(calls)
+        service.open()
+        service.schedule("record", 0.1, name="after-restart")
+        await service.stop()
+    run(before)
+
+    async def after():
+        service = make_service(calls)
+        service.start(FakeBot())
+        await settle(service, 0.3)
+    run(after)
+    assert calls == ["after-restart"]
+
+
+def test_group_welcome_retries_then_drops(tenant, run, monkeypatch):
+    monkeypatch.setattr(bot, "TIMER_ATTEMPTS", 2)
+    fake = FakeBot({-10: [NetworkError("down")], -20: Forbidden("kicked"), -30: NetworkError("down")})
+
+    async def main():
+        for uid in (1, 2, 3):
+            bot.STORE.put_member(uid, member(uid))
+        bot._welcome_joins[tenant.key] = {-10: {1: "אחמד"}, -20: {2: "סאמי"}, -30: {3: "ריאד"}}
+
+        await bot._timer_group_welcome(fake)
+        # -20: הבוט הוסר – ההצטרפות נזרקת; -10 ו--30: נשארות לסבב חוזר
+        assert bot._welcome_joins[tenant.key] == {-10: {1: "אחמד"}, -30: {3: "ריאד"}}
+        assert [args for _, args in bot.TIMERS.find("group_welcome")] == [{"attempt": 1}]
+
+        await bot._timer_group_welcome(fake, attempt=1)
+        # -10 הצליח בניסיון השני; -30 נכשל גם בו ונזרק (TIMER_ATTEMPTS)
+        assert tenant.key not in bot._welcome_joins
+    run(main)
+    assert [chat_id for chat_id, _ in fake.sent] == [-10]